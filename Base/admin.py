@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import PendingInstitution, Certificate
+from .models import PendingInstitution, Certificate, BatchJob, BatchJobRow
 
 admin.site.register(PendingInstitution)
 admin.site.register(Certificate)
+admin.site.register(BatchJob)
+admin.site.register(BatchJobRow)
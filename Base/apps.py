@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_started
 
 
 class BaseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Base'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .batch_jobs import recover_on_first_request
+
+        if settings.BATCH_JOB_RECOVER_ON_START:
+            request_started.connect(recover_on_first_request, dispatch_uid="Base.recover_batch_jobs")
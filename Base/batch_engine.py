@@ -0,0 +1,406 @@
+import asyncio
+import multiprocessing
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import aclosing
+from datetime import datetime
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import render_worker
+from .helper import (
+    build_entry_metadata, build_entry_certificate, save_certificates,
+    cid_from_url, upload_pdf_async, upload_metadata_async, seed_ipfs_cache,
+)
+from .http_client import run_on_own_loop
+from .ipfs_cache import get_cid_cache
+from .ipfs_cid import compute_cid
+from .metrics import observe, stage
+from .pinning import DirectoryMismatch, get_pinning_backend, metadata_json_bytes
+
+_render_executor = None
+_render_executor_lock = threading.Lock()
+
+
+def get_render_executor():
+    # reportlab/qrcode rendering is CPU-bound: a process pool uses every core, threads share one GIL
+    global _render_executor
+    if _render_executor is None:
+        with _render_executor_lock:
+            if _render_executor is None:
+                if settings.BATCH_RENDER_POOL == "process":
+                    # spawn, not fork: batches run on threads and forking a threaded process is unsafe
+                    _render_executor = ProcessPoolExecutor(
+                        max_workers=settings.BATCH_RENDER_WORKERS,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=render_worker.init_worker,
+                    )
+                else:
+                    _render_executor = ThreadPoolExecutor(
+                        max_workers=settings.BATCH_RENDER_WORKERS,
+                        thread_name_prefix="certificate-render",
+                    )
+    return _render_executor
+
+
+def reset_render_executor(executor=None):
+    # Drops the pool (or only ``executor``, if it is still the current one) so the next batch
+    # builds a fresh one - after a worker process died, or when settings changed
+    global _render_executor
+    with _render_executor_lock:
+        if _render_executor is not None and executor in (None, _render_executor):
+            _render_executor.shutdown(wait=False, cancel_futures=True)
+            _render_executor = None
+
+
+async def render_entry_async(entry, institution_name, institution_logo, date_issued):
+    executor = get_render_executor()
+    try:
+        filename, pdf_bytes, elapsed = await asyncio.get_running_loop().run_in_executor(
+            executor, render_worker.render, entry, institution_name, institution_logo, date_issued
+        )
+    except BrokenProcessPool:
+        reset_render_executor(executor)
+        raise
+    if isinstance(executor, ProcessPoolExecutor):
+        # Timed in the worker process, whose own stage histograms are never scraped
+        observe("render", elapsed)
+    return filename, pdf_bytes
+
+
+async def upload_entry_async(entry, institution, date_issued, filename, pdf_bytes):
+    # One result dict per row: row_id, reg_number, status and, on success, cid and pdf_cid
+    start = time.time()
+    try:
+        pdf_ipfs_url = await upload_pdf_async(pdf_bytes, filename)
+
+        metadata = build_entry_metadata(entry, institution, date_issued, pdf_ipfs_url)
+        metadata_ipfs_url = await upload_metadata_async(metadata)
+
+        # The Certificate row is written later, in bulk, by the batch loop
+
+        print(f"⏱️ Uploaded {entry['reg_number']} in {time.time() - start:.2f}s")
+        result = {
+            "row_id": entry.get("row_id"),
+            "reg_number": entry["reg_number"],
+            "cid": cid_from_url(metadata_ipfs_url),
+            "pdf_cid": cid_from_url(pdf_ipfs_url),
+            "status": "success"
+        }
+
+    except Exception as e:
+        return _error_result(entry, e)
+
+    # Cached locally so the batch export reads the rendered bytes back, not a gateway.
+    # The row is pinned either way, so a failure here must not turn it into an error.
+    await _seed_best_effort(seed_ipfs_cache, pdf_bytes, result["pdf_cid"], metadata, result["cid"])
+    return result
+
+
+def _directory_stem(entry):
+    # row_id keeps names unique inside the folder; the reg number makes the listing readable
+    return f"{entry['row_id']}-" + re.sub(r"[^A-Za-z0-9._-]", "_", entry["reg_number"])
+
+
+async def upload_directory_async(items, institution, date_issued):
+    """Pin a chunk of rendered rows - every PDF and metadata JSON - as one directory.
+
+    ``items`` are ``(index, entry, filename, pdf_bytes)``. Each PDF's CID is computed
+    locally first, since its metadata has to name it before anything is uploaded.
+    """
+    backend = get_pinning_backend()
+    files = {}
+    for _, entry, _, pdf_bytes in items:
+        stem = _directory_stem(entry)
+        metadata = build_entry_metadata(entry, institution, date_issued, backend.url(compute_cid(pdf_bytes)))
+        files[f"{stem}.pdf"] = pdf_bytes
+        files[f"{stem}.json"] = metadata_json_bytes(metadata)
+
+    name = f"certificates-{date_issued}-{items[0][1]['row_id']}"
+    try:
+        with stage("pin-directory"):
+            directory_cid, cids = await backend.pin_directory_async(name, files)
+    except DirectoryMismatch as e:
+        print(f"⚠️ {e}; pinning these {len(items)} rows one by one")
+        return await asyncio.gather(*(
+            upload_entry_async(entry, institution, date_issued, filename, pdf_bytes)
+            for _, entry, filename, pdf_bytes in items
+        ))
+    except Exception as e:
+        return [_error_result(entry, e) for _, entry, _, _ in items]
+
+    print(f"⏱️ Pinned {len(items)} rows as directory {directory_cid}")
+    # The directory CID matched, so every file CID is the locally computed one: cache them all
+    await _seed_best_effort(_seed_files, files, cids)
+    return [
+        {
+            "row_id": entry.get("row_id"),
+            "reg_number": entry["reg_number"],
+            "cid": cids[f"{_directory_stem(entry)}.json"],
+            "pdf_cid": cids[f"{_directory_stem(entry)}.pdf"],
+            "directory_cid": directory_cid,
+            "status": "success"
+        }
+        for _, entry, _, _ in items
+    ]
+
+
+async def _seed_best_effort(seed, *args):
+    # Seeding only saves a later gateway fetch: log a failure (a full disk, say) and move on
+    try:
+        await sync_to_async(seed, thread_sensitive=False)(*args)
+    except Exception as e:
+        print(f"❌ Could not seed the IPFS cache: {e}")
+
+
+def _seed_files(files, cids):
+    cache = get_cid_cache()
+    for filename, content in files.items():
+        cache.put(cids[filename], content)
+
+
+def _error_result(entry, error):
+    return {
+        "row_id": entry.get("row_id"),
+        "reg_number": entry.get("reg_number", "N/A"),
+        "status": f"error: {error}"
+    }
+
+
+def _persist_group(group):
+    # Bulk-insert the certificates of every successful row in the group. If the write
+    # fails, those rows are reported as errors instead of a success that was never saved.
+    certificates = [
+        build_entry_certificate(entry, result["cid"], result["pdf_cid"])
+        for _, entry, result in group if result.get("status") == "success"
+    ]
+    if not certificates:
+        return
+    try:
+        save_certificates(certificates)
+    except Exception as e:
+        print(f"❌ Saving {len(certificates)} certificates failed: {e}")
+        for _, _, result in group:
+            if result.get("status") == "success":
+                result["status"] = f"error: could not save certificate: {e}"
+
+
+async def _run_stages(entries, institution, concurrency, finished):
+    """Render and upload stages; every ``(index, entry, result)`` goes to ``finished``, then None.
+
+    Render: at most two jobs per render worker are in flight, and a rendered PDF waits in
+    the bounded ``rendered`` queue, so rendering pauses when uploads fall behind.
+    Upload: ``concurrency`` workers pin the PDF and then its metadata - or, with
+    BATCH_PIN_DIRECTORY_SIZE set, two workers that each pin up to that many rows as one
+    directory (see upload_directory_async).
+    """
+    source = enumerate(entries)
+    pull = sync_to_async(lambda n: list(islice(source, n)))
+    logo_path = institution.logo.path if institution.logo else None
+    date_issued = datetime.now().strftime("%Y-%m-%d")
+    rendered = asyncio.Queue(maxsize=settings.BATCH_RENDER_QUEUE_SIZE)
+    render_slots = asyncio.Semaphore(settings.BATCH_RENDER_WORKERS * 2)
+    renders = set()
+
+    async def render(index, entry):
+        try:
+            try:
+                filename, pdf_bytes = await render_entry_async(entry, institution.name, logo_path, date_issued)
+            except Exception as e:
+                await finished.put((index, entry, _error_result(entry, e)))
+                return
+            # Holding the render slot while the queue is full is what throttles rendering
+            await rendered.put((index, entry, filename, pdf_bytes))
+        finally:
+            render_slots.release()
+
+    async def upload():
+        while (item := await rendered.get()) is not None:
+            index, entry, filename, pdf_bytes = item
+            await finished.put((index, entry, await upload_entry_async(entry, institution, date_issued, filename, pdf_bytes)))
+
+    async def upload_directories():
+        stopped = False
+        while not stopped:
+            items = []
+            while len(items) < directory_size:
+                item = await rendered.get()
+                if item is None:
+                    stopped = True
+                    break
+                items.append(item)
+            if items:
+                results = await upload_directory_async(items, institution, date_issued)
+                for (index, entry, _, _), result in zip(items, results):
+                    await finished.put((index, entry, result))
+
+    directory_size = settings.BATCH_PIN_DIRECTORY_SIZE
+    if directory_size:
+        # Two, so one can fill its chunk while the other is uploading
+        uploaders = [asyncio.ensure_future(upload_directories()) for _ in range(2)]
+    else:
+        uploaders = [asyncio.ensure_future(upload()) for _ in range(concurrency)]
+    try:
+        while chunk := await pull(settings.BATCH_RENDER_WORKERS * 2):
+            for index, entry in chunk:
+                # The row identity travels with the result, so callers join back in O(1)
+                entry.setdefault("row_id", index)
+                if entry.get("_rejected"):
+                    await finished.put((index, entry, _error_result(entry, entry["_rejected"])))
+                    continue
+                await render_slots.acquire()
+                task = asyncio.ensure_future(render(index, entry))
+                renders.add(task)
+                task.add_done_callback(renders.discard)
+
+        await asyncio.gather(*renders)
+        for _ in uploaders:
+            await rendered.put(None)
+        await asyncio.gather(*uploaders)
+        await finished.put(None)
+    except Exception as e:
+        await finished.put(e)
+    finally:
+        for task in [*renders, *uploaders]:
+            task.cancel()
+
+
+async def iter_batch_groups(entries, institution, concurrency=None):
+    """Yield lists of ``(index, entry, result)`` in completion order, each already persisted.
+
+    ``entries`` may be any iterable (a csv.DictReader over the upload, a queryset
+    iterator...). It is pulled lazily, a chunk at a time, through sync_to_async, so
+    neither the input nor the pending work is ever fully materialised.
+
+    Three stages connected by bounded queues (see _run_stages): rendering on the render
+    pool, ``concurrency`` concurrent uploads, and this loop, which buffers finished rows and
+    writes their Certificate rows with bulk_create once BATCH_DB_CHUNK_SIZE rows are
+    waiting or BATCH_DB_FLUSH_SECONDS have passed.
+
+    Entries already flagged by helper.screen_entries are answered without rendering or
+    uploading anything.
+    """
+    concurrency = concurrency or settings.BATCH_CONCURRENCY
+    persist = sync_to_async(_persist_group)
+    finished = asyncio.Queue(maxsize=concurrency)
+    stages = asyncio.ensure_future(_run_stages(entries, institution, concurrency, finished))
+
+    buffered = []
+    flush_at = None
+    done = False
+    try:
+        while buffered or not done:
+            if not done:
+                timeout = None if flush_at is None else max(0, flush_at - time.monotonic())
+                try:
+                    item = await asyncio.wait_for(finished.get(), timeout)
+                except asyncio.TimeoutError:
+                    item = ()
+                if item is None:
+                    done = True
+                elif isinstance(item, Exception):
+                    raise item
+                elif item:
+                    buffered.append(item)
+
+            if buffered and flush_at is None:
+                flush_at = time.monotonic() + settings.BATCH_DB_FLUSH_SECONDS
+
+            if buffered and (
+                len(buffered) >= settings.BATCH_DB_CHUNK_SIZE
+                or time.monotonic() >= flush_at
+                or done
+            ):
+                group, buffered, flush_at = buffered, [], None
+                await persist(group)
+                yield group
+    finally:
+        # Consumer stopped early (e.g. the streaming client disconnected)
+        stages.cancel()
+
+
+async def iter_batch_async(entries, institution, concurrency=None):
+    """Yield ``(index, entry, result)`` one row at a time; see iter_batch_groups."""
+    async with aclosing(iter_batch_groups(entries, institution, concurrency)) as groups:
+        async for group in groups:
+            for item in group:
+                yield item
+
+
+async def run_batch_async(student_data, institution, concurrency=None, on_results=None, collect=True):
+    """Process every row; returns the results in input order (or None when ``collect`` is False).
+
+    ``on_results(items)`` is awaited with each persisted group of ``(entry, result)`` pairs,
+    in completion order.
+    """
+    results = {}
+    async with aclosing(iter_batch_groups(student_data, institution, concurrency)) as groups:
+        async for group in groups:
+            if on_results is not None:
+                await on_results([(entry, result) for _, entry, result in group])
+            if collect:
+                for index, _, result in group:
+                    results[index] = result
+    if collect:
+        return [results[i] for i in range(len(results))]
+
+
+def run_batch(student_data, institution, concurrency=None, on_results=None, collect=True):
+    # Entry point for sync code: runs the batch on its own event loop
+    return run_on_own_loop(run_batch_async, student_data, institution, concurrency, on_results, collect)
+
+
+def stream_batch(entries, institution, concurrency=None):
+    """Sync generator of ``(index, entry, result)`` in completion order, for StreamingHttpResponse.
+
+    The batch runs on a background thread; a bounded queue gives backpressure so a
+    slow client never lets finished results pile up in memory.
+    """
+    concurrency = concurrency or settings.BATCH_CONCURRENCY
+    results = queue.Queue(maxsize=concurrency)
+    cancelled = threading.Event()
+    finished = object()
+
+    def put(item):
+        # Gives up once the client has gone away, so the worker thread can exit
+        while not cancelled.is_set():
+            try:
+                results.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        async with aclosing(iter_batch_async(entries, institution, concurrency)) as rows:
+            async for item in rows:
+                if not await loop.run_in_executor(None, put, item):
+                    break
+
+    def worker():
+        try:
+            run_on_own_loop(run)
+        except Exception as e:
+            put(e)
+        finally:
+            close_old_connections()
+            put(finished)
+
+    threading.Thread(target=worker, name="batch-stream", daemon=True).start()
+    try:
+        while True:
+            item = results.get()
+            if item is finished:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
@@ -0,0 +1,262 @@
+import threading
+from datetime import timedelta
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import BatchJob, BatchJobRow, Certificate
+from .batch_engine import run_batch
+from .helper import screen_entries
+
+CSV_FIELDS = ["student_name", "student_surname", "reg_number", "course", "degree_class"]
+
+_job_executor = None
+_job_executor_lock = threading.Lock()
+_recovered = False
+
+
+def _job_row(job, row_index, entry):
+    rejected = entry.get("_rejected")
+    return BatchJobRow(
+        job=job,
+        row_index=row_index,
+        status=BatchJobRow.ERROR if rejected else BatchJobRow.PENDING,
+        error=rejected or "",
+        **{f: (entry.get(f) or "") for f in CSV_FIELDS},
+    )
+
+
+def create_batch_job(institution, student_data, chunk_size=500):
+    # student_data can be a lazy reader: rows are inserted a chunk at a time, never all held at once.
+    # Duplicate/already-issued reg numbers are rejected here, so the workers never see them.
+    with transaction.atomic():
+        job = BatchJob.objects.create(institution=institution)
+        total = rejected = 0
+        rows = screen_entries(student_data, chunk_size)
+        while True:
+            chunk = [_job_row(job, total + i, entry) for i, entry in enumerate(islice(rows, chunk_size))]
+            if not chunk:
+                break
+            BatchJobRow.objects.bulk_create(chunk)
+            total += len(chunk)
+            rejected += sum(1 for row in chunk if row.status == BatchJobRow.ERROR)
+        job.total_rows = total
+        job.failed_rows = rejected
+        job.save(update_fields=["total_rows", "failed_rows"])
+    return job
+
+
+def record_row_results(job_id, results):
+    # One transaction per persisted group rather than per row
+    rows = []
+    done = failed = 0
+    for result in results:
+        ok = result.get("status") == "success"
+        done += ok
+        failed += not ok
+        rows.append(BatchJobRow(
+            id=result["row_id"],
+            status=BatchJobRow.SUCCESS if ok else BatchJobRow.ERROR,
+            cid=result.get("cid", ""),
+            pdf_cid=result.get("pdf_cid", ""),
+            directory_cid=result.get("directory_cid", ""),
+            error="" if ok else result.get("status", "").removeprefix("error: "),
+        ))
+    with transaction.atomic():
+        BatchJobRow.objects.bulk_update(rows, ["status", "cid", "pdf_cid", "directory_cid", "error"], batch_size=500)
+        BatchJob.objects.filter(id=job_id).update(
+            done_rows=F("done_rows") + done, failed_rows=F("failed_rows") + failed,
+            heartbeat_at=timezone.now(),
+        )
+
+
+def _pending_entries(job, page_size=500):
+    # Keyset pages instead of one open cursor: rows are updated while we iterate (SQLite has
+    # no isolation between a live cursor and writes on the same connection)
+    last_id = 0
+    while True:
+        page = list(job.rows.filter(status=BatchJobRow.PENDING, id__gt=last_id).order_by("id")[:page_size])
+        if not page:
+            return
+        for row in page:
+            yield row.as_entry()
+        last_id = page[-1].id
+
+
+def _beat(job_id, stop, interval):
+    # Own thread: a job whose rows are all stuck in slow retries records no results for a
+    # while, but is still alive and must not look orphaned to requeue_stale_jobs
+    try:
+        while not stop.wait(interval):
+            try:
+                BatchJob.objects.filter(id=job_id, status=BatchJob.RUNNING).update(heartbeat_at=timezone.now())
+            except Exception as e:
+                print(f"⚠️ Heartbeat of batch job {job_id} failed: {e}")
+    finally:
+        connection.close()
+
+
+def run_batch_job(job_id):
+    # Claiming with a conditional UPDATE means only one worker ever runs a given job
+    try:
+        now = timezone.now()
+        claimed = BatchJob.objects.filter(id=job_id, status=BatchJob.PENDING).update(
+            status=BatchJob.RUNNING, started_at=now, heartbeat_at=now
+        )
+        if not claimed:
+            return
+
+        job = BatchJob.objects.select_related("institution").get(id=job_id)
+        entries = _pending_entries(job)
+
+        async def on_results(items):
+            await sync_to_async(record_row_results)(job_id, [result for _, result in items])
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=_beat, args=(job_id, stop, settings.BATCH_JOB_HEARTBEAT_SECONDS),
+            name=f"batch-job-{job_id}-heartbeat", daemon=True,
+        )
+        heartbeat.start()
+        try:
+            run_batch(entries, job.institution, on_results=on_results, collect=False)
+            BatchJob.objects.filter(id=job_id).update(status=BatchJob.DONE, finished_at=timezone.now())
+        except Exception as e:
+            print(f"❌ Batch job {job_id} failed: {e}")
+            BatchJob.objects.filter(id=job_id).update(
+                status=BatchJob.FAILED, error=str(e), finished_at=timezone.now()
+            )
+        finally:
+            stop.set()
+            heartbeat.join()
+    finally:
+        close_old_connections()
+
+
+def get_job_executor():
+    global _job_executor
+    if _job_executor is None:
+        with _job_executor_lock:
+            if _job_executor is None:
+                _job_executor = ThreadPoolExecutor(
+                    max_workers=settings.BATCH_JOB_WORKERS,
+                    thread_name_prefix="batch-job",
+                )
+    return _job_executor
+
+
+def _stale_running(cutoff):
+    # Jobs claimed before heartbeat_at existed only have started_at to go on
+    return BatchJob.objects.filter(status=BatchJob.RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+
+
+def _reconcile_saved_rows(job_id, page_size=500):
+    # A crash between saving a group's certificates and recording its rows leaves rows pending
+    # whose certificate exists. create_batch_job rejected reg numbers that already had one, so
+    # such a certificate is this job's: record it instead of issuing the row a second time.
+    saved = []
+    last_id = 0
+    while True:
+        page = list(
+            BatchJobRow.objects.filter(job_id=job_id, status=BatchJobRow.PENDING, id__gt=last_id)
+            .order_by("id")[:page_size]
+        )
+        if not page:
+            break
+        certificates = {
+            c.student_regNumber: c
+            for c in Certificate.objects.filter(student_regNumber__in=[row.reg_number for row in page])
+        }
+        for row in page:
+            certificate = certificates.get(row.reg_number)
+            if certificate is not None:
+                saved.append({
+                    "row_id": row.id, "status": "success",
+                    "cid": certificate.metadata_cid, "pdf_cid": certificate.pdf_cid,
+                })
+        last_id = page[-1].id
+    if saved:
+        record_row_results(job_id, saved)
+
+
+def requeue_stale_jobs(stale_after=None):
+    """Reset RUNNING jobs whose process died to PENDING; returns their ids.
+
+    A job counts as orphaned once its heartbeat (bumped every BATCH_JOB_HEARTBEAT_SECONDS
+    while run_batch_job is alive, and with every recorded group of rows) is older than
+    ``stale_after`` seconds (default settings.BATCH_JOB_STALE_SECONDS). Its finished rows
+    keep their results, so the requeued run only processes what is left.
+    """
+    if stale_after is None:
+        stale_after = settings.BATCH_JOB_STALE_SECONDS
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    requeued = []
+    for job_id in _stale_running(cutoff).values_list("id", flat=True):
+        with transaction.atomic():
+            # Conditional, like the claim: a job that just recorded progress is left alone
+            if not _stale_running(cutoff).filter(id=job_id).update(status=BatchJob.PENDING):
+                continue
+            _reconcile_saved_rows(job_id)
+        print(f"♻️ Requeued orphaned batch job {job_id}")
+        requeued.append(job_id)
+    return requeued
+
+
+def recover_batch_jobs(stale_after=None):
+    # Requeue orphaned jobs, then submit every pending one; returns {job_id: future}
+    requeue_stale_jobs(stale_after)
+    executor = get_job_executor()
+    return {
+        job_id: executor.submit(run_batch_job, job_id)
+        for job_id in BatchJob.objects.filter(status=BatchJob.PENDING).values_list("id", flat=True)
+    }
+
+
+def recover_on_first_request(**kwargs):
+    # request_started receiver (see BaseConfig.ready): the first request a process serves picks
+    # up the jobs a previous process left behind. Not done in ready() itself, which also runs
+    # for migrate/test before the database is usable.
+    global _recovered
+    if _recovered:
+        return
+    with _job_executor_lock:
+        if _recovered:
+            return
+        _recovered = True
+    try:
+        recover_batch_jobs()
+    except Exception as e:
+        print(f"❌ Batch job recovery failed: {e}")
+
+
+def enqueue_batch_job(job):
+    # Only start once the job and its rows are committed, or the worker will not see them
+    transaction.on_commit(lambda: get_job_executor().submit(run_batch_job, job.id))
+
+
+def job_progress(job):
+    processed = job.done_rows + job.failed_rows
+    rows_per_sec = 0.0
+    if job.started_at and processed:
+        elapsed = ((job.finished_at or timezone.now()) - job.started_at).total_seconds()
+        rows_per_sec = round(processed / elapsed, 2) if elapsed > 0 else 0.0
+
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "total": job.total_rows,
+        "done": job.done_rows,
+        "failed": job.failed_rows,
+        "remaining": job.total_rows - processed,
+        "rows_per_sec": rows_per_sec,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
@@ -0,0 +1,221 @@
+import hashlib
+import io
+import re
+import zipfile
+from PyPDF2 import PdfReader
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+from .helper import finalized_pdf_path
+from .metrics import stage
+
+PDF_HEADER = b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n"
+# The first two object numbers of a merged PDF; both are written last, once every page is known
+CATALOG, PAGES = 1, 2
+
+
+class _Sink:
+    """Write-only buffer that zipfile writes into and the response drains after each file.
+
+    It has no ``seek``, so zipfile treats it as a pipe: local headers are written before the
+    data and sizes/CRCs go in data descriptors, never patched in afterwards.
+    """
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        self.position = 0
+
+    def write(self, data):
+        self.position += len(data)
+        return self.buffer.write(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = self.buffer.getvalue()
+        self.buffer = io.BytesIO()
+        return data
+
+
+def zip_chunks(files):
+    """Stream ``(name, bytes)`` pairs as a ZIP archive, one file in memory at a time.
+
+    Stored, not deflated: the certificates are already compressed PDFs, so deflate would
+    only spend CPU for a few percent.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+        for name, content in files:
+            archive.writestr(name, content)
+            yield sink.take()
+    # Closing the archive wrote the central directory
+    yield sink.take()
+
+
+class PdfConcatenator:
+    """Merges PDFs into one, page by page, writing each input's objects as soon as it is read.
+
+    Only the xref offsets and a digest per written object are kept between inputs. Objects are
+    written children first, so two identical subtrees serialize to identical bytes; those are
+    written once and shared - the institution logo and fonts appear once, not once per page.
+    """
+
+    def __init__(self):
+        self.offsets = [None, None, None]  # object number -> byte offset; 0 is the free entry
+        self.kids = []
+        self.written = {}  # sha256 of an object's body -> its object number
+        self.position = 0
+        self.numbers = {}
+        self.in_progress = {}
+
+    def _emit(self, data):
+        self.position += len(data)
+        return data
+
+    def _reserve(self):
+        self.offsets.append(None)
+        return len(self.offsets) - 1
+
+    def _object(self, number, body, out):
+        self.offsets[number] = self.position
+        out.append(self._emit(b"%d 0 obj\n" % number + body + b"\nendobj\n"))
+
+    def header(self):
+        return self._emit(PDF_HEADER)
+
+    def add(self, pdf_bytes):
+        """Append every page of ``pdf_bytes``; returns the bytes to write out."""
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        if reader.is_encrypted:
+            raise ValueError("Encrypted PDFs cannot be merged")
+
+        # Object numbers are per input: (idnum, generation) -> number in the merged file
+        self.numbers = {}
+        self.in_progress = {}
+        out = []
+        # reader.pages copies inherited /Resources, /MediaBox... onto each page, so a page no
+        # longer needs its old /Parent chain
+        pages = list(reader.pages)
+        page_numbers = []
+        for page in pages:
+            number = self._reserve()
+            if page.indirect_reference is not None:
+                ref = page.indirect_reference
+                self.numbers[(ref.idnum, ref.generation)] = number
+            page_numbers.append(number)
+
+        for page, number in zip(pages, page_numbers):
+            body = io.BytesIO()
+            body.write(b"<<")
+            for key, value in page.items():
+                if key == "/Parent":
+                    continue
+                body.write(b" ")
+                key.write_to_stream(body, None)
+                body.write(b" ")
+                self._write(value, body, out)
+            body.write(b" /Parent %d 0 R >>" % PAGES)
+            self._object(number, body.getvalue(), out)
+            self.kids.append(number)
+        return b"".join(out)
+
+    def _ref(self, indirect, out):
+        key = (indirect.idnum, indirect.generation)
+        if key in self.numbers:
+            return self.numbers[key]
+        if key in self.in_progress:
+            # A reference cycle: the object gets its number now and is not shared
+            if self.in_progress[key] is None:
+                self.in_progress[key] = self._reserve()
+            return self.in_progress[key]
+
+        self.in_progress[key] = None
+        body = io.BytesIO()
+        self._write(indirect.get_object(), body, out)
+        body = body.getvalue()
+        number = self.in_progress.pop(key)
+        if number is None:
+            digest = hashlib.sha256(body).digest()
+            number = self.written.get(digest)
+            if number is None:
+                number = self.written[digest] = self._reserve()
+                self._object(number, body, out)
+        else:
+            self._object(number, body, out)
+        self.numbers[key] = number
+        return number
+
+    def _write(self, obj, body, out):
+        # Like obj.write_to_stream, except references are renumbered (and their objects written)
+        if isinstance(obj, IndirectObject):
+            body.write(b"%d 0 R" % self._ref(obj, out))
+        elif isinstance(obj, DictionaryObject):
+            body.write(b"<<")
+            for key, value in obj.items():
+                if isinstance(obj, StreamObject) and key == "/Length":
+                    continue
+                body.write(b" ")
+                key.write_to_stream(body, None)
+                body.write(b" ")
+                self._write(value, body, out)
+            if isinstance(obj, StreamObject):
+                body.write(b" /Length %d >>\nstream\n" % len(obj._data))
+                body.write(obj._data)
+                body.write(b"\nendstream")
+            else:
+                body.write(b" >>")
+        elif isinstance(obj, ArrayObject):
+            body.write(b"[")
+            for item in obj:
+                body.write(b" ")
+                self._write(item, body, out)
+            body.write(b" ]")
+        else:
+            obj.write_to_stream(body, None)
+
+    def finish(self):
+        """The page tree, catalog, xref table and trailer."""
+        out = []
+        kids = b" ".join(b"%d 0 R" % number for number in self.kids)
+        self._object(PAGES, b"<< /Type /Pages /Kids [ %s ] /Count %d >>" % (kids, len(self.kids)), out)
+        self._object(CATALOG, b"<< /Type /Catalog /Pages %d 0 R >>" % PAGES, out)
+
+        xref_offset = self.position
+        lines = [b"xref\n0 %d\n" % len(self.offsets), b"0000000000 65535 f\r\n"]
+        lines += [b"%010d 00000 n\r\n" % offset for offset in self.offsets[1:]]
+        lines.append(b"trailer\n<< /Size %d /Root %d 0 R >>\n" % (len(self.offsets), CATALOG))
+        lines.append(b"startxref\n%d\n%%%%EOF\n" % xref_offset)
+        out.append(self._emit(b"".join(lines)))
+        return b"".join(out)
+
+
+def merged_pdf_chunks(pdfs):
+    """Stream the pages of every PDF in ``pdfs`` (an iterable of bytes) as one PDF."""
+    merger = PdfConcatenator()
+    yield merger.header()
+    for pdf_bytes in pdfs:
+        with stage("export-merge"):
+            chunk = merger.add(pdf_bytes)
+        yield chunk
+    yield merger.finish()
+
+
+def batch_certificates(rows):
+    """``(filename, finalized PDF bytes)`` for each successful BatchJobRow in ``rows``.
+
+    The PDFs come from the finalized cache, built from the cached rendered bytes (the batch
+    seeded them when it pinned each row), so an export does not go back to the gateways.
+    A row that cannot be built is left out of the export rather than failing it halfway.
+    """
+    for row in rows:
+        try:
+            with open(finalized_pdf_path(row.cid), "rb") as f:
+                content = f.read()
+        except Exception as e:
+            print(f"❌ Export skipped row {row.row_index} ({row.reg_number}): {e}")
+            continue
+        reg_number = re.sub(r"[^A-Za-z0-9._-]", "_", row.reg_number)
+        yield f"{row.row_index + 1:05d}_{reg_number}.pdf", content
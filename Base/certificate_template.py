@@ -0,0 +1,141 @@
+import io, os, zlib
+import threading
+from collections import OrderedDict
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.colors import black, blue
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import NameObject, DictionaryObject, EncodedStreamObject
+from .logo_cache import get_logo
+
+# Bump this whenever draw_static_layer changes so cached templates get rebuilt
+LAYOUT_VERSION = 1
+TEMPLATE_CACHE_SIZE = 32
+TEMPLATE_XOBJECT = "/CertTpl"
+
+_templates = OrderedDict()
+_templates_lock = threading.Lock()
+
+
+def draw_static_layer(pdf, institution_name, institution_logo):
+    # Everything here is identical for every certificate of one institution
+    width, height = letter
+
+    pdf.setStrokeColor(black)
+    pdf.setLineWidth(4)
+    pdf.rect(30, 30, width - 60, height - 60)
+
+    pdf.setFont("Helvetica-Bold", 28)
+    pdf.setFillColor(blue)
+    pdf.drawCentredString(width / 2, height - 120, "Certificate of Achievement")
+
+    pdf.setFont("Helvetica", 16)
+    pdf.setFillColor(black)
+    pdf.drawCentredString(width / 2, height - 160, "This certificate is proudly presented to:")
+
+    pdf.setFont("Helvetica-Oblique", 16)
+    pdf.drawCentredString(width / 2, height - 310, f"Issued by: {institution_name}")
+
+    # 🖋 Signature
+    pdf.setFont("Helvetica", 12)
+    pdf.setLineWidth(1)
+    pdf.line(100, 100, 300, 100)
+    pdf.drawString(150, 80, "Authorized Signature")
+
+    if institution_logo:
+        try:
+            pdf.drawImage(get_logo(institution_logo), 50, height - 150, width=100, height=100, mask='auto')
+        except Exception as e:
+            print("Logo load error:", e)
+
+
+class CertificateTemplate:
+    """Static certificate layer rendered once and stamped under each certificate as a form XObject."""
+
+    def __init__(self, institution_name, institution_logo):
+        buffer = io.BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=letter)
+        draw_static_layer(pdf, institution_name, institution_logo)
+        pdf.save()
+
+        page = PdfReader(io.BytesIO(buffer.getvalue())).pages[0]
+        self._bbox = page.mediabox
+        self._resources = page["/Resources"].get_object()
+        self._content = zlib.compress(page.get_contents().get_data())
+        # clone() resolves objects lazily through the reader, which is not thread-safe
+        self._lock = threading.Lock()
+        self._resources.clone(PdfWriter())
+
+    def _add_form(self, writer):
+        with self._lock:
+            resources = self._resources.clone(writer)
+        form = EncodedStreamObject()
+        form._data = self._content
+        form.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Form"),
+            NameObject("/BBox"): self._bbox,
+            NameObject("/Resources"): resources,
+            NameObject("/Filter"): NameObject("/FlateDecode"),
+        })
+        return writer._add_object(form)
+
+    def stamp(self, dynamic_pdf):
+        """Return the PDF bytes of ``dynamic_pdf`` (a one-page PDF) drawn on top of the template."""
+        writer = PdfWriter()
+        form_ref = self._add_form(writer)
+        page = writer.add_page(PdfReader(io.BytesIO(dynamic_pdf)).pages[0])
+
+        resources = page["/Resources"].get_object()
+        xobjects = resources.get("/XObject")
+        if xobjects is None:
+            xobjects = DictionaryObject()
+            resources[NameObject("/XObject")] = xobjects
+        xobjects.get_object()[NameObject(TEMPLATE_XOBJECT)] = form_ref
+
+        contents = EncodedStreamObject()
+        contents._data = zlib.compress(
+            f"q {TEMPLATE_XOBJECT} Do Q\n".encode() + page.get_contents().get_data()
+        )
+        contents[NameObject("/Filter")] = NameObject("/FlateDecode")
+        page[NameObject("/Contents")] = writer._add_object(contents)
+
+        writer.add_metadata({"/Title": "Certificate of Achievement"})
+        output = io.BytesIO()
+        writer.write(output)
+        return output.getvalue()
+
+
+def _template_key(institution_name, institution_logo):
+    logo_version = None
+    if institution_logo:
+        try:
+            st = os.stat(institution_logo)
+            logo_version = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            pass
+    return (LAYOUT_VERSION, institution_name, institution_logo, logo_version)
+
+
+def get_certificate_template(institution_name, institution_logo):
+    # Rebuilt automatically when the logo file (path/mtime/size) or the layout version changes
+    key = _template_key(institution_name, institution_logo)
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is not None:
+            _templates.move_to_end(key)
+            return template
+
+    template = CertificateTemplate(institution_name, institution_logo)
+
+    with _templates_lock:
+        _templates[key] = template
+        _templates.move_to_end(key)
+        while len(_templates) > TEMPLATE_CACHE_SIZE:
+            _templates.popitem(last=False)
+    return template
+
+
+def clear_certificate_templates():
+    with _templates_lock:
+        _templates.clear()
@@ -0,0 +1,97 @@
+import os
+import re
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+def file_etag(path):
+    # Cache files are replaced atomically and never modified, so name+mtime+size identify
+    # the exact bytes: a strong validator without hashing the file on every request
+    st = os.stat(path)
+    return f'"{os.path.basename(path)}-{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def etag_matches(header, etag):
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [tag.strip() for tag in header.split(",")]
+
+
+def parse_range(header, size):
+    """Return ``(start, end)`` inclusive for a single ``bytes=`` range, or None to send it all.
+
+    Raises ValueError when the range cannot be satisfied. Multi-range requests are
+    answered with the full body, which RFC 9110 allows.
+    """
+    match = RANGE_PATTERN.match((header or "").strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size or (last and int(last) < start):
+            raise ValueError("Range not satisfiable")
+    else:
+        # bytes=-N: the last N bytes; an empty file has none to give
+        if int(last) == 0 or size == 0:
+            raise ValueError("Range not satisfiable")
+        start, end = max(size - int(last), 0), size - 1
+    return start, end
+
+
+def _read_range(f, start, length):
+    try:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def serve_file(request, path, filename, content_type="application/pdf", as_attachment=True):
+    """Stream ``path`` with a strong ETag; GET/HEAD also get If-None-Match and Range handling."""
+    etag = file_etag(path)
+    conditional = request.method in ("GET", "HEAD")
+
+    if conditional and etag_matches(request.headers.get("If-None-Match"), etag):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+
+    size = os.path.getsize(path)
+    byte_range = None
+    if conditional and "Range" in request.headers:
+        # If-Range: only honour the range if the client still holds this exact version
+        if_range = request.headers.get("If-Range")
+        if not if_range or if_range.strip() == etag:
+            try:
+                byte_range = parse_range(request.headers["Range"], size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{size}"
+                return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, "rb"), as_attachment=as_attachment, filename=filename,
+                                content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read_range(open(path, "rb"), start, end - start + 1),
+            status=206, content_type=content_type,
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+        response["Content-Disposition"] = content_disposition_header(as_attachment, filename)
+
+    response["ETag"] = etag
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+from urllib.parse import urlparse
+from django.conf import settings
+
+from .http_client import get_async_http_client, run_on_own_loop
+
+HEALTH_ALPHA = 0.3
+# A gateway failing every request ranks like one that is 5x slower
+ERROR_PENALTY = 4.0
+INITIAL_LATENCY = 1.0
+
+
+def gateway_name(template):
+    # "https://{cid}.ipfs.dweb.link" -> "dweb.link", same labels as the latency stats
+    return urlparse(template).netloc.replace("{cid}.ipfs.", "")
+
+
+class GatewayHealth:
+    """Rolling (EWMA) latency and error rate of one gateway; lower score is better."""
+
+    def __init__(self):
+        self.latency = INITIAL_LATENCY
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.wins = 0
+
+    def record(self, elapsed, failed=False, won=False, lost=False):
+        if lost:
+            # Cancelled after losing a race: elapsed is only a lower bound on its latency
+            elapsed = max(elapsed, self.latency)
+        self.requests += 1
+        self.failures += failed
+        self.wins += won
+        self.latency += HEALTH_ALPHA * (elapsed - self.latency)
+        self.error_rate += HEALTH_ALPHA * (float(failed) - self.error_rate)
+
+    @property
+    def score(self):
+        return self.latency * (1 + ERROR_PENALTY * self.error_rate)
+
+    def as_dict(self):
+        return {
+            "score": round(self.score, 4),
+            "latency_ms": round(self.latency * 1000, 2),
+            "error_rate": round(self.error_rate, 4),
+            "requests": self.requests,
+            "failures": self.failures,
+            "wins": self.wins,
+        }
+
+
+class GatewayFetcher:
+    """Fetch a CID from several IPFS gateways with hedged requests.
+
+    The ``hedge`` best-scoring gateways are raced at once. Another one joins whenever a
+    racer fails or ``hedge_delay`` passes with no answer. The first response that passes
+    ``validate`` wins and the rest are cancelled. Every attempt updates that gateway's
+    health, so a slow or failing gateway drops down the order for later fetches.
+    """
+
+    def __init__(self, gateways, hedge=2, hedge_delay=1.0, timeout=15):
+        self.gateways = list(gateways)
+        self.hedge = max(1, hedge)
+        self.hedge_delay = hedge_delay
+        self.timeout = timeout
+        self.health = {template: GatewayHealth() for template in self.gateways}
+        self._lock = threading.Lock()
+
+    def ranked(self):
+        # sorted() is stable, so untried gateways keep their configured order
+        with self._lock:
+            return sorted(self.gateways, key=lambda template: self.health[template].score)
+
+    def _record(self, template, elapsed, **outcome):
+        with self._lock:
+            self.health[template].record(elapsed, **outcome)
+
+    async def _attempt(self, template, cid, validate):
+        url = template.format(cid=cid)
+        start = time.perf_counter()
+        try:
+            response = await get_async_http_client().get(
+                url, endpoint=f"gateway:{gateway_name(template)}", retries=0,
+                timeout=(settings.HTTP_CONNECT_TIMEOUT, self.timeout),
+            )
+            response.raise_for_status()
+            if validate is not None:
+                validate(response.content)
+        except asyncio.CancelledError:
+            self._record(template, time.perf_counter() - start, lost=True)
+            raise
+        except Exception:
+            self._record(template, time.perf_counter() - start, failed=True)
+            raise
+        self._record(template, time.perf_counter() - start, won=True)
+        return response.content
+
+    async def fetch(self, cid, validate=None):
+        remaining = iter(self.ranked())
+        running = {}
+
+        def launch():
+            template = next(remaining, None)
+            if template is not None:
+                print(f"⏳ Trying gateway: {template.format(cid=cid)}")
+                running[asyncio.ensure_future(self._attempt(template, cid, validate))] = template
+
+        for _ in range(self.hedge):
+            launch()
+        try:
+            while running:
+                done, _ = await asyncio.wait(running, timeout=self.hedge_delay,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Nobody has answered yet: hedge with the next gateway
+                    launch()
+                    continue
+                for task in done:
+                    template = running.pop(task)
+                    try:
+                        content = task.result()
+                    except Exception as e:
+                        print(f"❌ Gateway {template.format(cid=cid)} failed: {e}")
+                        launch()
+                        continue
+                    print(f"✅ Fetched {cid} from: {template.format(cid=cid)}")
+                    return content
+            raise Exception(f"All IPFS gateways failed to retrieve {cid}.")
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+    def health_stats(self):
+        with self._lock:
+            return {gateway_name(t): self.health[t].as_dict() for t in self.gateways}
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_gateway_fetcher():
+    global _fetcher
+    if _fetcher is None:
+        with _fetcher_lock:
+            if _fetcher is None:
+                _fetcher = GatewayFetcher(
+                    settings.IPFS_GATEWAYS,
+                    hedge=settings.IPFS_GATEWAY_HEDGE,
+                    hedge_delay=settings.IPFS_GATEWAY_HEDGE_DELAY,
+                    timeout=settings.IPFS_GATEWAY_TIMEOUT,
+                )
+    return _fetcher
+
+
+def fetch_from_gateways(cid, validate=None):
+    # Entry point for sync code; async callers can await get_gateway_fetcher().fetch() directly
+    return run_on_own_loop(get_gateway_fetcher().fetch, cid, validate)
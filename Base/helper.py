@@ -1,53 +1,47 @@
-import io, os, qrcode, requests
-import time
+import io
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.colors import black, blue
-from reportlab.lib.utils import ImageReader
-import os
-import tempfile
-from PyPDF2 import PdfReader, PdfWriter, PageObject
 from .models import Certificate
-from datetime import datetime
+from .certificate_template import get_certificate_template
+from .qr_render import draw_qr, qr_content_stream, DUMMY_QR_DATA
+from .pdf_overlay import overlay_first_page
+from .ipfs_cid import compute_cid
+from .metrics import stage
+from .ipfs_cache import get_cid_cache, get_finalized_cache
+from .pinning import get_pinning_backend, metadata_json_bytes
+from itertools import islice
 import json
-PINATA_JWT = os.getenv("PINATA_JWT")
-
-def upload_to_pinata(file_path):
-    url = "https://api.pinata.cloud/pinning/pinFileToIPFS"
-    headers = {
-        "Authorization": f"{PINATA_JWT}",
-    }
-    with open(file_path, "rb") as f:
-        files = {'file': (os.path.basename(file_path), f)}
-        response = requests.post(url, headers=headers, files=files)
-
-    if response.status_code == 200:
-        return f"https://gateway.pinata.cloud/ipfs/{response.json()['IpfsHash']}"
-    else:
-        raise Exception(f"Pinata upload failed: {response.text}")
-
-def generate_certificate_pdf_local(pdf_path, student_name, course_name, degree_class,
+from json import JSONDecodeError
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from asgiref.sync import sync_to_async
+def upload_pdf(pdf_buffer, filename="certificate.pdf"):
+    # Pinned through the configured backend (settings.PINNING_BACKEND); returns its public URL
+    with stage("pin-file"):
+        return get_pinning_backend().pin_file(pdf_buffer, filename)
+
+async def upload_pdf_async(pdf_buffer, filename="certificate.pdf"):
+    with stage("pin-file"):
+        return await get_pinning_backend().pin_file_async(pdf_buffer, filename)
+
+# (x, y, size) of the certificate QR; the real one is later stamped exactly over the dummy
+QR_BOX = (letter[0] - 180, 50, 100)
+
+@stage("render")
+def generate_certificate_pdf_local(student_name, course_name, degree_class,
                                    institution_name, institution_logo, verification_url,
                                    date_issued, qr_mode="real"):
-    os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+    # Returns the finished certificate as an in-memory BytesIO
+    # Border, headings, signature block and logo come from the cached per-institution template
+    template = get_certificate_template(institution_name, institution_logo)
 
     buffer = io.BytesIO()
     pdf = canvas.Canvas(buffer, pagesize=letter)
     width, height = letter
 
-    pdf.setTitle("Certificate of Achievement")
-    pdf.setStrokeColor(black)
-    pdf.setLineWidth(4)
-    pdf.rect(30, 30, width - 60, height - 60)
-
-    pdf.setFont("Helvetica-Bold", 28)
-    pdf.setFillColor(blue)
-    pdf.drawCentredString(width / 2, height - 120, "Certificate of Achievement")
-
-    pdf.setFont("Helvetica", 16)
-    pdf.setFillColor(black)
-    pdf.drawCentredString(width / 2, height - 160, "This certificate is proudly presented to:")
-
     pdf.setFont("Helvetica-Bold", 22)
     pdf.drawCentredString(width / 2, height - 200, student_name)
 
@@ -57,202 +51,272 @@ def generate_certificate_pdf_local(pdf_path, student_name, course_name, degree_c
     pdf.setFont("Helvetica-Bold", 18)
     pdf.setFillColor(blue)
     pdf.drawCentredString(width / 2, height - 270, f"Degree Classification: {degree_class}")
-
-    pdf.setFont("Helvetica-Oblique", 16)
     pdf.setFillColor(black)
-    pdf.drawCentredString(width / 2, height - 310, f"Issued by: {institution_name}")
 
     # 🔲 QR Code Area
     if qr_mode == "real" and verification_url:
         cid = verification_url.split("/")[-1]
         pdf.setFont("Courier", 12)
         pdf.drawCentredString(width / 2, height - 340, f"ipfs-CID: {cid}")
-        qr = qrcode.make(verification_url)
-        qr_path = "temp_qr.png"
-        qr.save(qr_path)
-        pdf.drawInlineImage(qr_path, width - 180, 50, width=100, height=100)
-        os.remove(qr_path)
+        draw_qr(pdf, verification_url, *QR_BOX)
     elif qr_mode == "dummy":
-        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
-            qrcode.make("DUMMY").save(tmp.name)
-            pdf.drawInlineImage(tmp.name, width - 180, 50, width=100, height=100)
-        os.remove(tmp.name)
+        draw_qr(pdf, DUMMY_QR_DATA, *QR_BOX)
 
-    # 🖋 Date + Signature
+    # 🖋 Date
     pdf.setFont("Helvetica", 12)
     pdf.drawString(100, 130, f"Date Issued: {date_issued}")
-    pdf.setLineWidth(1)
-    pdf.line(100, 100, 300, 100)
-    pdf.drawString(150, 80, "Authorized Signature")
-
-    if institution_logo:
-        try:
-            pdf.drawImage(ImageReader(institution_logo), 50, height - 150, width=100, height=100, mask='auto')
-        except Exception as e:
-            print("Logo load error:", e)
 
     pdf.save()
-    buffer.seek(0)
 
-    with open(pdf_path, "wb") as f:
-        f.write(buffer.getvalue())
+    return io.BytesIO(template.stamp(buffer.getvalue()))
 
-# new metadata
-def generate_metadata_dict(name, surname, reg_number, course, degree_class, institution_name, date_issued):
-    return {
-        "student_name": name,
-        "student_surname": surname,
-        "registration_number": reg_number,
-        "course": course,
-        "degree_class": degree_class,
-        "institution": institution_name,
-        "date_issued": date_issued,
-    }
+def upload_metadata(metadata: dict) -> str:
+    with stage("pin-json"):
+        return get_pinning_backend().pin_json(metadata)
+
+async def upload_metadata_async(metadata: dict) -> str:
+    with stage("pin-json"):
+        return await get_pinning_backend().pin_json_async(metadata)
+
+def _require_pdf(content):
+    # Whatever a gateway returns is cached for good, so never keep an error page
+    if not content.startswith(b"%PDF"):
+        raise Exception("response is not a PDF")
+
+
+def _require_json(content):
+    try:
+        json.loads(content)
+    except (JSONDecodeError, UnicodeDecodeError):
+        print(f"❌ IPFS metadata was not JSON. Body (first 500 chars):\n{content[:500]!r}")
+        raise Exception("Failed to parse metadata JSON from IPFS")
+
+
+def _fetch_pdf(cid):
+    # Only reached on a CID cache miss
+    with stage("gateway-fetch"):
+        return get_pinning_backend().fetch(cid, _require_pdf)
+
+
+def _fetch_metadata(cid):
+    with stage("gateway-fetch"):
+        return get_pinning_backend().fetch(cid, _require_json)
+
+
+async def _fetch_pdf_async(cid):
+    with stage("gateway-fetch"):
+        return await get_pinning_backend().fetch_async(cid, _require_pdf)
+
+
+async def _fetch_metadata_async(cid):
+    with stage("gateway-fetch"):
+        return await get_pinning_backend().fetch_async(cid, _require_json)
 
-def upload_json_to_pinata(metadata: dict) -> str:
-    url = "https://api.pinata.cloud/pinning/pinJSONToIPFS"
-    headers = {
-        "Authorization": PINATA_JWT,         
-        "Content-Type": "application/json",
-    }
-    response = requests.post(url, headers=headers, data=json.dumps(metadata))
-    if response.status_code == 200:
-        return f"https://gateway.pinata.cloud/ipfs/{response.json()['IpfsHash']}"
-    else:
-        raise Exception(f"Pinata JSON upload failed: {response.text}")
 
 def download_pdf_from_ipfs(cid):
-    gateways = [
-        f"https://ipfs.io/ipfs/{cid}",
-        f"https://cloudflare-ipfs.com/ipfs/{cid}",
-        f"https://gateway.pinata.cloud/ipfs/{cid}",
-        f"https://{cid}.ipfs.dweb.link",
-    ]
+    # Content under a CID never changes, so each PDF is downloaded once and then read from disk
+    return get_cid_cache().get_path(cid, _fetch_pdf)
 
-    for url in gateways:
-        try:
-            print(f"⏳ Trying PDF gateway: {url}")
-            response = requests.get(url, timeout=15)
-            response.raise_for_status()
 
-            temp_path = os.path.join(tempfile.gettempdir(), f"{cid}.pdf")
-            with open(temp_path, "wb") as f:
-                f.write(response.content)
+def fetch_ipfs_metadata(cid):
+    return json.loads(get_cid_cache().get_bytes(cid, _fetch_metadata))
 
-            print(f"✅ Fetched PDF from: {url}")
-            return temp_path
 
-        except Exception as e:
-            print(f"❌ Gateway {url} failed: {e}")
-            continue
+async def fetch_ipfs_metadata_async(cid):
+    return json.loads(await get_cid_cache().get_bytes_async(cid, _fetch_metadata_async))
 
-    raise Exception("All IPFS gateways failed to retrieve the PDF.")
 
+# Bump when create_overlay/merge_overlay output changes, so cached finalized PDFs are rebuilt
+OVERLAY_VERSION = 4
 
-def create_overlay(cid, reg_number):
+def verification_url(cid, reg_number):
     # Build a verification URL that points to your frontend (with query params)
-    qr_url = (
+    return (
         "https://dissertationtest-cw6eyx69o-marshalls-projects-57ca710a.vercel.app"
         f"/verify-certificate?reg_number={reg_number}&cid={cid}"
     )
 
-    # Create an in-memory PDF (single page) containing the QR + text
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    c.setFont("Courier", 12)
-    # c.drawCentredString(300, 450, f"IPFS CID: {cid}")
-    # c.drawCentredString(300, 430, f"Reg Number: {reg_number}")
-
-    # Generate and embed the QR code
-    qr = qrcode.make(qr_url)
-    tmp_qr_path = os.path.join(tempfile.gettempdir(), "qr_temp.png")
-    qr.save(tmp_qr_path)
-    c.drawInlineImage(tmp_qr_path, 450, 50, width=100, height=100)
-    os.remove(tmp_qr_path)
-
-    c.save()
-    buffer.seek(0)
-    return buffer
-
-
-def merge_overlay(original_pdf_path, overlay_buffer):
-    reader = PdfReader(original_pdf_path)
-    overlay_reader = PdfReader(overlay_buffer)  # this reads from BytesIO
-    writer = PdfWriter()
-
-    for i, page in enumerate(reader.pages):
-        if i == 0:
-            # Merge overlay only onto page 1
-            page.merge_page(overlay_reader.pages[0])
-        writer.add_page(page)
-
-    output_path = original_pdf_path.replace(".pdf", "_updated.pdf")
-    with open(output_path, "wb") as f:
-        writer.write(f)
-
-    return output_path
-
-def process_single_entry(entry, institution):
-    start = time.time()
-    try:
-        name = entry["student_name"]
-        surname = entry["student_surname"]
-        reg_number = entry["reg_number"]
-        course = entry["course"]
-        degree_class = entry["degree_class"]
-        date_issued = datetime.now().strftime("%Y-%m-%d")
-
-        filename = f"{name}_{surname}_{course}.pdf".replace(" ", "_")
-        pdf_path = os.path.join(tempfile.gettempdir(), filename)
-
-        generate_certificate_pdf_local(
-            pdf_path,
-            f"{name} {surname} {course}",
-            course,
-            degree_class,
-            institution.name,
-            institution.logo.path if institution.logo else None,
-            verification_url=None,
-            date_issued=date_issued,
-            qr_mode="dummy",
-        )
+@stage("qr")
+def create_overlay(cid, reg_number):
+    # Raw content-stream operators for the QR; no canvas or intermediate PDF is built
+    return qr_content_stream(verification_url(cid, reg_number), *QR_BOX)
+
+
+@stage("merge")
+def merge_overlay(original_pdf, overlay):
+    # Draws the overlay over page 1 only; the other pages are carried over byte for byte
+    return overlay_first_page(original_pdf, overlay)
+
+def _finalized_source(metadata):
+    pdf_url = metadata.get("pdf_ipfs_url")
+    reg_number = metadata.get("reg_number")
+    if not pdf_url or not reg_number:
+        raise Exception("Missing 'pdf_ipfs_url' or 'reg_number' in metadata")
+    return pdf_url.split("/")[-1], reg_number
+
+def stamp_qr(original_pdf, new_cid, reg_number):
+    return merge_overlay(original_pdf, create_overlay(new_cid, reg_number))
+
+def build_finalized_pdf(new_cid):
+    # metadata -> original PDF -> QR overlay on page 1; returns the final PDF bytes
+    metadata = fetch_ipfs_metadata(new_cid)
+    print(f"✅ Metadata fetched: {metadata}")
+
+    pdf_cid, reg_number = _finalized_source(metadata)
+    original_pdf = get_cid_cache().get_bytes(pdf_cid, _fetch_pdf)
+    print(f"✅ PDF fetched: {pdf_cid}")
+
+    return stamp_qr(original_pdf, new_cid, reg_number)
+
+async def build_finalized_pdf_async(new_cid):
+    # Downloads on the caller's loop; the CPU-bound QR stamping on a worker thread
+    metadata = await fetch_ipfs_metadata_async(new_cid)
+    print(f"✅ Metadata fetched: {metadata}")
+
+    pdf_cid, reg_number = _finalized_source(metadata)
+    original_pdf = await get_cid_cache().get_bytes_async(pdf_cid, _fetch_pdf_async)
+    print(f"✅ PDF fetched: {pdf_cid}")
+
+    return await sync_to_async(stamp_qr, thread_sensitive=False)(original_pdf, new_cid, reg_number)
+
+def _finalized_key(new_cid):
+    return f"{new_cid}v{OVERLAY_VERSION}"
+
+def finalized_pdf_path(new_cid):
+    # The finalized PDF depends only on new_cid (and the overlay code), so it is built once
+    return get_finalized_cache().get_path(_finalized_key(new_cid), lambda _: build_finalized_pdf(new_cid))
+
+async def finalized_pdf_path_async(new_cid):
+    return await get_finalized_cache().get_path_async(_finalized_key(new_cid), lambda _: build_finalized_pdf_async(new_cid))
+
+def seed_ipfs_cache(pdf_bytes, pdf_cid, metadata, metadata_cid):
+    # Keep the bytes we just pinned, so reading them back (QR overlay, batch export) never
+    # goes to a gateway - only when the pinned CIDs are the ones computed locally
+    metadata_bytes = metadata_json_bytes(metadata)
+    local_pdf_cid, local_metadata_cid = compute_cid(pdf_bytes), compute_cid(metadata_bytes)
+    if (pdf_cid, metadata_cid) != (local_pdf_cid, local_metadata_cid):
+        print(f"⚠️ Local CIDs {local_pdf_cid}/{local_metadata_cid} differ from the pinned {pdf_cid}/{metadata_cid}")
+        return False
+
+    get_cid_cache().put(pdf_cid, pdf_bytes)
+    get_cid_cache().put(metadata_cid, metadata_bytes)
+    return True
+
+def seed_finalized_pdf(pdf_bytes, pdf_ipfs_url, metadata, metadata_ipfs_url):
+    """Stamp the real QR right after issuing, from the bytes already in hand.
+
+    Only when the pinning backend's CIDs match the ones computed locally: then the cached copies are
+    exactly what IPFS serves, and update_certificate_with_cid never downloads or re-merges.
+    """
+    metadata_cid = cid_from_url(metadata_ipfs_url)
+    if not seed_ipfs_cache(pdf_bytes, cid_from_url(pdf_ipfs_url), metadata, metadata_cid):
+        return False
+
+    final_pdf = stamp_qr(pdf_bytes, metadata_cid, metadata["reg_number"])
+    get_finalized_cache().put(_finalized_key(metadata_cid), final_pdf)
+    return True
+
+def render_entry(entry, institution_name, institution_logo, date_issued):
+    # Plain arguments only, so render worker processes can run it (see render_worker)
+    name = entry["student_name"]
+    surname = entry["student_surname"]
+    course = entry["course"]
+    filename = f"{name}_{surname}_{course}.pdf".replace(" ", "_")
+
+    pdf_buffer = generate_certificate_pdf_local(
+        f"{name} {surname} {course}",
+        course,
+        entry["degree_class"],
+        institution_name,
+        institution_logo,
+        verification_url=None,
+        date_issued=date_issued,
+        qr_mode="dummy",
+    )
+    return filename, pdf_buffer
+
+def build_entry_metadata(entry, institution, date_issued, pdf_ipfs_url):
+    return {
+        "student_name": entry["student_name"],
+        "student_surname": entry["student_surname"],
+        "reg_number": entry["reg_number"],
+        "course": entry["course"],
+        "degree_class": entry["degree_class"],
+        "institution": institution.name,
+        "date_issued": date_issued,
+        "pdf_ipfs_url": pdf_ipfs_url,
+    }
 
-        # Upload PDF to IPFS
-        pdf_ipfs_url = upload_to_pinata(pdf_path)
-
-        # Create metadata
-        metadata = {
-            "student_name": name,
-            "student_surname": surname,
-            "reg_number": reg_number,
-            "course": course,
-            "degree_class": degree_class,
-            "institution": institution.name,
-            "date_issued": date_issued,
-            "pdf_ipfs_url": pdf_ipfs_url,
-        }
-
-        # Upload metadata to IPFS
-        metadata_ipfs_url = upload_json_to_pinata(metadata)
-
-        # Save to DB (optional)
-        Certificate.objects.create(
-            student_name=name,
-            student_surname=surname,
-            student_regNumber=reg_number,
-            course=course,
-            degree_class=degree_class,
+def cid_from_url(ipfs_url):
+    return ipfs_url.split("/")[-1] if ipfs_url else ""
+
+def build_entry_certificate(entry, metadata_cid="", pdf_cid=""):
+    # Unsaved, so batches can bulk_create many at once
+    return Certificate(
+        student_name=entry["student_name"],
+        student_surname=entry["student_surname"],
+        student_regNumber=entry["reg_number"],
+        course=entry["course"],
+        degree_class=entry["degree_class"],
+        metadata_cid=metadata_cid,
+        pdf_cid=pdf_cid,
+    )
+
+def save_certificates(certificates, chunk_size=None):
+    # One transaction per chunk instead of one per row keeps SQLite's writer lock short
+    chunk_size = chunk_size or settings.BATCH_DB_CHUNK_SIZE
+    for start in range(0, len(certificates), chunk_size):
+        with transaction.atomic():
+            with stage("db-write"):
+                Certificate.objects.bulk_create(certificates[start:start + chunk_size])
+
+# Printed on the certificate, so a row without them is rejected up front
+REQUIRED_FIELDS = ("student_name", "student_surname", "course", "degree_class")
+
+def _valid_email(value):
+    try:
+        validate_email(value)
+    except ValidationError:
+        return False
+    return True
+
+def screen_entries(entries, chunk_size=500):
+    """Flag rows that must not be issued before any rendering/uploading is spent on them.
+
+    Lazily yields every entry, setting ``entry["_rejected"]`` to the reason for rows with
+    no reg number, an empty required field, a malformed ``email`` (only checked when the CSV
+    has that column), a reg number repeated earlier in the same CSV, or a reg number that
+    already has a Certificate. One query per chunk checks the existing certificates.
+    """
+    first_seen = {}
+    row_number = 0
+    rows = iter(entries)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+
+        reg_numbers = {(e.get("reg_number") or "").strip() for e in chunk} - {""}
+        issued = set(
+            Certificate.objects.filter(student_regNumber__in=reg_numbers)
+            .values_list("student_regNumber", flat=True)
         )
 
-        print(f"⏱️ Processed {reg_number} in {time.time() - start:.2f}s")
-        return {
-            "reg_number": reg_number,
-            "cid": metadata_ipfs_url.split("/")[-1],
-            "status": "success"
-        }
-
-    except Exception as e:
-        return {
-            "reg_number": entry.get("reg_number", "N/A"),
-            "status": f"error: {str(e)}"
-        }
+        for entry in chunk:
+            row_number += 1
+            reg_number = (entry.get("reg_number") or "").strip()
+            missing = next((f for f in REQUIRED_FIELDS if not (entry.get(f) or "").strip()), None)
+            email = (entry.get("email") or "").strip()
+            if not reg_number:
+                entry["_rejected"] = "missing reg_number"
+            elif missing:
+                entry["_rejected"] = f"missing {missing}"
+            elif email and not _valid_email(email):
+                entry["_rejected"] = f"invalid email: {email}"
+            elif reg_number in first_seen:
+                entry["_rejected"] = f"duplicate reg_number in CSV (first on row {first_seen[reg_number]})"
+            elif reg_number in issued:
+                entry["_rejected"] = "a certificate was already issued for this reg_number"
+            else:
+                first_seen[reg_number] = row_number
+            yield entry
@@ -0,0 +1,299 @@
+import asyncio
+import json
+import threading
+import weakref
+import time
+from collections import deque
+from functools import wraps
+from urllib.parse import urlparse
+import aiohttp
+import requests
+from asgiref.sync import async_to_sync
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+LATENCY_SAMPLES = 1000
+
+
+class EndpointStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+
+    def as_dict(self):
+        ordered = sorted(self.samples)
+
+        def pct(p):
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "p50_ms": round(pct(0.50) * 1000, 2),
+            "p95_ms": round(pct(0.95) * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def record_latency(endpoint, elapsed, failed=False, retries=0):
+    with _stats_lock:
+        stats = _stats.setdefault(endpoint, EndpointStats())
+        stats.count += 1
+        stats.retries += retries
+        stats.total += elapsed
+        stats.max = max(stats.max, elapsed)
+        stats.samples.append(elapsed)
+        if failed:
+            stats.errors += 1
+
+
+def latency_stats():
+    # Shared by the sync and async clients, keyed by endpoint label
+    with _stats_lock:
+        return {endpoint: stats.as_dict() for endpoint, stats in _stats.items()}
+
+
+def _file_fields(files):
+    # requests accepts files as a dict or, to repeat a field name, a list of (field, value) pairs
+    return list(files.items()) if isinstance(files, dict) else list(files or ())
+
+
+def _rewind(files):
+    # A retried multipart upload has to re-read its file objects from the start
+    for _, value in _file_fields(files):
+        fileobj = value[1] if isinstance(value, tuple) else value
+        if hasattr(fileobj, "seek"):
+            fileobj.seek(0)
+
+
+class HttpClient:
+    """Shared keep-alive session for Pinata and IPFS gateways.
+
+    requests.Session is safe to share between the batch worker threads as long as
+    nobody mutates its headers/adapters after creation, which this class never does.
+    """
+
+    def __init__(self, pool_size, connect_timeout, read_timeout, max_retries, backoff):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, url, endpoint=None, retries=None, **kwargs):
+        endpoint = endpoint or urlparse(url).netloc
+        retries = self.max_retries if retries is None else retries
+        kwargs.setdefault("timeout", self.timeout)
+
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            _rewind(kwargs.get("files"))
+            try:
+                response = self.session.request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    record_latency(endpoint, time.perf_counter() - start, response.status_code >= 400, attempt)
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= retries:
+                    record_latency(endpoint, time.perf_counter() - start, True, attempt)
+                    raise
+            time.sleep(self.backoff * (2 ** attempt))
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def latency_stats(self):
+        return latency_stats()
+
+
+class AsyncResponse:
+    # The body is read before the aiohttp response is released, so callers get a
+    # requests-like object they can use after the request has finished
+    def __init__(self, status_code, content, headers):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(f"HTTP {self.status_code}: {self.text[:200]}")
+
+
+def _form_data(files):
+    # requests-style files={"field": (filename, fileobj_or_bytes[, content_type])};
+    # a None filename makes a plain form field, as with requests. Filenames are sent unquoted,
+    # like requests does, so "folder/name.pdf" keeps its slash for Pinata directory uploads
+    form = aiohttp.FormData(quote_fields=False)
+    for field, (filename, fileobj, *content_type) in _file_fields(files):
+        body = fileobj.read() if hasattr(fileobj, "read") else fileobj
+        form.add_field(field, body, filename=filename, content_type=content_type[0] if content_type else None)
+    return form
+
+
+class AsyncHttpClient:
+    """aiohttp counterpart of HttpClient for the asyncio batch engine.
+
+    A ClientSession is bound to the event loop it was created on, so
+    get_async_http_client() keeps one instance per running loop.
+    """
+
+    def __init__(self, pool_size, connect_timeout, read_timeout, max_retries, backoff):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=pool_size))
+
+    async def request(self, method, url, endpoint=None, retries=None, timeout=None, files=None, **kwargs):
+        endpoint = endpoint or urlparse(url).netloc
+        retries = self.max_retries if retries is None else retries
+        connect, read = timeout or self.timeout
+        kwargs["timeout"] = aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            if files:
+                _rewind(files)
+                kwargs["data"] = _form_data(files)
+            try:
+                async with self.session.request(method, url, **kwargs) as raw:
+                    response = AsyncResponse(raw.status, await raw.read(), raw.headers)
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    record_latency(endpoint, time.perf_counter() - start, response.status_code >= 400, attempt)
+                    return response
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= retries:
+                    record_latency(endpoint, time.perf_counter() - start, True, attempt)
+                    raise
+            await asyncio.sleep(self.backoff * (2 ** attempt))
+            attempt += 1
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self):
+        await self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient(
+                    pool_size=settings.BATCH_MAX_WORKERS,
+                    connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+                    read_timeout=settings.HTTP_READ_TIMEOUT,
+                    max_retries=settings.HTTP_MAX_RETRIES,
+                    backoff=settings.HTTP_RETRY_BACKOFF,
+                )
+    return _client
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncHttpClient(
+            pool_size=settings.BATCH_CONCURRENCY,
+            connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+            read_timeout=settings.HTTP_READ_TIMEOUT,
+            max_retries=settings.HTTP_MAX_RETRIES,
+            backoff=settings.HTTP_RETRY_BACKOFF,
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_http_client():
+    # Only for a loop the caller owns (see run_on_own_loop); never the server's loop
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def run_on_own_loop(async_fn, *args):
+    """Run ``async_fn(*args)`` from sync code on an event loop made for this call, then close
+    that loop's client.
+
+    async_to_sync alone is not enough: in a sync_to_async thread (every sync view under ASGI)
+    it runs the coroutine on the server's loop, whose pooled client other requests share. A
+    new thread has no outer loop to return to, so async_to_sync creates one there. Thread-
+    sensitive sync_to_async calls inside run on that thread, so its connections are closed too.
+    """
+    async def owned():
+        try:
+            return await async_fn(*args)
+        finally:
+            await close_async_http_client()
+
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = async_to_sync(owned)()
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=run, name="own-loop")
+    thread.start()
+    thread.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def releases_async_http_client(view):
+    """For async views. Under ASGI the server's loop, and so its pooled client, outlives every
+    request. Under WSGI Django runs each async view on a throwaway loop (async_to_sync), so that
+    loop's client is closed with the request instead of leaking its session."""
+    @wraps(view)
+    async def wrapped(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        finally:
+            if not isinstance(request, ASGIRequest):
+                await close_async_http_client()
+    return wrapped
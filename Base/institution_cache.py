@@ -0,0 +1,101 @@
+import threading
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from .models import PendingInstitution, normalize_lookup
+
+# Cached value for addresses with no approved, non-revoked institution
+NOT_FOUND = "__not_found__"
+
+
+def _new_generation():
+    # Random rather than a counter: an evicted generation must never come back with an old value
+    return uuid.uuid4().hex
+
+
+class InstitutionCache:
+    """Read-through cache of approved, non-revoked institutions keyed by normalized address.
+
+    Every address has a generation key next to its entry, and an entry only counts when it
+    was stored under the current generation. The PendingInstitution signals in signals.py
+    replace the generation once a change commits, so a reader that queried the old row
+    before the commit cannot cache it past the change: whatever it stores is tagged with
+    the superseded generation. Approve/revoke take effect immediately in this process;
+    other processes catch up within the TTL unless CACHES["institutions"] points at a
+    shared backend.
+    """
+
+    def __init__(self, alias="institutions"):
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def key(address_key):
+        return f"institution:address:{address_key}"
+
+    @staticmethod
+    def generation_key(address_key):
+        return f"institution:generation:{address_key}"
+
+    def _generation(self, address_key):
+        self.cache.add(self.generation_key(address_key), _new_generation(), None)
+        return self.cache.get(self.generation_key(address_key))
+
+    def get_by_address(self, eth_address):
+        """Return ``{"id", "name"}`` for the active institution at ``eth_address``, or None."""
+        address_key = normalize_lookup(eth_address)
+        if not address_key:
+            return None
+
+        key, generation_key = self.key(address_key), self.generation_key(address_key)
+        found = self.cache.get_many([key, generation_key])
+        generation = found.get(generation_key)
+        cached = found.get(key)
+        if generation is None:
+            generation = self._generation(address_key)
+        hit = cached is not None and cached[0] == generation
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if hit:
+            return None if cached[1] == NOT_FOUND else cached[1]
+
+        # The generation was read before the query: if the row changes meanwhile, this entry
+        # is already stale and will not be served
+        institution = (
+            PendingInstitution.objects.filter(
+                ethereum_address_normalized=address_key, approved=True, revoked=False
+            )
+            .values("id", "name")
+            .first()
+        )
+        self.cache.set(key, (generation, institution or NOT_FOUND), settings.INSTITUTION_CACHE_TTL)
+        return institution
+
+    def invalidate(self, eth_address):
+        # Call once the change is committed (see signals.py): a new generation disowns every
+        # entry stored so far, including one a reader is about to store from the old row
+        address_key = normalize_lookup(eth_address)
+        if address_key:
+            self.cache.set(self.generation_key(address_key), _new_generation(), None)
+            self.cache.delete(self.key(address_key))
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+institution_cache = InstitutionCache()
@@ -0,0 +1,230 @@
+import asyncio
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+# CIDv0 (Qm...) and CIDv1 base32/base58 are plain alphanumerics, which keeps them path-safe
+CID_PATTERN = re.compile(r"^[A-Za-z0-9]{8,128}$")
+# A temp file this old is a write abandoned by a dead process; younger ones may still be in flight
+STALE_TMP_SECONDS = 3600
+# How often the byte count is taken from disk again, picking up other processes' writes and evictions
+RESCAN_SECONDS = 10
+
+
+class CidCache:
+    """Size-bounded on-disk cache of immutable IPFS content, keyed by CID.
+
+    Entries are written to a temp file and renamed into place, so a reader never sees a
+    partial file. Concurrent misses for the same CID share one fetch (single-flight);
+    other processes sharing the directory may fetch a CID twice but never corrupt it.
+    Least recently used entries are removed once the total size goes over ``max_bytes``.
+    Async callers (get_path_async) share one fetch per CID within their event loop.
+
+    Each process counts the bytes it stores and re-reads the directory at most every
+    ``rescan_seconds``, so with several processes the directory can exceed ``max_bytes``
+    by what the others wrote since this one last looked.
+    """
+
+    def __init__(self, root, max_bytes, rescan_seconds=RESCAN_SECONDS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.rescan_seconds = rescan_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+        self.current_bytes = 0
+        self._entries = OrderedDict()  # cid -> size, least recently used first
+        self._lock = threading.Lock()
+        self._inflight = {}  # cid -> Lock held by the thread fetching it
+        self._inflight_async = {}  # (loop, cid) -> Task fetching it
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _scan(self):
+        # (mtime, cid, size) of every entry on disk, oldest first
+        found = []
+        stale_before = time.time() - STALE_TMP_SECONDS
+        for entry in os.scandir(self.root):
+            try:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+            except FileNotFoundError:
+                continue  # renamed or evicted by another process meanwhile
+            if CID_PATTERN.match(entry.name):
+                found.append((st.st_mtime_ns, entry.name, st.st_size))
+            elif entry.name.startswith(".tmp-") and st.st_mtime < stale_before:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+        self._last_scan = time.monotonic()
+        return sorted(found)
+
+    def _load(self):
+        # Rebuild the LRU order from what a previous process left behind
+        for _, cid, size in self._scan():
+            self._entries[cid] = size
+            self.current_bytes += size
+        self._evict()
+
+    def _rescan(self):
+        # Caller holds self._lock. Sizes come from disk; entries only another process knows
+        # of go first (least recently used), then ours in our own recency order.
+        on_disk = OrderedDict((cid, size) for _, cid, size in self._scan())
+        entries = OrderedDict((cid, size) for cid, size in on_disk.items() if cid not in self._entries)
+        for cid in self._entries:
+            if cid in on_disk:
+                entries[cid] = on_disk[cid]
+        self._entries = entries
+        self.current_bytes = sum(entries.values())
+
+    def path(self, cid):
+        if not CID_PATTERN.match(cid or ""):
+            raise ValueError(f"Invalid CID: {cid!r}")
+        return os.path.join(self.root, cid)
+
+    def _hit(self, cid):
+        # Caller holds self._lock
+        self._entries.move_to_end(cid)
+        self.hits += 1
+        self.bytes_saved += self._entries[cid]
+
+    def get_path(self, cid, fetch):
+        """Return the cached file path for ``cid``, calling ``fetch(cid) -> bytes`` on a miss."""
+        path = self.path(cid)
+        with self._lock:
+            if cid in self._entries and os.path.exists(path):
+                self._hit(cid)
+                return path
+            flight = self._inflight.setdefault(cid, threading.Lock())
+
+        with flight:
+            with self._lock:
+                # Someone else finished the fetch while we waited for it
+                if cid in self._entries and os.path.exists(path):
+                    self._hit(cid)
+                    return path
+                self.misses += 1
+            try:
+                content = fetch(cid)
+                self._store(cid, path, content)
+            finally:
+                with self._lock:
+                    self._inflight.pop(cid, None)
+        return path
+
+    async def get_path_async(self, cid, fetch):
+        """get_path for async code: ``fetch(cid)`` is a coroutine, awaited on the caller's loop.
+
+        Hits and writes are small local file operations and stay on the loop.
+        """
+        path = self.path(cid)
+        with self._lock:
+            if cid in self._entries and os.path.exists(path):
+                self._hit(cid)
+                return path
+
+        key = (asyncio.get_running_loop(), cid)
+        task = self._inflight_async.get(key)
+        joined = task is not None
+        if not joined:
+            with self._lock:
+                self.misses += 1
+            task = self._inflight_async[key] = asyncio.ensure_future(self._fetch_and_store(cid, path, fetch))
+            task.add_done_callback(lambda _: self._inflight_async.pop(key, None))
+
+        # shield: one waiter going away (client disconnect) must not cancel the others' fetch
+        await asyncio.shield(task)
+        if joined:
+            # Someone else's fetch answered this one, as in get_path
+            with self._lock:
+                if cid in self._entries:
+                    self._hit(cid)
+        return path
+
+    async def _fetch_and_store(self, cid, path, fetch):
+        content = await fetch(cid)
+        self._store(cid, path, content)
+
+    async def get_bytes_async(self, cid, fetch):
+        with open(await self.get_path_async(cid, fetch), "rb") as f:
+            return f.read()
+
+    def put(self, cid, content):
+        # Seed an entry we already hold the bytes for (e.g. content we just pinned ourselves)
+        self._store(cid, self.path(cid), content)
+
+    def get_bytes(self, cid, fetch):
+        with open(self.get_path(cid, fetch), "rb") as f:
+            return f.read()
+
+    def _store(self, cid, path, content):
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=self.root)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            self.current_bytes += len(content) - self._entries.pop(cid, 0)
+            self._entries[cid] = len(content)
+            if time.monotonic() - self._last_scan >= self.rescan_seconds:
+                self._rescan()
+            self._evict()
+
+    def _evict(self):
+        # Caller holds self._lock (or is __init__); the newest entry always stays
+        while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+            cid, size = self._entries.popitem(last=False)
+            self.current_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.root, cid))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "bytes_saved": self.bytes_saved,
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _get_cache(root, max_bytes):
+    cache = _caches.get(root)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(root)
+            if cache is None:
+                cache = _caches[root] = CidCache(root, max_bytes)
+    return cache
+
+
+def get_cid_cache():
+    return _get_cache(settings.IPFS_CACHE_DIR, settings.IPFS_CACHE_MAX_BYTES)
+
+
+def get_finalized_cache():
+    # QR-overlaid certificates, keyed by metadata CID + overlay version (see helper.finalized_pdf_path)
+    return _get_cache(settings.FINALIZED_PDF_CACHE_DIR, settings.FINALIZED_PDF_CACHE_MAX_BYTES)
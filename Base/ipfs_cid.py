@@ -0,0 +1,145 @@
+import base64
+import hashlib
+
+# Same defaults as `ipfs add` / Pinata: 256 KiB fixed-size chunks, balanced DAG, 174 links per node
+CHUNK_SIZE = 262144
+MAX_LINKS = 174
+# kubo shards directories whose node would exceed 256 KiB
+DIRECTORY_SHARD_THRESHOLD = 262144
+
+UNIXFS_RAW = 0
+UNIXFS_DIRECTORY = 1
+UNIXFS_FILE = 2
+CODEC_DAG_PB = 0x70
+CODEC_RAW = 0x55
+SHA2_256 = 0x12
+
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+
+def _varint(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _bytes_field(number, value):
+    return _varint(number << 3 | 2) + _varint(len(value)) + value
+
+
+def _varint_field(number, value):
+    return _varint(number << 3) + _varint(value)
+
+
+def _unixfs_file(data, filesize, blocksizes=(), kind=UNIXFS_FILE):
+    out = _varint_field(1, kind)
+    if data:
+        out += _bytes_field(2, data)
+    out += _varint_field(3, filesize)
+    for size in blocksizes:
+        out += _varint_field(4, size)
+    return out
+
+
+def _dag_pb(data, links=()):
+    # links: (cid bytes, tsize, name bytes). dag-pb canonical order: Links (field 2) before
+    # Data (field 1); an empty Name is still written
+    out = b""
+    for cid, tsize, name in links:
+        out += _bytes_field(2, _bytes_field(1, cid) + _bytes_field(2, name) + _varint_field(3, tsize))
+    return out + _bytes_field(1, data)
+
+
+def _multihash(block):
+    return bytes([SHA2_256, 32]) + hashlib.sha256(block).digest()
+
+
+def _cid_bytes(block, codec, version):
+    if version == 0:
+        return _multihash(block)
+    return _varint(1) + _varint(codec) + _multihash(block)
+
+
+def _base58(raw):
+    n = int.from_bytes(raw, "big")
+    out = ""
+    while n:
+        n, rem = divmod(n, 58)
+        out = BASE58_ALPHABET[rem] + out
+    return "1" * (len(raw) - len(raw.lstrip(b"\0"))) + out
+
+
+def encode_cid(cid_bytes):
+    # CIDv0 is a bare base58btc multihash; CIDv1 uses multibase base32 ("b" prefix)
+    if cid_bytes[0] == SHA2_256:
+        return _base58(cid_bytes)
+    return "b" + base64.b32encode(cid_bytes).decode().lower().rstrip("=")
+
+
+def _leaf(chunk, version, kind=UNIXFS_FILE):
+    # -> (cid bytes, cumulative DAG size, file bytes under it)
+    if version == 1:
+        # CIDv1 implies raw leaves, as with `ipfs add --cid-version=1`
+        return _cid_bytes(chunk, CODEC_RAW, 1), len(chunk), len(chunk)
+    block = _dag_pb(_unixfs_file(chunk, len(chunk), kind=kind))
+    return _cid_bytes(block, CODEC_DAG_PB, 0), len(block), len(chunk)
+
+
+def _parent(children, version):
+    filesize = sum(size for _, _, size in children)
+    block = _dag_pb(
+        _unixfs_file(b"", filesize, [size for _, _, size in children]),
+        [(cid, tsize, b"") for cid, tsize, _ in children],
+    )
+    return _cid_bytes(block, CODEC_DAG_PB, version), len(block) + sum(t for _, t, _ in children), filesize
+
+
+def compute_cid(content, version=0):
+    """CID that ``ipfs add`` (and Pinata's pinFileToIPFS/pinJSONToIPFS) assigns to ``content``.
+
+    UnixFS file, 256 KiB chunks, balanced layout. CIDv0 uses dag-pb leaves; CIDv1 uses raw
+    leaves. No network access: this only hashes the bytes.
+
+    As in go-unixfs's balanced builder, the first CIDv0 leaf is a UnixFS File node (on its
+    own it is the whole file) and every later leaf a UnixFS Raw node.
+    """
+    _check_version(version)
+    return encode_cid(_file_root(content, version)[0])
+
+
+def _check_version(version):
+    if version not in (0, 1):
+        raise ValueError("CID version must be 0 or 1")
+
+
+def _file_root(content, version):
+    chunks = [content[i:i + CHUNK_SIZE] for i in range(0, len(content), CHUNK_SIZE)] or [b""]
+    level = [_leaf(chunk, version, UNIXFS_FILE if i == 0 else UNIXFS_RAW) for i, chunk in enumerate(chunks)]
+    # A single chunk is the root block itself; otherwise build the tree up, 174 links per node
+    while len(level) > 1:
+        level = [_parent(level[i:i + MAX_LINKS], version) for i in range(0, len(level), MAX_LINKS)]
+    return level[0]
+
+
+def compute_directory_cids(files, version=0):
+    """``(directory CID, {name: file CID})`` for a flat directory of ``files`` ({name: bytes}).
+
+    Matches a folder upload to ``ipfs add -r`` / Pinata: every file added as by compute_cid,
+    one plain (unsharded) UnixFS directory node linking them in name order.
+    """
+    _check_version(version)
+    roots = {name: _file_root(content, version) for name, content in files.items()}
+    links = sorted((name.encode("utf-8"), root) for name, root in roots.items())
+    block = _dag_pb(_varint_field(1, UNIXFS_DIRECTORY), [(cid, tsize, name) for name, (cid, tsize, _) in links])
+    if len(block) > DIRECTORY_SHARD_THRESHOLD:
+        # Past this size IPFS switches to a HAMT-sharded directory, which this does not build
+        raise ValueError(f"Directory of {len(files)} files is too large for a plain directory node")
+    return encode_cid(_cid_bytes(block, CODEC_DAG_PB, version)), {
+        name: encode_cid(root[0]) for name, root in roots.items()
+    }
@@ -0,0 +1,110 @@
+import base64
+import hashlib
+import uuid
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Max, Q
+from django.utils import timezone
+from .models import PendingInstitution
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+DELETIONS_KEY = "institution:listing:deletions"
+
+
+class ListingError(ValueError):
+    pass
+
+
+def encode_cursor(instance):
+    raw = f"{instance.submitted_at.isoformat()}|{instance.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        submitted_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(submitted_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ListingError("Invalid cursor")
+
+
+def parse_page_size(value):
+    if not value:
+        return DEFAULT_PAGE_SIZE
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except ValueError:
+        raise ListingError("limit must be an integer")
+
+
+def parse_fields(value, serializer_class):
+    """Split ``?fields=a,b`` into a list, rejecting names the serializer does not have."""
+    if not value:
+        return None
+    fields = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = set(fields) - set(serializer_class().fields)
+    if unknown:
+        raise ListingError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return fields
+
+
+def keyset_page(queryset, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """One page ordered by (submitted_at, id), resuming strictly after ``cursor``.
+
+    Seeks through the index instead of OFFSET, so page N costs the same as page 1.
+    Returns ``(rows, next_cursor)``; next_cursor is None on the last page.
+    """
+    queryset = queryset.order_by("submitted_at", "id")
+    if cursor:
+        submitted_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(submitted_at__gt=submitted_at) | Q(submitted_at=submitted_at, id__gt=pk)
+        )
+    rows = list(queryset[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def _deletions():
+    # Deletes leave no updated_at behind, so they replace this token instead (see signals.py).
+    # It lives in CACHES["institutions"]: with a per-process cache, another process's delete
+    # shows up here once the token expires, within INSTITUTION_CACHE_TTL.
+    cache = caches["institutions"]
+    deletions = cache.get(DELETIONS_KEY)
+    if deletions is None:
+        # "at" starts now, so an expired token also moves Last-Modified forward
+        cache.add(DELETIONS_KEY, {"token": uuid.uuid4().hex, "at": timezone.now()}, settings.INSTITUTION_CACHE_TTL)
+        deletions = cache.get(DELETIONS_KEY)
+    return deletions
+
+
+def record_listing_delete():
+    caches["institutions"].set(
+        DELETIONS_KEY, {"token": uuid.uuid4().hex, "at": timezone.now()}, settings.INSTITUTION_CACHE_TTL
+    )
+
+
+def _listing_version(request):
+    # Once per request, shared by the ETag and Last-Modified callbacks. Max(updated_at)
+    # catches every save (approve/revoke included) and is one seek on its index; no count.
+    if not hasattr(request, "_institution_listing_version"):
+        updated = PendingInstitution.objects.aggregate(updated=Max("updated_at"))["updated"]
+        deletions = _deletions()
+        request._institution_listing_version = {
+            "updated": updated,
+            "token": deletions["token"],
+            "last_modified": max(filter(None, (updated, deletions["at"]))),
+        }
+    return request._institution_listing_version
+
+
+def listing_etag(request, *args, **kwargs):
+    version = _listing_version(request)
+    raw = f"{request.path}?{request.GET.urlencode()}|{version['updated']}|{version['token']}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def listing_last_modified(request, *args, **kwargs):
+    return _listing_version(request)["last_modified"]
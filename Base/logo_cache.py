@@ -0,0 +1,86 @@
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image
+from reportlab.lib.utils import ImageReader
+
+# Logos are drawn in a 100x100pt box; keep 3px per point so print quality is unchanged
+LOGO_BOX = (100, 100)
+LOGO_PIXELS_PER_POINT = 3
+LOGO_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+
+class LogoCache:
+    """Process-wide LRU of decoded, downscaled institution logos, bounded by decoded size."""
+
+    def __init__(self, max_bytes=LOGO_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path):
+        # A re-uploaded logo gets a new mtime/size, so it never matches a stale entry
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def _decode(path):
+        with Image.open(path) as im:
+            if im.mode not in ("RGB", "RGBA", "L"):
+                has_alpha = im.mode in ("LA", "PA") or "transparency" in im.info
+                im = im.convert("RGBA" if has_alpha else "RGB")
+            else:
+                im.load()
+            max_size = (LOGO_BOX[0] * LOGO_PIXELS_PER_POINT, LOGO_BOX[1] * LOGO_PIXELS_PER_POINT)
+            im.thumbnail(max_size, Image.LANCZOS)
+            return im.copy()
+
+    def get(self, path):
+        key = self._key(path)
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return ImageReader(image)
+            self.misses += 1
+
+        image = self._decode(path)
+        size = image.width * image.height * len(image.getbands())
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = image
+                self.current_bytes += size
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                _, old = self._entries.popitem(last=False)
+                self.current_bytes -= old.width * old.height * len(old.getbands())
+                self.evictions += 1
+        return ImageReader(image)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+
+logo_cache = LogoCache()
+
+
+def get_logo(path):
+    return logo_cache.get(path)
@@ -0,0 +1,544 @@
+import asyncio
+import contextlib
+import csv
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from Base.batch_engine import reset_render_executor
+from Base.helper import create_overlay, generate_certificate_pdf_local, merge_overlay
+from Base.http_client import latency_stats
+from Base.ipfs_cid import compute_cid, compute_directory_cids
+from Base.pinning import reset_pinning_backend
+from Base.qr_render import draw_qr
+
+BENCHMARKS = ("render", "qr", "overlay", "cid", "batch", "pipeline", "export", "load")
+# "pipeline" runs the batch several times over, "export" issues --export-rows certificates
+# first and "load" starts two HTTP servers; only with --only
+DEFAULT_BENCHMARKS = ("render", "qr", "overlay", "cid", "batch")
+COURSES = ["Computer Science", "Information Systems", "Accounting", "Civil Engineering", "Nursing"]
+DEGREE_CLASSES = ["First Class", "Upper Second", "Lower Second", "Pass"]
+FIRST_NAMES = ["Tendai", "Rudo", "Farai", "Chipo", "Tatenda", "Nyasha", "Kuda", "Vimbai"]
+SURNAMES = ["Moyo", "Ncube", "Dube", "Sibanda", "Chikwanha", "Mutasa", "Banda", "Zulu"]
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS; it never goes down, so it is the peak so far
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _percentile(ordered, p):
+    # Nearest-rank on an already sorted list
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def _summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "n": len(samples),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "p50_ms": round(_percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(_percentile(ordered, 0.99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "throughput_per_s": round(len(samples) / sum(samples), 1) if sum(samples) else None,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _int_list(value):
+    return sorted({int(n) for n in value.split(",") if n.strip()})
+
+
+def _time_calls(fn, iterations, warmup):
+    for i in range(warmup):
+        fn(-1 - i)
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    return _summarize(samples)
+
+
+def _synthetic_rows(count, seed, prefix):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield {
+            "student_name": rng.choice(FIRST_NAMES),
+            "student_surname": rng.choice(SURNAMES),
+            "reg_number": f"{prefix}{seed:03d}{i:07d}",
+            "course": rng.choice(COURSES),
+            "degree_class": rng.choice(DEGREE_CLASSES),
+        }
+
+
+def _synthetic_csv(count, seed, prefix="B"):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=["student_name", "student_surname", "reg_number", "course", "degree_class"])
+    writer.writeheader()
+    writer.writerows(_synthetic_rows(count, seed, prefix))
+    return out.getvalue().encode("utf-8")
+
+
+def _serve_mock_pinning(latency, conn):
+    # Runs in a child process: answers pinFileToIPFS/pinJSONToIPFS like Pinata, and serves what
+    # was pinned under /ipfs/<cid> like a gateway, each after `latency` seconds
+    from aiohttp import web
+
+    pinned = {}
+
+    async def pin_file(request):
+        # "folder/name" filenames are a directory upload, answered with the folder's CID
+        form = await request.post()
+        files = {f.filename: f.file.read() for f in form.getall("file")}
+        await asyncio.sleep(latency)
+        for content in files.values():
+            pinned[compute_cid(content)] = content
+        if any("/" in name for name in files):
+            cid, _ = compute_directory_cids({name.split("/", 1)[1]: content for name, content in files.items()})
+        else:
+            cid = compute_cid(next(iter(files.values())))
+        return web.json_response({"IpfsHash": cid, "PinSize": sum(map(len, files.values()))})
+
+    async def pin_json(request):
+        body = await request.read()
+        await asyncio.sleep(latency)
+        pinned[compute_cid(body)] = body
+        return web.json_response({"IpfsHash": compute_cid(body), "PinSize": len(body)})
+
+    async def gateway(request):
+        await asyncio.sleep(latency)
+        content = pinned.get(request.match_info["cid"])
+        if content is None:
+            return web.Response(status=404)
+        return web.Response(body=content)
+
+    async def main():
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/pinning/pinFileToIPFS", pin_file)
+        app.router.add_post("/pinning/pinJSONToIPFS", pin_json)
+        app.router.add_get("/ipfs/{cid}", gateway)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        conn.send(site._server.sockets[0].getsockname()[1])
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+@contextlib.contextmanager
+def mock_pinning_server(latency):
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.get_context("fork").Process(target=_serve_mock_pinning, args=(latency, child), daemon=True)
+    process.start()
+    try:
+        if not parent.poll(10):
+            raise RuntimeError("mock pinning server did not start")
+        yield f"http://127.0.0.1:{parent.recv()}"
+    finally:
+        process.terminate()
+        process.join()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# One worker each: an event loop (ASGI) vs a sync worker that serves one request at a time
+SERVERS = {
+    "asgi": lambda port: [sys.executable, "-m", "uvicorn", "backend.asgi:application", "--workers", "1",
+                          "--port", str(port), "--log-level", "warning", "--no-access-log", "--backlog", "2048"],
+    "wsgi": lambda port: [sys.executable, "-m", "gunicorn", "backend.wsgi:application", "--workers", "1",
+                          "--bind", f"127.0.0.1:{port}", "--log-level", "warning", "--backlog", "2048"],
+}
+
+
+@contextlib.contextmanager
+def server_process(kind, **settings_env):
+    """Run the project under one SERVERS worker in its own process; yields its base URL.
+
+    ``settings_env`` are environment variables for backend/settings.py (SQLITE_PATH...).
+    """
+    port = _free_port()
+    env = {**os.environ, "DJANGO_SETTINGS_MODULE": "backend.settings", **settings_env}
+    process = subprocess.Popen(SERVERS[kind](port), cwd=settings.BASE_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                with urllib.request.urlopen(f"{base_url}/metrics", timeout=1):
+                    break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f"{kind} server did not start")
+                time.sleep(0.1)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def _load(base_url, requests, concurrency, make_request):
+    """Send ``requests`` requests, ``concurrency`` at a time; ``make_request(i) -> (method, path, json)``.
+
+    Returns the latencies of the successful ones, the number that failed, the wall time and
+    the JSON bodies of the successful responses (None for non-JSON ones).
+    """
+    import aiohttp
+
+    latencies, bodies, errors = [], [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+    timeout = aiohttp.ClientTimeout(total=600)
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency), timeout=timeout) as session:
+        async def send(i):
+            nonlocal errors
+            method, path, payload = make_request(i)
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    async with session.request(method, base_url + path, json=payload) as response:
+                        body = await response.read()
+                        ok = response.status == 200
+                except aiohttp.ClientError:
+                    ok = False
+                if not ok:
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - start)
+                is_json = response.content_type == "application/json"
+                bodies.append(json.loads(body) if is_json else None)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed, bodies
+
+
+@contextlib.contextmanager
+def test_database():
+    with contextlib.ExitStack() as stack:
+        if connection.vendor == "sqlite":
+            # A file rather than SQLite's shared in-memory database: under ASGI every request
+            # gets its own connection, and the in-memory one fails concurrent writers with
+            # "table is locked" instead of making them wait
+            test_settings = connection.settings_dict["TEST"]
+            stack.callback(test_settings.__setitem__, "NAME", test_settings["NAME"])
+            test_settings["NAME"] = os.path.join(stack.enter_context(tempfile.TemporaryDirectory()), "bench.sqlite3")
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+
+class Command(BaseCommand):
+    help = "Benchmark certificate rendering, QR generation, overlay merging and a full batch upload; reports JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--only", action="append", choices=BENCHMARKS, help="Run only these benchmarks (repeatable)")
+        parser.add_argument("--iterations", type=int, default=200, help="Timed calls per microbenchmark")
+        parser.add_argument("--warmup", type=int, default=10, help="Untimed calls before each microbenchmark")
+        parser.add_argument("--rows", type=int, default=500, help="Synthetic CSV rows for the batch benchmark")
+        parser.add_argument("--export-rows", type=int, default=1000, help="Certificates in the batch the export benchmark downloads")
+        parser.add_argument("--workers", type=_int_list, default=_int_list(f"1,2,4,{os.cpu_count() or 1}"),
+                            help="Comma-separated render worker counts for the pipeline benchmark")
+        parser.add_argument("--concurrency", type=_int_list, default=_int_list("1,4,16,64"),
+                            help="Comma-separated concurrent client counts for the load benchmark")
+        parser.add_argument("--load-requests", type=int, default=100, help="Requests per server, endpoint and concurrency level")
+        parser.add_argument("--directory-size", type=int, default=settings.BATCH_PIN_DIRECTORY_SIZE,
+                            help="Rows pinned per wrapped directory in the batch benchmarks (0: per file)")
+        parser.add_argument("--pin-latency", type=float, default=50, help="Milliseconds the mock pinning server waits per request")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--logo", default=os.path.join(settings.MEDIA_ROOT, "logos", "buse_logo.png"))
+        parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+        parser.add_argument("--show-logs", action="store_true", help="Keep the pipeline's own print output")
+
+    def handle(self, *args, **options):
+        selected = options["only"] or DEFAULT_BENCHMARKS
+        report = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "options": {k: options[k] for k in ("iterations", "warmup", "rows", "export_rows", "workers", "concurrency", "load_requests", "directory_size", "pin_latency", "seed")},
+            },
+            "results": {},
+        }
+
+        with contextlib.ExitStack() as stack:
+            if {"batch", "pipeline", "export", "load"} & set(selected):
+                # Fork the mock server before the benchmarks start any threads
+                pin_url = stack.enter_context(mock_pinning_server(options["pin_latency"] / 1000))
+                # One throwaway database for every batch run: SQLite's in-memory test
+                # database outlives destroy_test_db while batch threads hold connections
+                stack.enter_context(test_database())
+            if not options["show_logs"]:
+                # The pipeline prints per row; that would dominate the timings
+                stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+
+            for name in selected:
+                if name in ("batch", "pipeline", "export", "load"):
+                    result = getattr(self, f"bench_{name}")(options, pin_url)
+                else:
+                    result = getattr(self, f"bench_{name}")(options)
+                report["results"][name] = result
+
+        text = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(text + "\n")
+            for name, result in report["results"].items():
+                runs = result.items() if name in ("pipeline", "export", "load") else [(name, result)]
+                for label, run in runs:
+                    if "mb_per_s" in run:
+                        self.stdout.write(f"{label:10} {run['certificates']} certificates, {run['mb']}MB in "
+                                          f"{run['elapsed_s']}s  {run['mb_per_s']}MB/s  {run['certificates_per_s']}/s")
+                    elif "p50_ms" in run:
+                        self.stdout.write(f"{label:14} p50 {run['p50_ms']}ms  p95 {run['p95_ms']}ms  "
+                                          f"p99 {run['p99_ms']}ms  {run['throughput_per_s']}/s")
+                    else:
+                        self.stdout.write(f"{label:10} {run['rows']} rows in {run['elapsed_s']}s  {run['throughput_per_s']}/s")
+            self.stdout.write(self.style.SUCCESS(f"✅ Report written to {options['output']}"))
+        else:
+            self.stdout.write(text)
+
+    def _render(self, logo, i):
+        return generate_certificate_pdf_local(
+            f"Student {i}", "Computer Science", "Upper Second", "Bench University",
+            logo, "", "2025-01-01", qr_mode="dummy",
+        ).getvalue()
+
+    def bench_render(self, options):
+        return _time_calls(lambda i: self._render(options["logo"], i), options["iterations"], options["warmup"])
+
+    def bench_qr(self, options):
+        # Unique data per call, so qr_runs' cache never answers for it
+        def draw(i):
+            pdf = canvas.Canvas(io.BytesIO(), pagesize=letter)
+            draw_qr(pdf, f"https://verify.example/verify-certificate?reg_number=B{i}&cid=bench{options['seed']}x{i}", 450, 50, 100)
+        return _time_calls(draw, options["iterations"], options["warmup"])
+
+    def bench_overlay(self, options):
+        original = self._render(options["logo"], 0)
+        return _time_calls(
+            lambda i: merge_overlay(original, create_overlay(f"bench{options['seed']}x{i}", f"B{i}")),
+            options["iterations"], options["warmup"],
+        )
+
+    def bench_cid(self, options):
+        original = self._render(options["logo"], 0)
+        return _time_calls(lambda i: compute_cid(original), options["iterations"], options["warmup"])
+
+    @contextlib.contextmanager
+    def batch_environment(self, options, pin_url):
+        # PinataBackend pointed at the mock; yields the institution to issue for
+        with override_settings(
+            PINNING_BACKEND="Base.pinning.PinataBackend", PINATA_API_URL=pin_url,
+            BATCH_PIN_DIRECTORY_SIZE=options["directory_size"],
+        ):
+            from Base.models import PendingInstitution
+
+            reset_pinning_backend()
+            try:
+                institution, _ = PendingInstitution.objects.get_or_create(
+                    name="Bench University",
+                    defaults={
+                        "email": "bench@example.com", "description": "bench_certificates", "approved": True,
+                        "logo": os.path.relpath(options["logo"], settings.MEDIA_ROOT),
+                    },
+                )
+                yield institution
+            finally:
+                reset_pinning_backend()
+
+    def post_batch(self, institution, rows, seed, prefix="B"):
+        """POST a synthetic CSV to the streaming batch upload and time the response.
+
+        ``completed_ms`` percentiles are when that share of rows had been streamed back,
+        measured from the start of the request.
+        """
+        upload = SimpleUploadedFile("bench.csv", _synthetic_csv(rows, seed, prefix), "text/csv")
+        start = time.perf_counter()
+        response = Client().post("/api/batch-upload/", {"institution_id": institution.id, "stream": "1", "file": upload})
+        completed, statuses = [], []
+        lines = csv.reader(chunk.decode() for chunk in response.streaming_content)
+        status_column = next(lines).index("status")
+        for line in lines:
+            completed.append(time.perf_counter() - start)
+            statuses.append(line[status_column])
+        elapsed = time.perf_counter() - start
+
+        ordered = sorted(completed) or [0.0]
+        return {
+            "rows": len(statuses),
+            "succeeded": statuses.count("success"),
+            "elapsed_s": round(elapsed, 3),
+            "throughput_per_s": round(len(statuses) / elapsed, 1) if elapsed else None,
+            "completed_ms": {
+                f"p{int(p * 100)}": round(_percentile(ordered, p) * 1000, 1) for p in (0.50, 0.95, 0.99)
+            },
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+
+    def bench_batch(self, options, pin_url):
+        with self.batch_environment(options, pin_url) as institution:
+            # Untimed warm-up: starts the render worker processes
+            self.post_batch(institution, settings.BATCH_RENDER_WORKERS * 2, options["seed"], prefix="W")
+            result = self.post_batch(institution, options["rows"], options["seed"])
+        result["pin_latency_ms"] = options["pin_latency"]
+        result["endpoints"] = {k: v for k, v in latency_stats().items() if k.startswith("pinata:")}
+        return result
+
+    def bench_pipeline(self, options, pin_url):
+        """The batch benchmark once per render pool type and worker count.
+
+        Each pool is warmed up with a small untimed batch first, so process start-up is not
+        counted. Note peak RSS is the parent process only.
+        """
+        results = {}
+        with self.batch_environment(options, pin_url) as institution:
+            for pool in ("thread", "process"):
+                for workers in options["workers"]:
+                    with override_settings(BATCH_RENDER_POOL=pool, BATCH_RENDER_WORKERS=workers):
+                        reset_render_executor()
+                        try:
+                            self.post_batch(institution, workers * 2, options["seed"], prefix=f"W{pool}{workers}x")
+                            results[f"{pool}-{workers}"] = self.post_batch(
+                                institution, options["rows"], options["seed"], prefix=f"{pool}{workers}x",
+                            )
+                        finally:
+                            reset_render_executor()
+        return results
+
+    def download(self, url, certificates):
+        # Drains a streamed export; the body is counted, never held
+        start = time.perf_counter()
+        response = Client().get(url)
+        size = sum(len(chunk) for chunk in response.streaming_content)
+        elapsed = time.perf_counter() - start
+        return {
+            "certificates": certificates,
+            "mb": round(size / 1e6, 2),
+            "elapsed_s": round(elapsed, 3),
+            "mb_per_s": round(size / 1e6 / elapsed, 1),
+            "certificates_per_s": round(certificates / elapsed, 1),
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+
+    def bench_export(self, options, pin_url):
+        """Download a finished --export-rows job as a ZIP and as a merged PDF.
+
+        The job runs against empty caches, so "cold" downloads stamp every QR (from the
+        rendered bytes the batch cached) and "warm" ones read finalized PDFs straight back.
+        """
+        from Base.models import BatchJob
+
+        with tempfile.TemporaryDirectory() as ipfs_cache, override_settings(IPFS_CACHE_DIR=ipfs_cache), \
+                self.batch_environment(options, pin_url) as institution:
+            upload = SimpleUploadedFile("bench.csv", _synthetic_csv(options["export_rows"], options["seed"], "E"), "text/csv")
+            response = Client().post("/api/batch-upload/", {"institution_id": institution.id, "file": upload})
+            job = BatchJob.objects.get(id=response.json()["job_id"])
+            while job.status not in (BatchJob.DONE, BatchJob.FAILED):
+                time.sleep(0.2)
+                job.refresh_from_db()
+
+            results = {}
+            for export_format in ("zip", "pdf"):
+                # A fresh finalized cache per format, so each gets its own cold run
+                with tempfile.TemporaryDirectory() as finalized_cache, override_settings(FINALIZED_PDF_CACHE_DIR=finalized_cache):
+                    for run in ("cold", "warm"):
+                        results[f"{export_format}-{run}"] = self.download(
+                            f"/api/batch-jobs/{job.id}/export/?format={export_format}", job.done_rows,
+                        )
+        return results
+
+    def bench_load(self, options, pin_url):
+        """Concurrent issue-certificate and update-certificate requests against a single worker.
+
+        The same views under uvicorn (ASGI, one event loop) and under a sync gunicorn worker,
+        which serves one request at a time. Pinata uploads and gateway downloads go to the
+        mock, each taking --pin-latency. Every update run starts a server with empty caches,
+        so each request downloads the metadata and PDF and stamps the QR.
+        """
+        results = {}
+        with self.batch_environment(options, pin_url) as institution, contextlib.ExitStack() as stack:
+            def server(kind):
+                # A fresh IPFS and finalized-PDF cache for every server started
+                return server_process(
+                    kind,
+                    SQLITE_PATH=str(connection.settings_dict["NAME"]),
+                    PINNING_BACKEND="Base.pinning.PinataBackend", PINATA_API_URL=pin_url,
+                    IPFS_GATEWAYS=f"{pin_url}/ipfs/{{cid}}",
+                    IPFS_CACHE_DIR=stack.enter_context(tempfile.TemporaryDirectory()),
+                    FINALIZED_PDF_CACHE_DIR=stack.enter_context(tempfile.TemporaryDirectory()),
+                )
+
+            def issue(prefix):
+                return lambda i: ("POST", "/api/issue-certificate/", {
+                    **next(_synthetic_rows(1, options["seed"] + i, prefix)), "institution_id": institution.id,
+                })
+
+            def run(base_url, concurrency, make_request):
+                # One untimed request first: the worker imports reportlab, PyPDF2... on first use
+                asyncio.run(_load(base_url, 1, 1, issue(f"W{base_url[-5:]}")))
+                return asyncio.run(_load(base_url, options["load_requests"], concurrency, make_request))
+
+            for kind in SERVERS:
+                issued = []
+                with server(kind) as base_url:
+                    for concurrency in options["concurrency"]:
+                        latencies, errors, elapsed, bodies = run(base_url, concurrency, issue(f"L{kind}{concurrency}x"))
+                        issued += [body["ipfs_url"].rsplit("/", 1)[-1] for body in bodies]
+                        results[f"{kind}-issue-c{concurrency}"] = self._load_summary(latencies, errors, elapsed, concurrency)
+
+                for concurrency in options["concurrency"]:
+                    with server(kind) as base_url:
+                        latencies, errors, elapsed, _ = run(base_url, concurrency, lambda i: (
+                            "POST", "/api/update-certificate/", {"new_cid": issued[i % len(issued)]},
+                        ))
+                    results[f"{kind}-update-c{concurrency}"] = self._load_summary(latencies, errors, elapsed, concurrency)
+        return results
+
+    def _load_summary(self, latencies, errors, elapsed, concurrency):
+        result = _summarize(latencies or [0.0])
+        result.update({
+            "concurrency": concurrency,
+            "errors": errors,
+            "elapsed_s": round(elapsed, 3),
+            # Completed requests per second of wall time, not per second of latency
+            "throughput_per_s": round(len(latencies) / elapsed, 1),
+        })
+        return result
@@ -0,0 +1,149 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Max, Q
+from django.test import Client
+from django.urls import reverse
+
+from Base.listing import _listing_version, encode_cursor
+from Base.models import PendingInstitution, normalize_lookup
+from .bench_certificates import _time_calls, test_database
+
+BENCHMARKS = ("lookup", "listing")
+# Roughly what a registration request's description looks like; it dominates unpaginated listings
+DESCRIPTION = "A public university offering undergraduate and postgraduate programmes. " * 8
+
+
+def _seed_institutions(count, seed):
+    # bulk_create skips save(), so the normalized columns are filled in here
+    rng = random.Random(seed)
+    batch = []
+    for i in range(count):
+        name = f"Institution {i:07d}"
+        email = f"Registry{i:07d}@Example.ac"
+        address = "0x" + "".join(rng.choice("0123456789abcdefABCDEF") for _ in range(40))
+        batch.append(PendingInstitution(
+            name=name, email=email, description=DESCRIPTION, logo="logos/bench.png", ethereum_address=address,
+            approved=i % 2 == 0,
+            name_normalized=normalize_lookup(name), email_normalized=normalize_lookup(email),
+            ethereum_address_normalized=normalize_lookup(address),
+        ))
+        if len(batch) == 5000:
+            PendingInstitution.objects.bulk_create(batch)
+            batch = []
+    PendingInstitution.objects.bulk_create(batch)
+
+
+class Command(BaseCommand):
+    help = "Benchmark institution lookups against a seeded table, before and after the normalized indexes; reports JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--only", action="append", choices=BENCHMARKS, help="Run only these benchmarks (repeatable)")
+        parser.add_argument("--institutions", type=int, default=100_000, help="Rows seeded into the institution table")
+        parser.add_argument("--iterations", type=int, default=200, help="Timed calls per query")
+        parser.add_argument("--warmup", type=int, default=10, help="Untimed calls before each query")
+        parser.add_argument("--full-iterations", type=int, default=3,
+                            help="Timed calls of the unpaginated listing, which is far slower than a page")
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        selected = options["only"] or BENCHMARKS
+        report = {"options": {k: options[k] for k in ("institutions", "iterations", "warmup", "full_iterations", "seed")}, "results": {}}
+        with test_database():
+            _seed_institutions(options["institutions"], options["seed"])
+            for name in selected:
+                report["results"][name] = getattr(self, f"bench_{name}")(options)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def bench_lookup(self, options):
+        """get_institution_by_address and the registration duplicate check, as they were and are.
+
+        Lookups use mixed case, as wallets send checksummed addresses, and alternate between
+        hits and misses. The institution cache is bypassed: these are the queries behind it.
+        """
+        rng = random.Random(options["seed"])
+        rows = list(PendingInstitution.objects.values_list("name", "email", "ethereum_address"))
+        probes = [rng.choice(rows) if i % 2 else
+                  (f"Missing {i}", f"missing{i}@example.ac", "0x" + "0" * 39 + str(i % 10))
+                  for i in range(64)]
+
+        def probe(i):
+            name, email, address = probes[i % len(probes)]
+            return name.upper(), email.upper(), address.upper()
+
+        def address_iexact(i):
+            _, _, address = probe(i)
+            PendingInstitution.objects.filter(ethereum_address__iexact=address).first()
+
+        def address_normalized(i):
+            _, _, address = probe(i)
+            PendingInstitution.objects.filter(
+                ethereum_address_normalized=normalize_lookup(address)
+            ).values("id", "name").first()
+
+        def duplicate_iexact(i):
+            name, email, address = probe(i)
+            (PendingInstitution.objects.filter(name__iexact=name).exists()
+             or PendingInstitution.objects.filter(email__iexact=email).exists()
+             or PendingInstitution.objects.filter(ethereum_address__iexact=address).exists())
+
+        def duplicate_normalized(i):
+            # The single OR query register_institution_request runs
+            name, email, address = probe(i)
+            list(PendingInstitution.objects.filter(
+                Q(name_normalized=normalize_lookup(name)) | Q(email_normalized=normalize_lookup(email))
+                | Q(ethereum_address_normalized=normalize_lookup(address))
+            ).values_list("name_normalized", "email_normalized", "ethereum_address_normalized"))
+
+        return {
+            name: _time_calls(fn, options["iterations"], options["warmup"])
+            for name, fn in (
+                ("address_iexact", address_iexact),
+                ("address_normalized", address_normalized),
+                ("duplicate_iexact", duplicate_iexact),
+                ("duplicate_normalized", duplicate_normalized),
+            )
+        }
+
+    def bench_listing(self, options):
+        """approved_institutions through the test client: unpaginated, keyset pages, a 304.
+
+        Also times the listing version behind the ETag against the count + Max(updated_at)
+        aggregate it replaced.
+        """
+        client = Client()
+        url = reverse("approved-institutions")
+        approved = PendingInstitution.objects.filter(approved=True, revoked=False)
+        middle = approved.order_by("submitted_at", "id")[approved.count() // 2]
+        deep = f"{url}?limit=50&cursor={encode_cursor(middle)}"
+        sizes = {}
+
+        def get(label, path, **headers):
+            def call(i):
+                response = client.get(path, **headers)
+                sizes[label] = (response.status_code, len(response.content))
+            return call
+
+        etag = client.get(url + "?limit=50")["ETag"]
+        runs = [
+            ("page_1", get("page_1", url + "?limit=50"), options["iterations"]),
+            ("page_middle", get("page_middle", deep), options["iterations"]),
+            ("page_fields", get("page_fields", url + "?limit=50&fields=id,name"), options["iterations"]),
+            ("revalidate_304", get("revalidate_304", url + "?limit=50", HTTP_IF_NONE_MATCH=etag), options["iterations"]),
+            ("unpaginated", get("unpaginated", url), options["full_iterations"]),
+        ]
+        results = {}
+        for label, call, iterations in runs:
+            results[label] = _time_calls(call, iterations, min(options["warmup"], iterations))
+            results[label]["status"], results[label]["bytes"] = sizes[label]
+
+        class Request:
+            pass
+
+        results["etag_version"] = _time_calls(
+            lambda i: _listing_version(Request()), options["iterations"], options["warmup"])
+        results["etag_count_aggregate"] = _time_calls(
+            lambda i: PendingInstitution.objects.aggregate(count=Count("id"), updated=Max("updated_at")),
+            options["iterations"], options["warmup"])
+        return results
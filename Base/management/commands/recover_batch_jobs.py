@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from Base.batch_jobs import recover_batch_jobs, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Requeue batch jobs orphaned by a dead process, then run every pending job to completion here"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stale-after", type=int, default=settings.BATCH_JOB_STALE_SECONDS,
+                            help="Seconds without a heartbeat after which a RUNNING job counts as orphaned")
+        parser.add_argument("--requeue-only", action="store_true",
+                            help="Only reset orphaned jobs to pending; a web process resumes them")
+
+    def handle(self, *args, **options):
+        if options["requeue_only"]:
+            requeued = requeue_stale_jobs(options["stale_after"])
+            self.stdout.write(f"Requeued {len(requeued)} job(s): {requeued}")
+            return
+
+        futures = recover_batch_jobs(options["stale_after"])
+        self.stdout.write(f"Running {len(futures)} pending job(s): {list(futures)}")
+        for job_id, future in futures.items():
+            future.result()
+            self.stdout.write(f"Job {job_id} finished")
@@ -0,0 +1,190 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from asgiref.sync import iscoroutinefunction
+
+from .gateway_fetch import get_gateway_fetcher
+from .http_client import latency_stats
+from .institution_cache import institution_cache
+from .ipfs_cache import get_cid_cache, get_finalized_cache
+from .logo_cache import logo_cache
+
+# Histogram upper bounds in seconds (Prometheus "le"); anything slower lands in +Inf
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        # -> [(le, observations <= le)], ending with +Inf
+        total = 0
+        out = []
+        for le, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            out.append((le, total))
+        return out
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+# Per-request list of (stage, seconds), set by @server_timing; None outside such a request
+_request_timings = ContextVar("request_timings", default=None)
+
+
+def observe(name, elapsed):
+    with _histograms_lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(elapsed)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, elapsed))
+
+
+@contextmanager
+def stage(name):
+    """Time the block as pipeline stage ``name`` (render, qr, pin-file, merge...).
+
+    Works in sync and async code, and as a decorator on sync functions; failures are timed too.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def server_timing_header(timings):
+    # Repeated stages (e.g. two gateway fetches) are summed, in order of first appearance
+    totals = {}
+    for name, elapsed in timings:
+        totals[name] = totals.get(name, 0.0) + elapsed
+    return ", ".join(f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in totals.items())
+
+
+def server_timing(view):
+    # Adds a Server-Timing header listing the stages the view went through, plus "total".
+    # Sync or async views; sync_to_async copies the context, so worker-thread stages count too
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            timings = []
+            token = _request_timings.set(timings)
+            start = time.perf_counter()
+            try:
+                response = await view(request, *args, **kwargs)
+            finally:
+                _request_timings.reset(token)
+            return _with_server_timing(response, timings, start)
+    else:
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            timings = []
+            token = _request_timings.set(timings)
+            start = time.perf_counter()
+            try:
+                response = view(request, *args, **kwargs)
+            finally:
+                _request_timings.reset(token)
+            return _with_server_timing(response, timings, start)
+    return wrapped
+
+
+def _with_server_timing(response, timings, start):
+    timings.append(("total", time.perf_counter() - start))
+    response["Server-Timing"] = server_timing_header(timings)
+    return response
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def _value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def metric(name, kind, help_text, samples):
+    """Prometheus text lines for one metric; ``samples`` is a list of (labels dict, value)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels)} {_value(value)}")
+    return lines
+
+
+def stage_metrics():
+    with _histograms_lock:
+        snapshot = {
+            name: (h.cumulative(), h.sum, h.count) for name, h in sorted(_histograms.items())
+        }
+    name = "certificate_stage_duration_seconds"
+    lines = [
+        f"# HELP {name} Time spent in each certificate pipeline stage",
+        f"# TYPE {name} histogram",
+    ]
+    for stage_name, (buckets, total, count) in snapshot.items():
+        for le, cumulative in buckets:
+            lines.append(f"{name}_bucket{_labels({'stage': stage_name, 'le': _value(le)})} {cumulative}")
+        lines.append(f"{name}_sum{_labels({'stage': stage_name})} {_value(total)}")
+        lines.append(f"{name}_count{_labels({'stage': stage_name})} {count}")
+    return lines
+
+
+def render_metrics():
+    """Everything /metrics exposes, in Prometheus text format: stage histograms plus the
+    counters the caches, HTTP clients and gateway fetcher already keep."""
+    lines = stage_metrics()
+
+    caches = [("ipfs", get_cid_cache().stats()), ("finalized", get_finalized_cache().stats()),
+              ("logos", logo_cache.stats())]
+    lines += metric("certificate_cache_hits_total", "counter", "Cache lookups answered from the cache",
+                    [({"cache": name}, s["hits"]) for name, s in caches]
+                    + [({"cache": "institutions"}, institution_cache.stats()["hits"])])
+    lines += metric("certificate_cache_misses_total", "counter", "Cache lookups that had to load the value",
+                    [({"cache": name}, s["misses"]) for name, s in caches]
+                    + [({"cache": "institutions"}, institution_cache.stats()["misses"])])
+    lines += metric("certificate_cache_evictions_total", "counter", "Entries removed to stay under the size limit",
+                    [({"cache": name}, s["evictions"]) for name, s in caches])
+    lines += metric("certificate_cache_bytes", "gauge", "Bytes currently held (on disk; decoded in memory for logos)",
+                    [({"cache": name}, s["bytes"]) for name, s in caches])
+
+    endpoints = latency_stats()
+    lines += metric("certificate_http_requests_total", "counter", "Outbound HTTP requests by endpoint",
+                    [({"endpoint": e}, s["count"]) for e, s in endpoints.items()])
+    lines += metric("certificate_http_errors_total", "counter", "Outbound HTTP requests that failed",
+                    [({"endpoint": e}, s["errors"]) for e, s in endpoints.items()])
+    lines += metric("certificate_http_retries_total", "counter", "Outbound HTTP retries",
+                    [({"endpoint": e}, s["retries"]) for e, s in endpoints.items()])
+    lines += metric("certificate_http_latency_p95_seconds", "gauge", "p95 latency over the last requests",
+                    [({"endpoint": e}, s["p95_ms"] / 1000) for e, s in endpoints.items()])
+
+    gateways = get_gateway_fetcher().health_stats()
+    lines += metric("certificate_gateway_score", "gauge", "Gateway ranking score (lower is preferred)",
+                    [({"gateway": g}, s["score"]) for g, s in gateways.items()])
+    lines += metric("certificate_gateway_latency_seconds", "gauge", "Smoothed gateway latency",
+                    [({"gateway": g}, s["latency_ms"] / 1000) for g, s in gateways.items()])
+    lines += metric("certificate_gateway_error_rate", "gauge", "Smoothed gateway error rate",
+                    [({"gateway": g}, s["error_rate"]) for g, s in gateways.items()])
+    return "\n".join(lines) + "\n"
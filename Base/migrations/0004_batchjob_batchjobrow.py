@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Base', '0003_certificate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('total_rows', models.PositiveIntegerField(default=0)),
+                ('done_rows', models.PositiveIntegerField(default=0)),
+                ('failed_rows', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('institution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batch_jobs', to='Base.pendinginstitution')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BatchJobRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_index', models.PositiveIntegerField()),
+                ('student_name', models.CharField(blank=True, max_length=100)),
+                ('student_surname', models.CharField(blank=True, max_length=100)),
+                ('reg_number', models.CharField(blank=True, max_length=20)),
+                ('course', models.CharField(blank=True, max_length=200)),
+                ('degree_class', models.CharField(blank=True, max_length=100)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('success', 'Success'), ('error', 'Error')], default='pending', max_length=10)),
+                ('cid', models.CharField(blank=True, max_length=100)),
+                ('error', models.TextField(blank=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='Base.batchjob')),
+            ],
+            options={
+                'ordering': ['row_index'],
+                'unique_together': {('job', 'row_index')},
+            },
+        ),
+    ]
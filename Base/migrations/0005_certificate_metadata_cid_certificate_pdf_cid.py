@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Base', '0004_batchjob_batchjobrow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificate',
+            name='metadata_cid',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='certificate',
+            name='pdf_cid',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+def populate_normalized(apps, schema_editor):
+    PendingInstitution = apps.get_model('Base', 'PendingInstitution')
+    for institution in PendingInstitution.objects.all().iterator():
+        # Blank values stay NULL so they never clash under the unique constraints
+        name = (institution.name or '').strip().lower()
+        email = (institution.email or '').strip().lower()
+        address = (institution.ethereum_address or '').strip().lower()
+        PendingInstitution.objects.filter(pk=institution.pk).update(
+            name_normalized=name or None,
+            email_normalized=email or None,
+            ethereum_address_normalized=address or None,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Base', '0005_certificate_metadata_cid_certificate_pdf_cid'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='certificate',
+            name='student_regNumber',
+            field=models.CharField(db_index=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='pendinginstitution',
+            name='name_normalized',
+            field=models.CharField(editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='pendinginstitution',
+            name='email_normalized',
+            field=models.CharField(editable=False, max_length=254, null=True),
+        ),
+        migrations.AddField(
+            model_name='pendinginstitution',
+            name='ethereum_address_normalized',
+            field=models.CharField(editable=False, max_length=42, null=True),
+        ),
+        migrations.RunPython(populate_normalized, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='pendinginstitution',
+            name='name_normalized',
+            field=models.CharField(editable=False, max_length=255, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='pendinginstitution',
+            name='email_normalized',
+            field=models.CharField(editable=False, max_length=254, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='pendinginstitution',
+            name='ethereum_address_normalized',
+            field=models.CharField(editable=False, max_length=42, null=True, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='pendinginstitution',
+            index=models.Index(fields=['approved', 'revoked', 'submitted_at'], name='institution_status_idx'),
+        ),
+    ]
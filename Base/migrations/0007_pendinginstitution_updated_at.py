@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Base', '0006_normalized_lookups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendinginstitution',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='pendinginstitution',
+            index=models.Index(fields=['approved', 'submitted_at', 'id'], name='institution_queue_idx'),
+        ),
+    ]
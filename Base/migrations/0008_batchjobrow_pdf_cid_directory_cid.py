@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Base', '0007_pendinginstitution_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batchjobrow',
+            name='directory_cid',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='batchjobrow',
+            name='pdf_cid',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Base', '0008_batchjobrow_pdf_cid_directory_cid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batchjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,5 +1,11 @@
 from django.db import models
 
+def normalize_lookup(value):
+    # Case-insensitive matching happens on these lower-cased copies, so plain indexes apply
+    value = (value or "").strip().lower()
+    return value or None
+
+
 class PendingInstitution(models.Model):
     name = models.CharField(max_length=255)
     email = models.EmailField()
@@ -9,6 +15,31 @@ class PendingInstitution(models.Model):
     submitted_at = models.DateTimeField(auto_now_add=True)
     approved = models.BooleanField(default=False)
     revoked = models.BooleanField(default=False) 
+    # Bumped on every save; drives ETag/Last-Modified on the institution listings
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    # Kept in sync by save()
+    # NULL, not "", when the source is blank, so blank values never clash under unique
+    name_normalized = models.CharField(max_length=255, unique=True, null=True, editable=False)
+    email_normalized = models.CharField(max_length=254, unique=True, null=True, editable=False)
+    ethereum_address_normalized = models.CharField(max_length=42, unique=True, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["approved", "revoked", "submitted_at"], name="institution_status_idx"),
+            models.Index(fields=["approved", "submitted_at", "id"], name="institution_queue_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.name_normalized = normalize_lookup(self.name)
+        self.email_normalized = normalize_lookup(self.email)
+        self.ethereum_address_normalized = normalize_lookup(self.ethereum_address)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = set(update_fields) | {
+                "name_normalized", "email_normalized", "ethereum_address_normalized", "updated_at"
+            }
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -17,11 +48,85 @@ class PendingInstitution(models.Model):
 
 class Certificate(models.Model):
     student_name = models.CharField(max_length=100)
-    student_regNumber = models.CharField(max_length=20)
+    student_regNumber = models.CharField(max_length=20, db_index=True)
     student_surname = models.CharField(max_length=100)
     course = models.CharField(max_length=200)
     degree_class = models.CharField(max_length=100)
     date_issued = models.DateTimeField(auto_now_add=True)
+    # IPFS CIDs returned by Pinata, so lookups never have to go back to IPFS
+    metadata_cid = models.CharField(max_length=100, blank=True)
+    pdf_cid = models.CharField(max_length=100, blank=True)
+
+    def __str__(self):
+        return f"{self.student_name} {self.student_surname} - {self.course}"
+
+class BatchJob(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    institution = models.ForeignKey(PendingInstitution, on_delete=models.CASCADE, related_name="batch_jobs")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    total_rows = models.PositiveIntegerField(default=0)
+    done_rows = models.PositiveIntegerField(default=0)
+    failed_rows = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    # Bumped whenever a running job records results; a RUNNING job whose heartbeat goes stale
+    # was orphaned by a dead process and is requeued (see batch_jobs.requeue_stale_jobs)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Batch {self.id} ({self.status}) - {self.institution}"
+
+
+class BatchJobRow(models.Model):
+    PENDING = "pending"
+    SUCCESS = "success"
+    ERROR = "error"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SUCCESS, "Success"),
+        (ERROR, "Error"),
+    ]
+
+    job = models.ForeignKey(BatchJob, on_delete=models.CASCADE, related_name="rows")
+    row_index = models.PositiveIntegerField()
+    student_name = models.CharField(max_length=100, blank=True)
+    student_surname = models.CharField(max_length=100, blank=True)
+    reg_number = models.CharField(max_length=20, blank=True)
+    course = models.CharField(max_length=200, blank=True)
+    degree_class = models.CharField(max_length=100, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    cid = models.CharField(max_length=100, blank=True)
+    pdf_cid = models.CharField(max_length=100, blank=True)
+    # Set when the row was pinned as part of a wrapped directory (BATCH_PIN_DIRECTORY_SIZE)
+    directory_cid = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["row_index"]
+        unique_together = [("job", "row_index")]
+
+    def as_entry(self):
+        # Same dict shape as a csv.DictReader row, plus the row id for writing the result back
+        return {
+            "row_id": self.id,
+            "student_name": self.student_name,
+            "student_surname": self.student_surname,
+            "reg_number": self.reg_number,
+            "course": self.course,
+            "degree_class": self.degree_class,
+        }
 
     def __str__(self):
-        return f"{self.student_name} {self.student_surname} - {self.course}"
\ No newline at end of file
+        return f"{self.job_id}#{self.row_index} {self.reg_number} ({self.status})"
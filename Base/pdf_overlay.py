@@ -0,0 +1,125 @@
+import io, re, zlib
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import ArrayObject, EncodedStreamObject, IndirectObject, NameObject
+
+STARTXREF_PATTERN = re.compile(rb"startxref\s+(\d+)\s+%%EOF\s*$")
+# Wrapped around page 1's own content so its graphics state cannot leak into the overlay
+SAVE_STATE = b"q\n"
+RESTORE_STATE = b"Q\n"
+
+
+def _stream_object(number, data):
+    compressed = zlib.compress(data)
+    return (
+        b"%d 0 obj\n<< /Length %d /Filter /FlateDecode >>\nstream\n" % (number, len(compressed))
+        + compressed + b"\nendstream\nendobj\n"
+    )
+
+
+def _serialize(obj):
+    buffer = io.BytesIO()
+    obj.write_to_stream(buffer, None)
+    return buffer.getvalue()
+
+
+def _xref_section(offsets):
+    # offsets: {object number: (generation, byte offset)}, grouped into contiguous subsections
+    lines = [b"xref\n"]
+    numbers = sorted(offsets)
+    start = 0
+    while start < len(numbers):
+        end = start
+        while end + 1 < len(numbers) and numbers[end + 1] == numbers[end] + 1:
+            end += 1
+        lines.append(b"%d %d\n" % (numbers[start], end - start + 1))
+        for number in numbers[start:end + 1]:
+            generation, offset = offsets[number]
+            lines.append(b"%010d %05d n\r\n" % (offset, generation))
+        start = end + 1
+    return b"".join(lines)
+
+
+def _page_contents(page):
+    # /Contents may be missing, a single stream reference or an array of them
+    if "/Contents" not in page:
+        return []
+    contents = page.raw_get("/Contents")
+    if isinstance(contents, IndirectObject) and isinstance(contents.get_object(), ArrayObject):
+        contents = contents.get_object()
+    return list(contents) if isinstance(contents, ArrayObject) else [contents]
+
+
+def _first_page(reader):
+    # Walk the page tree straight down to page 1; reader.pages would load every page
+    page_ref = reader.trailer["/Root"].raw_get("/Pages")
+    node = page_ref.get_object()
+    while node.get("/Type") == "/Pages":
+        page_ref = next(
+            kid for kid in node["/Kids"]
+            if kid.get_object().get("/Type") == "/Page" or kid.get_object().get("/Count", 0) > 0
+        )
+        node = page_ref.get_object()
+    return page_ref, node
+
+
+def _append_update(pdf_bytes, startxref, reader, overlay):
+    """Incremental update: a new page-1 dictionary and two small content streams appended
+    after the untouched original bytes. Pages 2..n are never parsed or re-serialized."""
+    page_ref, page = _first_page(reader)
+    size = int(reader.trailer["/Size"])
+    save_number, overlay_number = size, size + 1
+
+    page[NameObject("/Contents")] = ArrayObject(
+        [IndirectObject(save_number, 0, reader)]
+        + _page_contents(page)
+        + [IndirectObject(overlay_number, 0, reader)]
+    )
+
+    out = io.BytesIO()
+    out.write(pdf_bytes)
+    if not pdf_bytes.endswith(b"\n"):
+        out.write(b"\n")
+
+    offsets = {save_number: (0, out.tell())}
+    out.write(_stream_object(save_number, SAVE_STATE))
+    offsets[overlay_number] = (0, out.tell())
+    out.write(_stream_object(overlay_number, RESTORE_STATE + overlay))
+    offsets[page_ref.idnum] = (page_ref.generation, out.tell())
+    out.write(b"%d %d obj\n" % (page_ref.idnum, page_ref.generation) + _serialize(page) + b"\nendobj\n")
+
+    xref_offset = out.tell()
+    out.write(_xref_section(offsets))
+    trailer = [b"/Size %d" % (size + 2), b"/Prev %d" % startxref]
+    for key in ("/Root", "/Info", "/ID"):
+        if key in reader.trailer:
+            trailer.append(key.encode() + b" " + _serialize(reader.trailer.raw_get(key)))
+    out.write(b"trailer\n<< " + b" ".join(trailer) + b" >>\n")
+    out.write(b"startxref\n%d\n%%%%EOF\n" % xref_offset)
+    return out.getvalue()
+
+
+def _rewrite(reader, overlay):
+    # Fallback for PDFs an incremental update cannot safely extend (xref streams, encryption)
+    writer = PdfWriter()
+    for i, page in enumerate(reader.pages):
+        page = writer.add_page(page)
+        if i == 0:
+            stream = EncodedStreamObject()
+            stream._data = zlib.compress(SAVE_STATE + page.get_contents().get_data() + RESTORE_STATE + overlay)
+            stream[NameObject("/Filter")] = NameObject("/FlateDecode")
+            page[NameObject("/Contents")] = writer._add_object(stream)
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def overlay_first_page(pdf_bytes, overlay):
+    """Return ``pdf_bytes`` with the content-stream operators ``overlay`` drawn over page 1."""
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    match = STARTXREF_PATTERN.search(pdf_bytes[-1024:])
+    if match and not reader.is_encrypted:
+        startxref = int(match.group(1))
+        # Only extend classic xref tables; PDF 1.5 xref streams take the rewrite path
+        if pdf_bytes[startxref:startxref + 4] == b"xref":
+            return _append_update(pdf_bytes, startxref, reader, overlay)
+    return _rewrite(reader, overlay)
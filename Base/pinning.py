@@ -0,0 +1,234 @@
+import json
+import os
+import tempfile
+import threading
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .http_client import get_http_client, get_async_http_client
+from .gateway_fetch import fetch_from_gateways, get_gateway_fetcher
+from .ipfs_cid import compute_cid, compute_directory_cids
+from .ipfs_cache import CID_PATTERN
+
+PINATA_GATEWAY = "https://gateway.pinata.cloud/ipfs"
+# Pin as CIDv0, the version compute_cid/compute_directory_cids predict by default
+PINATA_OPTIONS = json.dumps({"cidVersion": 0})
+
+
+class DirectoryMismatch(Exception):
+    """The pinned directory's CID is not the one computed locally, so neither are its file CIDs."""
+
+
+def metadata_json_bytes(metadata: dict) -> bytes:
+    # Compact, key-order-preserving: the same bytes JSON.stringify produces on Pinata's side,
+    # so compute_cid() on them matches the CID Pinata returns
+    return json.dumps(metadata, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _as_bytes(content):
+    # Uploads accept bytes or an in-memory file (BytesIO)
+    if hasattr(content, "getvalue"):
+        return content.getvalue()
+    if hasattr(content, "read"):
+        return content.read()
+    return content
+
+
+class PinningBackend:
+    """Where certificate PDFs and metadata are pinned and read back from.
+
+    ``pin_file``/``pin_json`` return the public URL of the pinned content (its last path
+    segment is the CID); ``fetch`` returns the bytes stored under a CID.
+    ``pin_directory`` pins many files at once and returns
+    ``(directory CID, {filename: file CID})``; every file stays retrievable by its own CID.
+    Each has an ``_async`` twin; the defaults run the sync method on a worker thread.
+    """
+
+    def url(self, cid):
+        raise NotImplementedError
+
+    def pin_file(self, content, filename="certificate.pdf"):
+        raise NotImplementedError
+
+    def pin_json(self, metadata):
+        raise NotImplementedError
+
+    def fetch(self, cid, validate=None):
+        raise NotImplementedError
+
+    def pin_directory(self, name, files):
+        # Fallback: one pin per file; the directory CID is computed but nothing is pinned under it
+        directory_cid, _ = compute_directory_cids(files)
+        return directory_cid, {
+            filename: self.pin_file(content, filename).rsplit("/", 1)[-1]
+            for filename, content in files.items()
+        }
+
+    async def pin_directory_async(self, name, files):
+        return await sync_to_async(self.pin_directory, thread_sensitive=False)(name, files)
+
+    async def pin_file_async(self, content, filename="certificate.pdf"):
+        return await sync_to_async(self.pin_file, thread_sensitive=False)(content, filename)
+
+    async def pin_json_async(self, metadata):
+        return await sync_to_async(self.pin_json, thread_sensitive=False)(metadata)
+
+    async def fetch_async(self, cid, validate=None):
+        return await sync_to_async(self.fetch, thread_sensitive=False)(cid, validate)
+
+
+class PinataBackend(PinningBackend):
+    def __init__(self, jwt=None, api_url=None):
+        self.jwt = jwt or settings.PINATA_JWT
+        api_url = (api_url or settings.PINATA_API_URL).rstrip("/")
+        self.file_url = f"{api_url}/pinning/pinFileToIPFS"
+        self.json_url = f"{api_url}/pinning/pinJSONToIPFS"
+
+    def url(self, cid):
+        return f"{PINATA_GATEWAY}/{cid}"
+
+    def _gateway_url(self, response, error_prefix):
+        if response.status_code == 200:
+            return self.url(response.json()["IpfsHash"])
+        else:
+            raise Exception(f"{error_prefix}: {response.text}")
+
+    def pin_file(self, content, filename="certificate.pdf"):
+        # content is the in-memory PDF (bytes or a file-like object) - nothing touches disk
+        headers = {"Authorization": f"{self.jwt}"}
+        files = {'file': (filename, content, "application/pdf")}
+        response = get_http_client().post(self.file_url, endpoint="pinata:pinFileToIPFS", headers=headers, files=files)
+        return self._gateway_url(response, "Pinata upload failed")
+
+    async def pin_file_async(self, content, filename="certificate.pdf"):
+        headers = {"Authorization": f"{self.jwt}"}
+        files = {'file': (filename, content, "application/pdf")}
+        response = await get_async_http_client().post(self.file_url, endpoint="pinata:pinFileToIPFS", headers=headers, files=files)
+        return self._gateway_url(response, "Pinata upload failed")
+
+    def pin_json(self, metadata):
+        headers = {"Authorization": self.jwt, "Content-Type": "application/json"}
+        response = get_http_client().post(self.json_url, endpoint="pinata:pinJSONToIPFS", headers=headers, data=metadata_json_bytes(metadata))
+        return self._gateway_url(response, "Pinata JSON upload failed")
+
+    async def pin_json_async(self, metadata):
+        headers = {"Authorization": self.jwt, "Content-Type": "application/json"}
+        response = await get_async_http_client().post(self.json_url, endpoint="pinata:pinJSONToIPFS", headers=headers, data=metadata_json_bytes(metadata))
+        return self._gateway_url(response, "Pinata JSON upload failed")
+
+    def fetch(self, cid, validate=None):
+        # Hedged across IPFS_GATEWAYS (see gateway_fetch)
+        return fetch_from_gateways(cid, validate)
+
+    async def fetch_async(self, cid, validate=None):
+        # Straight on the caller's loop and its shared client, no loop of its own
+        return await get_gateway_fetcher().fetch(cid, validate)
+
+    def _directory_request(self, name, files):
+        # One multipart request; the shared "<name>/" prefix makes Pinata pin them as one folder
+        # and return the folder's CID
+        headers = {"Authorization": f"{self.jwt}"}
+        fields = [("file", (f"{name}/{filename}", content)) for filename, content in sorted(files.items())]
+        fields += [("pinataOptions", (None, PINATA_OPTIONS)), ("pinataMetadata", (None, json.dumps({"name": name})))]
+        return headers, fields
+
+    def _directory_cids(self, response, files):
+        if response.status_code != 200:
+            raise Exception(f"Pinata directory upload failed: {response.text}")
+        directory_cid, file_cids = compute_directory_cids(files)
+        pinned = response.json()["IpfsHash"]
+        if pinned != directory_cid:
+            # The per-file CIDs are only known to be right when the folder CID matches
+            raise DirectoryMismatch(f"Pinned directory {pinned} does not match the predicted {directory_cid}")
+        return directory_cid, file_cids
+
+    def pin_directory(self, name, files):
+        headers, fields = self._directory_request(name, files)
+        response = get_http_client().post(self.file_url, endpoint="pinata:pinFileToIPFS:directory", headers=headers, files=fields)
+        return self._directory_cids(response, files)
+
+    async def pin_directory_async(self, name, files):
+        headers, fields = self._directory_request(name, files)
+        response = await get_async_http_client().post(self.file_url, endpoint="pinata:pinFileToIPFS:directory", headers=headers, files=fields)
+        return self._directory_cids(response, files)
+
+
+class LocalBackend(PinningBackend):
+    """Content-addressed store on local disk, for offline runs and benchmarks.
+
+    Files are named by the same CID IPFS would give them (ipfs_cid.compute_cid) and served
+    back by the ``ipfs/<cid>`` view, so the issue/verify pipeline works without Pinata.
+    """
+
+    def __init__(self, root=None, base_url=None):
+        self.root = root or settings.LOCAL_PINNING_ROOT
+        self.base_url = (base_url or settings.LOCAL_PINNING_URL).rstrip("/")
+        os.makedirs(self.root, exist_ok=True)
+
+    def url(self, cid):
+        return f"{self.base_url}/{cid}"
+
+    def path(self, cid):
+        if not CID_PATTERN.match(cid or ""):
+            raise ValueError(f"Invalid CID: {cid!r}")
+        return os.path.join(self.root, cid)
+
+    def pin(self, content):
+        cid = compute_cid(content)
+        path = self.path(cid)
+        if not os.path.exists(path):
+            # Same CID means same bytes, so an existing file never needs rewriting
+            fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=self.root)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return cid
+
+    def pin_file(self, content, filename="certificate.pdf"):
+        return self.url(self.pin(_as_bytes(content)))
+
+    def pin_json(self, metadata):
+        return self.url(self.pin(metadata_json_bytes(metadata)))
+
+    def pin_directory(self, name, files):
+        directory_cid, file_cids = compute_directory_cids(files)
+        for content in files.values():
+            self.pin(content)
+        return directory_cid, file_cids
+
+    def fetch(self, cid, validate=None):
+        try:
+            with open(self.path(cid), "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            raise Exception(f"{cid} is not in the local pinning store")
+        if validate is not None:
+            validate(content)
+        return content
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_pinning_backend():
+    # PINNING_BACKEND is a dotted path, e.g. "Base.pinning.LocalBackend"
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.PINNING_BACKEND)()
+    return _backend
+
+
+def reset_pinning_backend():
+    # Picks up changed settings (tests, bench_certificates) on the next get_pinning_backend()
+    global _backend
+    with _backend_lock:
+        _backend = None
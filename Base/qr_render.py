@@ -0,0 +1,63 @@
+from functools import lru_cache
+import qrcode
+
+DUMMY_QR_DATA = "DUMMY"
+
+
+@lru_cache(maxsize=256)
+def qr_runs(data):
+    """Return (module_count, runs) for ``data``; each run is a horizontal strip of dark modules.
+
+    Same version/error-correction/border as ``qrcode.make`` so the code looks identical.
+    The constant dummy QR is therefore only ever built once per process.
+    """
+    qr = qrcode.QRCode()
+    qr.add_data(data)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+
+    runs = []
+    for row, modules in enumerate(matrix):
+        col = 0
+        while col < len(modules):
+            if modules[col]:
+                start = col
+                while col < len(modules) and modules[col]:
+                    col += 1
+                runs.append((row, start, col - start))
+            else:
+                col += 1
+    return len(matrix), tuple(runs)
+
+
+def draw_qr(pdf, data, x, y, size):
+    # Vector QR: dark modules become filled rects, no raster image and no temp file.
+    # The white square (symbol plus quiet zone) hides whatever is underneath, as the opaque
+    # PNG this replaced did - the real QR is drawn over the dummy one
+    count, runs = qr_runs(data)
+    module = size / count
+    top = y + size
+
+    pdf.saveState()
+    pdf.setFillColorRGB(1, 1, 1)
+    pdf.rect(x, y, size, size, stroke=0, fill=1)
+    pdf.setFillColorRGB(0, 0, 0)
+    path = pdf.beginPath()
+    for row, col, length in runs:
+        path.rect(x + col * module, top - (row + 1) * module, length * module, module)
+    pdf.drawPath(path, stroke=0, fill=1)
+    pdf.restoreState()
+
+
+def qr_content_stream(data, x, y, size):
+    """Raw PDF content-stream operators for the same QR ``draw_qr`` draws, without a canvas."""
+    count, runs = qr_runs(data)
+    module = size / count
+    top = y + size
+    ops = [b"q 1 1 1 rg %.4f %.4f %.4f %.4f re f 0 0 0 rg" % (x, y, size, size)]
+    for row, col, length in runs:
+        ops.append(b"%.4f %.4f %.4f %.4f re" % (
+            x + col * module, top - (row + 1) * module, length * module, module
+        ))
+    ops.append(b"f Q\n")
+    return b"\n".join(ops)
@@ -0,0 +1,20 @@
+import os
+import time
+import django
+
+# Entry points for the batch render process pool (batch_engine.get_render_executor).
+# Kept free of model imports so a freshly spawned worker can unpickle them before Django is set up.
+
+
+def init_worker():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    django.setup()
+
+
+def render(entry, institution_name, institution_logo, date_issued):
+    # -> (filename, PDF bytes, seconds spent rendering); bytes rather than a BytesIO to keep pickling cheap
+    from .helper import render_entry  # helper imports the models, so only after init_worker
+
+    start = time.perf_counter()
+    filename, pdf_buffer = render_entry(entry, institution_name, institution_logo, date_issued)
+    return filename, pdf_buffer.getvalue(), time.perf_counter() - start
@@ -5,3 +5,11 @@ class PendingInstitutionSerializer(serializers.ModelSerializer):
     class Meta:
         model = PendingInstitution
         fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        # Optional sparse fieldset, e.g. fields=["id", "name"]
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
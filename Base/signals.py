@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import PendingInstitution
+from .institution_cache import institution_cache
+from .listing import record_listing_delete
+
+
+@receiver(pre_save, sender=PendingInstitution)
+def remember_previous_address(sender, instance, **kwargs):
+    # If the address itself is edited, the entry under the old address must go too
+    instance._previous_address = None
+    if instance.pk:
+        instance._previous_address = (
+            PendingInstitution.objects.filter(pk=instance.pk)
+            .values_list("ethereum_address", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=PendingInstitution)
+@receiver(post_delete, sender=PendingInstitution)
+def invalidate_institution_cache(sender, instance, **kwargs):
+    # approve_institution / revoke_institution save() through here. Only once committed:
+    # before that, a reader could still query the old row and cache it again.
+    addresses = (instance.ethereum_address, getattr(instance, "_previous_address", None))
+
+    def invalidate():
+        for address in addresses:
+            institution_cache.invalidate(address)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_delete, sender=PendingInstitution)
+def expire_institution_listings(sender, instance, **kwargs):
+    # Saves bump updated_at, which the listing ETag already covers; deletes do not
+    transaction.on_commit(record_listing_delete)
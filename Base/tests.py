@@ -1,3 +1,826 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+import threading
+import time
+import warnings
+import zipfile
+from unittest import mock, skipUnless
+import qrcode
+from types import SimpleNamespace
+import asyncio
+from asgiref.sync import async_to_sync, sync_to_async
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.test import AsyncClient, AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from PyPDF2 import PdfReader
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
 
-# Create your tests here.
+from .batch_engine import upload_directory_async, upload_entry_async
+from .batch_jobs import requeue_stale_jobs, run_batch_job
+from .file_serving import parse_range, serve_file
+from .gateway_fetch import fetch_from_gateways, get_gateway_fetcher
+from .views import _streaming_response
+from .bundle_export import merged_pdf_chunks, zip_chunks
+from .http_client import close_async_http_client, get_async_http_client, run_on_own_loop
+from .institution_cache import institution_cache
+from .ipfs_cache import STALE_TMP_SECONDS, CidCache
+from .logo_cache import LogoCache
+from .metrics import render_metrics
+from .listing import ListingError, decode_cursor, encode_cursor, keyset_page
+from .helper import QR_BOX, screen_entries, create_overlay, generate_certificate_pdf_local, merge_overlay, verification_url
+from .pdf_overlay import overlay_first_page
+from .models import BatchJob, BatchJobRow, Certificate, PendingInstitution
+from .ipfs_cid import CHUNK_SIZE, compute_cid, compute_directory_cids
+
+
+try:
+    import pypdfium2
+except ImportError:  # only needed to rasterize pages in tests
+    pypdfium2 = None
+
+
+class ComputeCidTests(SimpleTestCase):
+    # Known CIDs as returned by `ipfs add` / Pinata for the same bytes
+
+    def test_cidv0_known_files(self):
+        self.assertEqual(compute_cid(b""), "QmbFMke1KXqnYyBBWxB74N4c5SBnJMVAiMNRcGu6x1AwQH")
+        self.assertEqual(compute_cid(b"hello world"), "Qmf412jQZiuVUtdgnB36FXFX7xg5V6KEbSJ4dpQuhkLyfD")
+        self.assertEqual(compute_cid(b"hello world\n"), "QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o")
+
+    def test_cidv1_raw_leaves(self):
+        self.assertEqual(compute_cid(b"", 1), "bafkreihdwdcefgh4dqkjv67uzcmw7ojee6xedzdetojuzjevtenxquvyku")
+        self.assertEqual(compute_cid(b"hello world", 1), "bafkreifzjut3te2nhyekklss27nh3k72ysco7y32koao5eei66wof36n5e")
+
+    def test_multi_chunk_fixed_vectors(self):
+        # Not derived from compute_cid: these come from a separate port of go-unixfs's balanced
+        # builder (Layout/fillNodeRec: first leaf a UnixFS File node, later leaves Raw nodes).
+        # To check one against kubo: write the payload to a file and run
+        # `ipfs add --only-hash -Q [--cid-version=1] <file>`.
+        payload = bytes(i % 251 for i in range(4 * CHUNK_SIZE + 1234))
+        self.assertEqual(compute_cid(payload), "Qmaac4LXCSVZSMCnYds2YCXCb7idQm2Yq2cmGEKALKoW6K")
+        self.assertEqual(compute_cid(payload, 1), "bafybeiavpceqlycm7f44pdjn2cc3pze55cquzs3a3ndhgxj5m2ygj4myey")
+        # Three links per node turns the same five chunks into a two-level tree
+        with mock.patch("Base.ipfs_cid.MAX_LINKS", 3):
+            self.assertEqual(compute_cid(payload), "QmXkCpdUP83q8rc6X8QRBC6CEhqi6xKSwJyun5EPKxVe4e")
+            self.assertEqual(compute_cid(payload, 1), "bafybeifv6hsyub2eoyrc2pvoqdvlpxwjjdm64a36tplerrgnwruughnww4")
+
+    def test_rejects_unknown_version(self):
+        with self.assertRaises(ValueError):
+            compute_cid(b"x", 2)
+
+    def test_directory_cids(self):
+        self.assertEqual(compute_directory_cids({}), ("QmUNLLsPACCz1vLxQVkXqqLX5R1X345qqfHbsf67hvA3Nn", {}))
+        files = {"b.json": b"{}", "a.pdf": b"hello world\n"}
+        directory_cid, file_cids = compute_directory_cids(files)
+        self.assertEqual(file_cids, {name: compute_cid(content) for name, content in files.items()})
+        # Links are sorted by name, so insertion order does not matter
+        self.assertEqual(compute_directory_cids(dict(reversed(files.items())))[0], directory_cid)
+        self.assertNotEqual(compute_directory_cids({"c.pdf": b"hello world\n", "b.json": b"{}"})[0], directory_cid)
+
+
+def _pdf(*pages):
+    out = io.BytesIO()
+    pdf = canvas.Canvas(out)
+    for text in pages:
+        pdf.drawString(100, 700, text)
+        pdf.showPage()
+    pdf.save()
+    return out.getvalue()
+
+
+class BundleExportTests(SimpleTestCase):
+
+    def test_zip_chunks(self):
+        files = [("a.pdf", _pdf("a")), ("b.pdf", b"")]
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(zip_chunks(files))))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual([(name, archive.read(name)) for name in archive.namelist()], files)
+
+    def test_merged_pdf_keeps_every_page_in_order(self):
+        merged = PdfReader(io.BytesIO(b"".join(merged_pdf_chunks([_pdf("one", "two"), _pdf("three")]))))
+        self.assertEqual([page.extract_text().strip() for page in merged.pages], ["one", "two", "three"])
+        # The identical font dictionaries of both inputs are written once
+        fonts = {page["/Resources"]["/Font"]["/F1"].indirect_reference.idnum for page in merged.pages}
+        self.assertEqual(len(fonts), 1)
+
+
+def _read_qr_modules(pdf_bytes, x, y, size, count, scale=4):
+    # Rasterize page 1 and sample the centre of every module of the count x count QR at (x, y)
+    image = pypdfium2.PdfDocument(pdf_bytes)[0].render(scale=scale, grayscale=True).to_pil()
+    module = size / count
+    return [
+        [
+            image.getpixel(((x + (col + 0.5) * module) * scale,
+                            (letter[1] - y - size + (row + 0.5) * module) * scale)) < 128
+            for col in range(count)
+        ]
+        for row in range(count)
+    ]
+
+
+@skipUnless(pypdfium2, "pypdfium2 is needed to render the page")
+class QrOverlayTests(SimpleTestCase):
+
+    def test_final_qr_reads_back_as_the_verification_url(self):
+        # The real QR is stamped over the dummy one the batch rendered. No QR decoder is a
+        # dependency, so every module is read back off the rendered page and compared with
+        # the encoding of the URL (a fixed version and mask, so the same check)
+        original = generate_certificate_pdf_local(
+            "Test Student", "Computer Science", "First Class", "Test University", None, None,
+            "2025-01-01", qr_mode="dummy",
+        ).getvalue()
+        cid = "QmUNLLsPACCz1vLxQVkXqqLX5R1X345qqfHbsf67hvA3Nn"
+        final = merge_overlay(original, create_overlay(cid, "R123"))
+
+        qr = qrcode.QRCode()
+        qr.add_data(verification_url(cid, "R123"))
+        qr.make(fit=True)
+        expected = qr.get_matrix()
+        self.assertEqual(_read_qr_modules(final, *QR_BOX, len(expected)), expected)
+
+
+def _page_content(page):
+    # /Contents is one stream or an array of them
+    contents = page["/Contents"]
+    streams = contents if isinstance(contents, list) else [contents]
+    return b"".join(stream.get_object().get_data() for stream in streams)
+
+
+class OverlayFirstPageTests(SimpleTestCase):
+    OVERLAY = b"0 0 1 rg 10 10 20 20 re f"
+
+    def assert_overlaid(self, original, result):
+        reader = PdfReader(io.BytesIO(result))
+        self.assertEqual([page.extract_text().strip() for page in reader.pages], ["one", "two"])
+        # The overlay comes last, after page 1's own content wrapped in q ... Q
+        first = _page_content(reader.pages[0])
+        self.assertTrue(first.startswith(b"q\n"))
+        self.assertTrue(first.endswith(b"Q\n" + self.OVERLAY))
+        self.assertEqual(_page_content(reader.pages[1]),
+                         _page_content(PdfReader(io.BytesIO(original)).pages[1]))
+
+    def test_incremental_update_appends_to_the_original(self):
+        original = _pdf("one", "two")
+        result = overlay_first_page(original, self.OVERLAY)
+        self.assertTrue(result.startswith(original))
+        self.assert_overlaid(original, result)
+
+    def test_rewrites_what_it_cannot_extend(self):
+        # No trailing %%EOF to chain an update from: the whole file is rewritten
+        original = _pdf("one", "two") + b"\n% trailing junk\n"
+        result = overlay_first_page(original, self.OVERLAY)
+        self.assertFalse(result.startswith(original))
+        self.assert_overlaid(original, result)
+
+
+class RequeueStaleJobsTests(TestCase):
+    def setUp(self):
+        self.institution = PendingInstitution.objects.create(
+            name="Test University", email="registry@test.ac", description="", logo="logos/test.png"
+        )
+
+    def _running_job(self, heartbeat_age, reg_numbers):
+        job = BatchJob.objects.create(
+            institution=self.institution, status=BatchJob.RUNNING, total_rows=len(reg_numbers),
+            started_at=timezone.now() - timedelta(hours=1),
+            heartbeat_at=timezone.now() - timedelta(seconds=heartbeat_age),
+        )
+        BatchJobRow.objects.bulk_create(
+            BatchJobRow(job=job, row_index=i, reg_number=reg) for i, reg in enumerate(reg_numbers)
+        )
+        return job
+
+    def test_requeues_only_jobs_whose_heartbeat_went_stale(self):
+        stale = self._running_job(600, ["R1"])
+        live = self._running_job(5, ["R2"])
+
+        self.assertEqual(requeue_stale_jobs(stale_after=300), [stale.id])
+
+        stale.refresh_from_db()
+        live.refresh_from_db()
+        self.assertEqual(stale.status, BatchJob.PENDING)
+        self.assertEqual(live.status, BatchJob.RUNNING)
+
+    def test_rows_saved_before_the_crash_are_not_issued_again(self):
+        job = self._running_job(600, ["R1", "R2"])
+        # The crash came after R1's certificate was saved but before its row was recorded
+        Certificate.objects.create(
+            student_name="A", student_surname="B", student_regNumber="R1", course="C",
+            degree_class="1", metadata_cid="bafymeta", pdf_cid="bafypdf",
+        )
+
+        requeue_stale_jobs(stale_after=300)
+
+        rows = {row.reg_number: row for row in job.rows.all()}
+        self.assertEqual((rows["R1"].status, rows["R1"].cid, rows["R1"].pdf_cid),
+                         (BatchJobRow.SUCCESS, "bafymeta", "bafypdf"))
+        self.assertEqual(rows["R2"].status, BatchJobRow.PENDING)
+        job.refresh_from_db()
+        self.assertEqual(job.done_rows, 1)
+
+
+class BatchJobHeartbeatTests(TransactionTestCase):
+    # The heartbeat writes from its own thread (and connection), so rows must really be committed
+
+    def test_a_job_with_no_finished_rows_keeps_its_heartbeat_fresh(self):
+        institution = PendingInstitution.objects.create(
+            name="Test University", email="registry@test.ac", description="", logo="logos/test.png"
+        )
+        job = BatchJob.objects.create(institution=institution, total_rows=1)
+        requeued = []
+
+        def stuck_in_retries(entries, institution, **kwargs):
+            # No row finishes, so record_row_results never bumps the heartbeat
+            time.sleep(0.5)
+            requeued.extend(requeue_stale_jobs(stale_after=0.3))
+
+        with self.settings(BATCH_JOB_HEARTBEAT_SECONDS=0.05), \
+                mock.patch("Base.batch_jobs.run_batch", stuck_in_retries):
+            run_batch_job(job.id)
+
+        self.assertEqual(requeued, [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, BatchJob.DONE)
+        self.assertFalse(any(t.name == f"batch-job-{job.id}-heartbeat" for t in threading.enumerate()))
+
+
+def _student(reg_number, **fields):
+    row = {"student_name": "Ada", "student_surname": "Lovelace", "reg_number": reg_number,
+           "course": "Mathematics", "degree_class": "First"}
+    row.update(fields)
+    return row
+
+
+class ScreenEntriesTests(TestCase):
+    def _reasons(self, entries):
+        return [entry.get("_rejected") for entry in screen_entries(entries, chunk_size=2)]
+
+    def test_valid_rows_pass(self):
+        self.assertEqual(self._reasons([_student("R1"), _student("R2", email="ada@uni.ac")]), [None, None])
+
+    def test_bad_email_is_rejected(self):
+        self.assertEqual(self._reasons([_student("R1", email="not-an-email")]),
+                         ["invalid email: not-an-email"])
+
+    def test_missing_name_is_rejected(self):
+        self.assertEqual(self._reasons([_student("R1", student_name="  "), _student("", course="")]),
+                         ["missing student_name", "missing reg_number"])
+
+    def test_duplicates_in_the_csv_and_already_issued_are_rejected(self):
+        Certificate.objects.create(student_name="A", student_surname="B", student_regNumber="R9",
+                                   course="C", degree_class="1")
+        # The repeat lands in a later chunk than the row it duplicates
+        reasons = self._reasons([_student("R1"), _student("R2"), _student(" R1 "), _student("R9")])
+        self.assertEqual(reasons, [
+            None, None,
+            "duplicate reg_number in CSV (first on row 1)",
+            "a certificate was already issued for this reg_number",
+        ])
+
+    def test_a_rejected_row_does_not_claim_its_reg_number(self):
+        self.assertEqual(self._reasons([_student("R1", degree_class=""), _student("R1")]),
+                         ["missing degree_class", None])
+
+
+class RegisterInstitutionDuplicateTests(TestCase):
+    def setUp(self):
+        PendingInstitution.objects.create(
+            name="Test University", email="Registry@Test.ac", description="",
+            logo="logos/test.png", ethereum_address="0xAbC0000000000000000000000000000000000001",
+        )
+
+    def _register(self, **fields):
+        data = {"name": "Other College", "email": "office@other.ac", "description": "", "ethereum_address": ""}
+        data.update(fields)
+        return self.client.post(reverse("register-institution-request"), data)
+
+    def test_save_fills_the_normalized_lookups(self):
+        institution = PendingInstitution.objects.get()
+        self.assertEqual(
+            (institution.name_normalized, institution.email_normalized, institution.ethereum_address_normalized),
+            ("test university", "registry@test.ac", "0xabc0000000000000000000000000000000000001"),
+        )
+
+    def test_duplicates_match_regardless_of_case_and_whitespace(self):
+        cases = [
+            ({"name": "  TEST university "}, "name"),
+            ({"email": "REGISTRY@test.AC"}, "email"),
+            ({"ethereum_address": "0xabc0000000000000000000000000000000000001"}, "address"),
+        ]
+        for fields, word in cases:
+            with self.subTest(**fields):
+                response = self._register(**fields)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(word, response.json()["error"])
+        self.assertEqual(PendingInstitution.objects.count(), 1)
+
+    def test_institutions_without_an_address_do_not_clash(self):
+        PendingInstitution.objects.update(ethereum_address=None, ethereum_address_normalized=None)
+        self.assertEqual(self._register().status_code, 201)
+        self.assertEqual(PendingInstitution.objects.filter(ethereum_address_normalized=None).count(), 2)
+
+    def test_missing_or_invalid_fields_are_named_in_the_error(self):
+        cases = [
+            ({"name": "  "}, "name"),
+            ({"email": ""}, "email"),
+            ({"email": "not-an-email"}, "valid email"),
+        ]
+        for fields, word in cases:
+            with self.subTest(**fields):
+                response = self._register(**fields)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(word, response.json()["error"])
+                self.assertNotIn("already", response.json()["error"])
+        self.assertEqual(PendingInstitution.objects.count(), 1)
+
+    def test_blank_emails_are_stored_as_null_and_do_not_clash(self):
+        for name in ("First", "Second"):
+            PendingInstitution.objects.create(name=name, email="", description="", logo="logos/test.png")
+        self.assertEqual(PendingInstitution.objects.filter(email_normalized=None).count(), 2)
+
+
+class InstitutionCacheTests(TestCase):
+    ADDRESS = "0xAbC0000000000000000000000000000000000002"
+
+    def setUp(self):
+        institution_cache.cache.clear()
+        self.institution = PendingInstitution.objects.create(
+            name="Cached University", email="registry@cached.ac", description="",
+            logo="logos/test.png", ethereum_address=self.ADDRESS, approved=True,
+        )
+        self.expected = {"id": self.institution.id, "name": "Cached University"}
+
+    def _revoke(self):
+        self.institution.revoked = True
+        self.institution.save()
+
+    def test_revoke_is_visible_once_committed(self):
+        self.assertEqual(institution_cache.get_by_address(self.ADDRESS.lower()), self.expected)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self._revoke()
+            # Not invalidated before the commit
+            self.assertEqual(institution_cache.get_by_address(self.ADDRESS), self.expected)
+        self.assertEqual(len(callbacks), 1)
+        self.assertIsNone(institution_cache.get_by_address(self.ADDRESS))
+
+    def test_a_reader_racing_the_commit_cannot_cache_the_old_row(self):
+        expected = self.expected
+
+        def read_before_commit(**kwargs):
+            # The reader's query saw the approved row; the revoke commits before it caches it
+            with self.captureOnCommitCallbacks(execute=True):
+                self._revoke()
+            query = mock.Mock()
+            query.values.return_value.first.return_value = expected
+            return query
+
+        with mock.patch("Base.institution_cache.PendingInstitution") as model:
+            model.objects.filter.side_effect = read_before_commit
+            self.assertEqual(institution_cache.get_by_address(self.ADDRESS), expected)
+        self.assertIsNone(institution_cache.get_by_address(self.ADDRESS))
+
+    def test_an_evicted_generation_does_not_revive_old_entries(self):
+        institution_cache.get_by_address(self.ADDRESS)
+        institution_cache.cache.delete(institution_cache.generation_key(self.ADDRESS.lower()))
+        PendingInstitution.objects.filter(id=self.institution.id).update(revoked=True)
+        self.assertIsNone(institution_cache.get_by_address(self.ADDRESS))
+
+
+class InstitutionListingTests(TestCase):
+    def setUp(self):
+        institution_cache.cache.clear()
+        for i in range(5):
+            PendingInstitution.objects.create(
+                name=f"Listed {i}", email=f"listed{i}@uni.ac", description="long text", logo="logos/test.png",
+            )
+        # Three rows share a timestamp, so the id tie-break decides their order
+        stamp = timezone.now() - timedelta(days=1)
+        ids = sorted(PendingInstitution.objects.values_list("id", flat=True))
+        PendingInstitution.objects.filter(id__in=ids[1:4]).update(submitted_at=stamp)
+        self.ordered = list(PendingInstitution.objects.order_by("submitted_at", "id").values_list("id", flat=True))
+
+    def test_keyset_pages_cover_every_row_once_in_order(self):
+        seen, cursor = [], None
+        while True:
+            rows, cursor = keyset_page(PendingInstitution.objects.all(), cursor, limit=2)
+            seen += [row.id for row in rows]
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.ordered)
+
+    def test_last_full_page_has_no_next_cursor(self):
+        rows, cursor = keyset_page(PendingInstitution.objects.all(), limit=5)
+        self.assertEqual(len(rows), 5)
+        self.assertIsNone(cursor)
+
+    def test_cursor_round_trip_and_garbage(self):
+        row = PendingInstitution.objects.get(id=self.ordered[2])
+        self.assertEqual(decode_cursor(encode_cursor(row)), (row.submitted_at, row.id))
+        for cursor in ("not base64!", "bm9waXBl", encode_cursor(row)[:-4] + "AAAA"):
+            with self.subTest(cursor=cursor), self.assertRaises(ListingError):
+                decode_cursor(cursor)
+
+    def test_listing_without_paging_is_a_bare_list(self):
+        response = self.client.get(reverse("institution-requests"))
+        self.assertEqual([row["id"] for row in response.json()], self.ordered)
+        self.assertNotIn("Link", response)
+
+    def test_limit_pages_through_link_headers(self):
+        url, seen = reverse("institution-requests") + "?limit=2&fields=id,name", []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertEqual({key for row in page for key in row}, {"id", "name"})
+            seen += [row["id"] for row in page]
+            link = response.get("Link")
+            url = link[1:link.index(">")] if link else None
+        self.assertEqual(seen, self.ordered)
+
+    def test_bad_paging_arguments_are_rejected(self):
+        for query in ("cursor=garbage", "limit=ten", "fields=id,password"):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(reverse("institution-requests") + "?" + query).status_code, 400)
+
+    def test_etag_changes_on_save_and_delete(self):
+        url = reverse("institution-requests")
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        PendingInstitution.objects.get(id=self.ordered[0]).save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PendingInstitution.objects.get(id=self.ordered[1]).delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=changed["ETag"]).status_code, 200)
+
+
+class CidCacheTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+
+    def _write(self, name, content=b"x", age=0):
+        path = os.path.join(self.root, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        if age:
+            os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    def test_load_removes_only_abandoned_temp_files(self):
+        abandoned = self._write(".tmp-abandoned", age=STALE_TMP_SECONDS + 60)
+        in_flight = self._write(".tmp-in-flight")
+        CidCache(self.root, max_bytes=1024)
+        self.assertFalse(os.path.exists(abandoned))
+        self.assertTrue(os.path.exists(in_flight))
+
+    def test_bound_covers_entries_written_by_other_processes(self):
+        # Two instances on one directory stand in for two processes
+        first = CidCache(self.root, max_bytes=250, rescan_seconds=0)
+        second = CidCache(self.root, max_bytes=250, rescan_seconds=0)
+        for i in range(3):
+            first.put(f"QmFirst{i:04d}", b"a" * 50)
+            second.put(f"QmSecond{i:03d}", b"b" * 50)
+
+        on_disk = sum(entry.stat().st_size for entry in os.scandir(self.root))
+        self.assertLessEqual(on_disk, 250)
+        self.assertTrue(os.path.exists(second.path("QmSecond002")))
+        self.assertEqual(second.stats()["bytes"], on_disk)
+
+
+def _stand_in_gateway(testcase, behaviour):
+    """Start a local HTTP server acting as one IPFS gateway; returns its URL template.
+
+    behaviour is "good" (serves the CID back), "fail" (500), "corrupt" (wrong bytes) or
+    "slow" (answers only once the test ends). Paths it was asked for go in server.hits.
+    """
+    release = threading.Event()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            server.hits.append(self.path)
+            cid = self.path.rsplit("/", 1)[-1]
+            if behaviour == "slow":
+                release.wait(10)
+            status, body = {"fail": (500, b"down"), "corrupt": (200, b"garbage")}.get(
+                behaviour, (200, f"content of {cid}".encode()))
+            try:
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # a cancelled loser has hung up
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.hits = []
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    testcase.addCleanup(server.server_close)
+    testcase.addCleanup(server.shutdown)
+    testcase.addCleanup(release.set)
+    testcase.servers[behaviour] = server
+    return f"http://127.0.0.1:{server.server_port}/ipfs/{{cid}}"
+
+
+class GatewayFetcherTests(SimpleTestCase):
+    CID = "QmStandIn"
+
+    def setUp(self):
+        self.servers = {}
+        self.templates = {b: _stand_in_gateway(self, b) for b in ("good", "fail", "corrupt", "slow")}
+
+    def _fetcher(self, order, hedge=1, hedge_delay=10):
+        # Built from settings the way the app builds it, with a fresh singleton
+        gateways = [self.templates[b] for b in order]
+        patcher = mock.patch("Base.gateway_fetch._fetcher", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with self.settings(IPFS_GATEWAYS=gateways, IPFS_GATEWAY_HEDGE=hedge,
+                           IPFS_GATEWAY_HEDGE_DELAY=hedge_delay, IPFS_GATEWAY_TIMEOUT=5):
+            return get_gateway_fetcher()
+
+    def _ranked(self, fetcher):
+        names = {t: b for b, t in self.templates.items()}
+        return [names[t] for t in fetcher.ranked()]
+
+    def test_a_slow_gateway_is_hedged_after_the_delay_and_cancelled(self):
+        fetcher = self._fetcher(["slow", "good"], hedge_delay=0.05)
+        start = time.perf_counter()
+        self.assertEqual(fetch_from_gateways(self.CID), b"content of QmStandIn")
+        self.assertLess(time.perf_counter() - start, 5)
+        self.assertEqual((len(self.servers["slow"].hits), len(self.servers["good"].hits)), (1, 1))
+        slow = fetcher.health[self.templates["slow"]]
+        self.assertEqual((slow.requests, slow.failures, slow.wins), (1, 0, 0))
+        self.assertEqual(self._ranked(fetcher), ["good", "slow"])
+
+    def test_no_hedge_is_launched_while_the_first_answer_is_quick(self):
+        self._fetcher(["good", "slow"], hedge_delay=5)
+        self.assertEqual(fetch_from_gateways(self.CID), b"content of QmStandIn")
+        self.assertEqual(self.servers["slow"].hits, [])
+
+    def test_a_failing_racer_hands_over_to_the_next_gateway_at_once(self):
+        fetcher = self._fetcher(["fail", "good"])
+        start = time.perf_counter()
+        self.assertEqual(fetch_from_gateways(self.CID), b"content of QmStandIn")
+        self.assertLess(time.perf_counter() - start, 5)  # well inside the 10s hedge delay
+        failed = fetcher.health[self.templates["fail"]]
+        self.assertEqual((failed.requests, failed.failures), (1, 1))
+        self.assertEqual(self._ranked(fetcher), ["good", "fail"])
+
+    def test_losers_are_cancelled_once_one_racer_wins(self):
+        fetcher = self._fetcher(["slow", "good"], hedge=2)
+        start = time.perf_counter()
+        fetch_from_gateways(self.CID)
+        self.assertLess(time.perf_counter() - start, 5)
+        good, slow = (fetcher.health[self.templates[b]] for b in ("good", "slow"))
+        self.assertEqual((good.wins, slow.wins, slow.failures), (1, 0, 0))
+        # A cancelled loser is known to be at least as slow as its current estimate
+        self.assertEqual(slow.latency, 1.0)
+
+    def test_responses_rejected_by_validate_count_as_failures(self):
+        def validate(content):
+            if not content.startswith(b"content of"):
+                raise ValueError("CID mismatch")
+
+        fetcher = self._fetcher(["corrupt", "good"])
+        self.assertEqual(fetch_from_gateways(self.CID, validate), b"content of QmStandIn")
+        self.assertEqual(fetcher.health[self.templates["corrupt"]].failures, 1)
+
+    def test_all_gateways_failing_raises(self):
+        def validate(content):
+            if content == b"garbage":
+                raise ValueError("CID mismatch")
+
+        fetcher = self._fetcher(["fail", "corrupt"], hedge=2)
+        with self.assertRaisesMessage(Exception, "All IPFS gateways failed to retrieve QmStandIn"):
+            fetch_from_gateways(self.CID, validate)
+        self.assertEqual([fetcher.health[self.templates[b]].failures for b in ("fail", "corrupt")], [1, 1])
+
+    def test_ewma_scores_reorder_gateways_across_fetches(self):
+        fetcher = self._fetcher(["fail", "slow", "good"], hedge_delay=0.05)
+        # Untried gateways keep their configured order
+        self.assertEqual(self._ranked(fetcher), ["fail", "slow", "good"])
+        fetch_from_gateways(self.CID)
+        # fail errored, slow was hedged past and cancelled, good answered
+        self.assertEqual(self._ranked(fetcher), ["good", "slow", "fail"])
+        fetch_from_gateways(self.CID)
+        # The second fetch went straight to the best gateway; the others were not asked again
+        self.assertEqual([len(self.servers[b].hits) for b in ("fail", "slow", "good")], [1, 1, 2])
+        stats = fetcher.health_stats()
+        self.assertEqual(stats[f"127.0.0.1:{self.servers['good'].server_port}"]["wins"], 2)
+
+
+class LogoCacheTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "logo.png")
+        self.cache = LogoCache()
+
+    def _upload(self, color, mtime_ns):
+        Image.new("RGB", (40, 40), color).save(self.path)
+        os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def test_a_reuploaded_logo_misses_the_cache(self):
+        self._upload("red", 1_000_000_000)
+        self.cache.get(self.path)
+        self.cache.get(self.path)
+        # Same path, new upload: the stale decoded image must not be drawn
+        self._upload("blue", 2_000_000_000)
+        image = self.cache.get(self.path)
+
+        self.assertEqual(image.getRGBData()[:3], bytes([0, 0, 255]))
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 2, 2))
+
+    def test_counters_are_exported_on_metrics(self):
+        with mock.patch("Base.metrics.logo_cache", self.cache):
+            self._upload("red", 1_000_000_000)
+            self.cache.get(self.path)
+            self.cache.get(self.path)
+            text = render_metrics()
+
+        self.assertIn('certificate_cache_hits_total{cache="logos"} 1', text)
+        self.assertIn('certificate_cache_misses_total{cache="logos"} 1', text)
+        self.assertIn(f'certificate_cache_bytes{{cache="logos"}} {40 * 40 * 3}', text)
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        cases = [
+            ("bytes=0-99", (0, 99)),
+            ("bytes=100-", (100, 999)),  # open-ended
+            ("bytes=-100", (900, 999)),  # suffix: the last 100 bytes
+            ("bytes=-5000", (0, 999)),  # suffix longer than the file
+            ("bytes=990-5000", (990, 999)),  # end past the file is clamped
+            ("bytes=0-9,20-29", None),  # multi-range: the whole body
+            ("items=0-9", None),
+            ("bytes=-", None),
+            (None, None),
+        ]
+        for header, expected in cases:
+            with self.subTest(header=header):
+                self.assertEqual(parse_range(header, 1000), expected)
+
+    def test_unsatisfiable(self):
+        for header, size in (("bytes=1000-", 1000), ("bytes=50-10", 1000), ("bytes=-0", 1000), ("bytes=-10", 0)):
+            with self.subTest(header=header, size=size), self.assertRaises(ValueError):
+                parse_range(header, size)
+
+
+class ServeFileTests(SimpleTestCase):
+    CONTENT = bytes(range(256)) * 4
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "cert.pdf")
+        with open(self.path, "wb") as f:
+            f.write(self.CONTENT)
+        self.factory = RequestFactory()
+
+    def _get(self, **headers):
+        response = serve_file(self.factory.get("/cert.pdf", headers=headers), self.path, "cert.pdf")
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_body_advertises_ranges(self):
+        response, body = self._get()
+        self.assertEqual((response.status_code, body), (200, self.CONTENT))
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+    def test_single_suffix_and_open_ended_ranges(self):
+        for header, start, end in (("bytes=10-19", 10, 19), ("bytes=-24", 1000, 1023), ("bytes=1000-", 1000, 1023)):
+            with self.subTest(header=header):
+                response, body = self._get(Range=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(body, self.CONTENT[start:end + 1])
+                self.assertEqual(response["Content-Range"], f"bytes {start}-{end}/1024")
+                self.assertEqual(response["Content-Length"], str(end - start + 1))
+
+    def test_unsatisfiable_range_is_416(self):
+        response, _ = self._get(Range="bytes=2048-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */1024")
+
+    def test_multi_range_falls_back_to_the_full_body(self):
+        response, body = self._get(Range="bytes=0-9,20-29")
+        self.assertEqual((response.status_code, body), (200, self.CONTENT))
+
+    def test_if_range_with_an_old_etag_sends_everything(self):
+        response, body = self._get(Range="bytes=0-9", **{"If-Range": '"stale"'})
+        self.assertEqual((response.status_code, body), (200, self.CONTENT))
+
+    def test_matching_etag_is_304(self):
+        etag = self._get()[0]["ETag"]
+        self.assertEqual(self._get(**{"If-None-Match": etag})[0].status_code, 304)
+
+
+class BatchSeedingTests(SimpleTestCase):
+    INSTITUTION = SimpleNamespace(name="Seed University")
+
+    def setUp(self):
+        self.entry = dict(_student("R1"), row_id=7)
+
+    @mock.patch("Base.batch_engine.seed_ipfs_cache", side_effect=OSError("disk full"))
+    @mock.patch("Base.batch_engine.upload_metadata_async", return_value="https://gw/ipfs/QmMeta")
+    @mock.patch("Base.batch_engine.upload_pdf_async", return_value="https://gw/ipfs/QmPdf")
+    def test_a_cache_failure_does_not_fail_a_pinned_row(self, *mocks):
+        result = async_to_sync(upload_entry_async)(self.entry, self.INSTITUTION, "2026-01-01", "r1.pdf", b"%PDF")
+        self.assertEqual(result["status"], "success")
+        self.assertEqual((result["cid"], result["pdf_cid"]), ("QmMeta", "QmPdf"))
+
+    def test_a_cache_failure_does_not_fail_a_pinned_directory(self):
+        async def pin_directory_async(name, files):
+            return "QmDir", {filename: compute_cid(content) for filename, content in files.items()}
+
+        backend = SimpleNamespace(url=lambda cid: f"https://gw/ipfs/{cid}", pin_directory_async=pin_directory_async)
+        with mock.patch("Base.batch_engine.get_pinning_backend", return_value=backend), \
+                mock.patch("Base.batch_engine.get_cid_cache", side_effect=OSError("disk full")):
+            results = async_to_sync(upload_directory_async)(
+                [(0, self.entry, "r1.pdf", b"%PDF")], self.INSTITUTION, "2026-01-01"
+            )
+        self.assertEqual([(r["status"], r["directory_cid"]) for r in results], [("success", "QmDir")])
+
+
+class RunOnOwnLoopTests(SimpleTestCase):
+    def test_sync_code_under_a_running_loop_leaves_its_client_open(self):
+        # The ASGI case: a sync view (in a sync_to_async thread) fetches from the gateways
+        async def server():
+            client = get_async_http_client()
+
+            async def fetch():
+                get_async_http_client()
+                return asyncio.get_running_loop()
+
+            try:
+                fetch_loop = await sync_to_async(run_on_own_loop)(fetch)
+                return fetch_loop is asyncio.get_running_loop(), get_async_http_client() is client
+            finally:
+                await close_async_http_client()
+
+        self.assertEqual(async_to_sync(server)(), (False, True))
+
+    def test_errors_reach_the_caller(self):
+        async def fail():
+            raise LookupError("no gateway had it")
+
+        with self.assertRaises(LookupError):
+            run_on_own_loop(fail)
+
+
+class AsgiStreamingTests(TestCase):
+    def test_asgi_requests_get_an_async_iterator_pulled_lazily(self):
+        pulled = []
+
+        def chunks():
+            for i in range(3):
+                pulled.append(i)
+                yield f"{i},"
+
+        response = _streaming_response(AsyncRequestFactory().get("/"), chunks(), "text/csv")
+        self.assertTrue(response.is_async)
+
+        async def first_chunk():
+            async for part in response:
+                return part
+
+        self.assertEqual(async_to_sync(first_chunk)(), b"0,")
+        self.assertEqual(pulled, [0])
+
+    def test_wsgi_requests_keep_the_sync_iterator(self):
+        response = _streaming_response(RequestFactory().get("/"), iter(["a", "b"]), "text/csv")
+        self.assertFalse(response.is_async)
+        self.assertEqual(b"".join(response), b"ab")
+
+    def test_job_results_are_not_buffered_under_asgi(self):
+        institution = PendingInstitution.objects.create(
+            name="Async University", email="registry@async.ac", description="", logo="logos/test.png"
+        )
+        job = BatchJob.objects.create(institution=institution, status=BatchJob.DONE, total_rows=2)
+        BatchJobRow.objects.bulk_create(
+            BatchJobRow(job=job, row_index=i, reg_number=f"R{i}", status=BatchJobRow.SUCCESS, cid=f"QmRow{i}")
+            for i in range(2)
+        )
+
+        async def download():
+            response = await AsyncClient().get(reverse("batch-job-results", args=[job.id]))
+            return response, b"".join([part async for part in response])
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            response, body = async_to_sync(download)()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body.decode().splitlines()[1:], [",,R0,,,QmRow0,success,,", ",,R1,,,QmRow1,success,,"])
+        self.assertFalse([w for w in caught if "synchronous iterators" in str(w.message)])
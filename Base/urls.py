@@ -9,12 +9,17 @@ urlpatterns = [
     path('register-institution-request/', views.register_institution_request, name='register-institution-request'),
     path('institution-requests/', views.institution_requests, name='institution-requests'),
     path('approve-institution/<int:institution_id>/', views.approve_institution),
-    path('approved-institutions/', views.approved_institutions),
+    path('approved-institutions/', views.approved_institutions, name='approved-institutions'),
     path('revoke-institution/<int:institution_id>/', views.revoke_institution, name='revoke-institution'),
     path('get-institution-by-address/', views.get_institution_by_address, name='get-institution-by-address'),
     path('issue-certificate/', views.issue_certificate, name="issue_certificate"),
     path('update-certificate/', views.update_certificate_with_cid),
+    path('certificates/<str:cid>/pdf/', views.finalized_certificate, name='finalized-certificate'),
+    path('ipfs/<str:cid>', views.ipfs_content, name='ipfs-content'),
     path('batch-upload/', views.batch_upload_certificates),
+    path('batch-jobs/<int:job_id>/', views.batch_job_status, name='batch-job-status'),
+    path('batch-jobs/<int:job_id>/results/', views.batch_job_results, name='batch-job-results'),
+    path('batch-jobs/<int:job_id>/export/', views.batch_job_export, name='batch-job-export'),
 ]
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
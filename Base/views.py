@@ -1,6 +1,6 @@
-from django.http import JsonResponse, FileResponse
+from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-import requests
+from django.views.decorators.http import condition
 from .models import PendingInstitution  # Or whatever your model is
 from .serializers import PendingInstitutionSerializer
 from rest_framework.decorators import api_view
@@ -8,58 +8,100 @@ from rest_framework.response import Response
 from rest_framework import status
 from datetime import datetime
 import json
-from .models import PendingInstitution, Certificate
+from .models import PendingInstitution, Certificate, BatchJob, BatchJobRow, normalize_lookup
+from django.db.models import Q
+from django.db import IntegrityError
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
 from django.shortcuts import get_object_or_404
-from django.core.files.storage import default_storage
-from concurrent.futures import ThreadPoolExecutor
-import tempfile, os, json, csv, hashlib
-from django.http import HttpResponse
+from django.urls import reverse
+import os, io, csv
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 import time
 from json import JSONDecodeError
 
-from .helper import generate_certificate_pdf_local, process_single_entry
-from .helper import upload_to_pinata, download_pdf_from_ipfs, merge_overlay, create_overlay
-from .helper import upload_json_to_pinata
+from .helper import generate_certificate_pdf_local, screen_entries
+from .helper import upload_pdf_async
+from .helper import upload_metadata_async, cid_from_url, finalized_pdf_path_async, seed_finalized_pdf
+from .ipfs_cache import CID_PATTERN
+from .file_serving import serve_file
+from .http_client import releases_async_http_client
+from .pinning import LocalBackend, get_pinning_backend
+from .batch_jobs import create_batch_job, enqueue_batch_job, job_progress
+from .batch_engine import stream_batch
+from .bundle_export import batch_certificates, merged_pdf_chunks, zip_chunks
+from .institution_cache import institution_cache
+from .metrics import render_metrics, server_timing, stage
+from .listing import ListingError, keyset_page, parse_fields, parse_page_size, listing_etag, listing_last_modified
 
 @csrf_exempt
 def register_institution_request(request):
     if request.method == 'POST':
-        name = request.POST.get('name')
-        email = request.POST.get('email')
-        description = request.POST.get('description')
+        name = (request.POST.get('name') or '').strip()
+        email = (request.POST.get('email') or '').strip()
+        description = request.POST.get('description') or ''
         eth_address = request.POST.get('ethereum_address')
         logo = request.FILES.get('logo')
 
-        # Check for duplicate request
-        if PendingInstitution.objects.filter(name__iexact=name).exists():
+        if not name:
+            return JsonResponse({"error": "An institution name is required."}, status=400)
+        if not email:
+            return JsonResponse({"error": "An email address is required."}, status=400)
+        try:
+            validate_email(email)
+        except ValidationError:
+            return JsonResponse({"error": "Enter a valid email address."}, status=400)
+
+        # Check for duplicate request - one indexed query covers name, email and address
+        name_key = normalize_lookup(name)
+        email_key = normalize_lookup(email)
+        address_key = normalize_lookup(eth_address)
+        duplicate = Q(name_normalized=name_key) | Q(email_normalized=email_key)
+        if address_key:
+            duplicate |= Q(ethereum_address_normalized=address_key)
+        existing = list(
+            PendingInstitution.objects.filter(duplicate)
+            .values_list("name_normalized", "email_normalized", "ethereum_address_normalized")
+        )
+
+        if any(row[0] == name_key for row in existing):
             return JsonResponse({"error": "An institution with this name has already requested registration."}, status=400)
         
-        if PendingInstitution.objects.filter(email__iexact=email).exists():
+        if any(row[1] == email_key for row in existing):
             return JsonResponse({"error": "This email has already been used to request registration."}, status=400)
 
-        if PendingInstitution.objects.filter(ethereum_address__iexact=eth_address).exists():
+        if address_key and any(row[2] == address_key for row in existing):
             return JsonResponse({"error": "An institution with this address has already requested registration."}, status=400)
         
 
         # Save to model (example assumes you have a model named InstitutionRequest)
-        req = PendingInstitution.objects.create(
-            name=name,
-            email=email,
-            description=description,
-            ethereum_address=eth_address,
-            logo=logo
-        )
+        try:
+            req = PendingInstitution.objects.create(
+                name=name,
+                email=email,
+                description=description,
+                ethereum_address=eth_address,
+                logo=logo
+            )
+        except IntegrityError as e:
+            # Lost a race with an identical request submitted at the same time; anything
+            # else (a NOT NULL column, say) is a bug, not a duplicate
+            if "_normalized" not in str(e):
+                raise
+            return JsonResponse({"error": "This institution has already requested registration."}, status=400)
 
         return JsonResponse({"message": "Request submitted successfully."}, status=201)
     
     return JsonResponse({"error": "Invalid request method."}, status=400)
 
 @csrf_exempt
+@condition(etag_func=listing_etag, last_modified_func=listing_last_modified)
 @api_view(['GET'])
 def institution_requests(request):
     pending = PendingInstitution.objects.filter(approved=False)
-    serializer = PendingInstitutionSerializer(pending, many=True)
-    return Response(serializer.data)
+    return _institution_listing(request, pending)
 
 @csrf_exempt
 @api_view(['POST'])
@@ -73,11 +115,38 @@ def approve_institution(request, institution_id):
         return Response({'error': 'Institution not found'}, status=status.HTTP_404_NOT_FOUND)
 
 @csrf_exempt   
+@condition(etag_func=listing_etag, last_modified_func=listing_last_modified)
 @api_view(['GET'])
 def approved_institutions(request):
     institutions = PendingInstitution.objects.filter(approved=True, revoked=False)
-    serializer = PendingInstitutionSerializer(institutions, many=True)
-    return Response(serializer.data)
+    return _institution_listing(request, institutions)
+
+
+def _institution_listing(request, queryset):
+    # A bare list of every row, as before pagination. ?limit=<n> pages it and puts the next
+    # page's URL (with its ?cursor=) in a Link header; ?fields=id,name,... trims each row.
+    paginate = "limit" in request.GET or "cursor" in request.GET
+    try:
+        fields = parse_fields(request.GET.get("fields"), PendingInstitutionSerializer)
+        if fields is not None:
+            # submitted_at/id are needed for the next cursor even if not returned
+            queryset = queryset.only(*(set(fields) | {"id", "submitted_at"}))
+        if paginate:
+            limit = parse_page_size(request.GET.get("limit"))
+            rows, next_cursor = keyset_page(queryset, request.GET.get("cursor"), limit)
+        else:
+            rows, next_cursor = queryset.order_by("submitted_at", "id"), None
+    except ListingError as e:
+        return Response({"error": str(e)}, status=400)
+
+    serializer = PendingInstitutionSerializer(rows, many=True, fields=fields)
+    response = Response(serializer.data)
+    if next_cursor:
+        query = request.GET.copy()
+        query["cursor"] = next_cursor
+        query["limit"] = limit
+        response["Link"] = f'<{request.build_absolute_uri(request.path)}?{query.urlencode()}>; rel="next"'
+    return response
 
 @csrf_exempt
 @api_view(["POST"])
@@ -97,21 +166,20 @@ def get_institution_by_address(request):
     if not eth_address:
         return Response({"error": "Ethereum address is required"}, status=400)
 
-    try:
-        institution = PendingInstitution.objects.get(
-            ethereum_address__iexact=eth_address,
-            approved=True,
-            revoked=False
-        )
-        return Response({
-            "id": institution.id,
-            "name": institution.name,
-        })
-    except PendingInstitution.DoesNotExist:
+    institution = institution_cache.get_by_address(eth_address)
+    if institution is None:
         return Response({"error": "Institution not found"}, status=404)
 
+    return Response({
+        "id": institution["id"],
+        "name": institution["name"],
+    })
+
 @csrf_exempt
-def issue_certificate(request):
+@releases_async_http_client
+@server_timing
+async def issue_certificate(request):
+    # Async: the Pinata uploads wait on the shared client instead of holding a worker thread
     if request.method != "POST":
         return JsonResponse({"error": "POST required"}, status=400)
 
@@ -129,17 +197,18 @@ def issue_certificate(request):
     date_issued = datetime.now().strftime("%Y-%m-%d")
 
     # 🔍 Fetch institution
-    institution = get_object_or_404(PendingInstitution, id=institution_id)
+    try:
+        institution = await PendingInstitution.objects.aget(id=institution_id)
+    except PendingInstitution.DoesNotExist:
+        raise Http404("No PendingInstitution matches the given query.")
     institution_name = institution.name
     institution_logo_path = institution.logo.path if institution.logo else None
 
-    # 📄 Filename
+    # 📄 Filename (only used as the name of the pinned file)
     filename = f"{name}_{surname}_{course}.pdf".replace(" ", "_")
-    pdf_path = os.path.join(tempfile.gettempdir(), filename)
 
-    # 🧪 Step 1: Generate PDF with dummy QR code (no IPFS CID yet)
-    generate_certificate_pdf_local(
-        pdf_path,
+    # 🧪 Step 1: Generate PDF in memory with dummy QR code (no IPFS CID yet), off the event loop
+    pdf_buffer = await sync_to_async(generate_certificate_pdf_local, thread_sensitive=False)(
         f"{name} {surname}",
         course,
         degree_class,
@@ -151,7 +220,8 @@ def issue_certificate(request):
     )
 
     # ☁️ Step 2: Upload the PDF to IPFS
-    pdf_ipfs_url = upload_to_pinata(pdf_path)
+    pdf_bytes = pdf_buffer.getvalue()
+    pdf_ipfs_url = await upload_pdf_async(pdf_bytes, filename)
 
     # 🧾 Step 3: Create metadata JSON
     metadata = {
@@ -166,101 +236,119 @@ def issue_certificate(request):
     }
 
     # ☁️ Step 4: Upload metadata JSON to IPFS
-    metadata_ipfs_url = upload_json_to_pinata(metadata)
-
-    # 💾 Step 5: Save the certificate to the database (optional)
-    Certificate.objects.create(
-        student_name=name,
-        student_surname=surname,
-        student_regNumber=reg_number,
-        course=course,
-        degree_class=degree_class,
-    )
+    metadata_ipfs_url = await upload_metadata_async(metadata)
+
+    # 🔏 Step 5: Stamp the real QR now; the CIDs are known locally, so nothing is re-downloaded later
+    try:
+        await sync_to_async(seed_finalized_pdf, thread_sensitive=False)(pdf_bytes, pdf_ipfs_url, metadata, metadata_ipfs_url)
+    except Exception as e:
+        # Not fatal: update_certificate_with_cid can still build it from IPFS
+        print(f"❌ Could not pre-build finalized certificate: {e}")
+
+    # 💾 Step 6: Save the certificate to the database (optional)
+    with stage("db-write"):
+        await Certificate.objects.acreate(
+            student_name=name,
+            student_surname=surname,
+            student_regNumber=reg_number,
+            course=course,
+            degree_class=degree_class,
+            metadata_cid=cid_from_url(metadata_ipfs_url),
+            pdf_cid=cid_from_url(pdf_ipfs_url),
+        )
 
     return JsonResponse({
         "message": "Certificate issued",
         "ipfs_url": metadata_ipfs_url,  # This is the CID to store on-chain
         "pdf_url": pdf_ipfs_url,
+        "certificate_url": request.build_absolute_uri(
+            reverse("finalized-certificate", args=[cid_from_url(metadata_ipfs_url)])
+        ),
     })
 
 @csrf_exempt
-def update_certificate_with_cid(request):
+@releases_async_http_client
+@server_timing
+async def update_certificate_with_cid(request):
     if request.method != "POST":
         return JsonResponse({"error": "POST required"}, status=400)
 
-    start_time = time.time()
+    # ──────────────────────────────────────────────────────────
+    # Step 0: Parse incoming JSON
     try:
-        # ──────────────────────────────────────────────────────────
-        # Step 0: Parse incoming JSON
-        try:
-            data = json.loads(request.body)
-        except JSONDecodeError:
-            return JsonResponse({"error": "Request body is not valid JSON"}, status=400)
+        data = json.loads(request.body)
+    except JSONDecodeError:
+        return JsonResponse({"error": "Request body is not valid JSON"}, status=400)
 
-        new_cid = data.get("new_cid")
-        if not new_cid:
-            return JsonResponse({"error": "new_cid is required"}, status=400)
+    new_cid = data.get("new_cid")
+    if not new_cid:
+        return JsonResponse({"error": "new_cid is required"}, status=400)
 
-        print(f"⏳ Received request with CID: {new_cid}")
+    return await _finalized_certificate_response(request, new_cid)
 
-        # ──────────────────────────────────────────────────────────
-        # Step 1: Fetch metadata JSON from IPFS
-        json_url = f"https://gateway.pinata.cloud/ipfs/{new_cid}"
-        meta_res = requests.get(json_url, timeout=15)
 
-        if meta_res.status_code != 200:
-            body_snippet = meta_res.text[:500]
-            print(f"❌ IPFS metadata HTTP {meta_res.status_code}. Body:\n{body_snippet}")
-            raise Exception(f"Failed to fetch metadata JSON (HTTP {meta_res.status_code})")
+@csrf_exempt
+@releases_async_http_client
+@server_timing
+async def finalized_certificate(request, cid):
+    # GET/HEAD twin of update_certificate_with_cid: cacheable, conditional and range-capable
+    if request.method not in ("GET", "HEAD"):
+        return JsonResponse({"error": "GET required"}, status=405)
+    return await _finalized_certificate_response(request, cid)
 
-        try:
-            metadata = meta_res.json()
-        except JSONDecodeError:
-            body_snippet = meta_res.text[:500]
-            print(f"❌ IPFS metadata was not JSON. Body (first 500 chars):\n{body_snippet}")
-            raise Exception("Failed to parse metadata JSON from IPFS")
-
-        print(f"✅ Metadata fetched: {metadata}")
-
-        # ──────────────────────────────────────────────────────────
-        # Step 2: Extract fields from metadata
-        pdf_url = metadata.get("pdf_ipfs_url")
-        reg_number = metadata.get("reg_number")
-        if not pdf_url or not reg_number:
-            raise Exception("Missing 'pdf_ipfs_url' or 'reg_number' in metadata")
-
-        # ──────────────────────────────────────────────────────────
-        # Step 3: Download original PDF from IPFS (try multiple gateways)
-        pdf_cid = pdf_url.split("/")[-1]
-        pdf_path = download_pdf_from_ipfs(pdf_cid)
-        print(f"✅ PDF downloaded to: {pdf_path}")
-
-        # ──────────────────────────────────────────────────────────
-        # Step 4: Create an overlay (canvas) containing QR + reg_number
-        overlay_buffer = create_overlay(new_cid, reg_number)
-        print("✅ Overlay created in memory")
-
-        # ──────────────────────────────────────────────────────────
-        # Step 5: Merge overlay onto page 1 of the original PDF
-        final_pdf_path = merge_overlay(pdf_path, overlay_buffer)
-        print(f"✅ Final merged PDF: {final_pdf_path}")
+
+async def _finalized_certificate_response(request, new_cid):
+    if not CID_PATTERN.match(new_cid):
+        return JsonResponse({"error": "Invalid CID"}, status=400)
+
+    start_time = time.time()
+    print(f"⏳ Received request with CID: {new_cid}")
+    try:
+        # Built once per CID (metadata -> PDF -> QR overlay), then streamed from the cache.
+        # A second attempt covers the file being evicted between lookup and open.
+        for attempt in range(2):
+            try:
+                response = serve_file(request, await finalized_pdf_path_async(new_cid), "updated_certificate.pdf")
+                break
+            except FileNotFoundError:
+                if attempt:
+                    raise
 
         elapsed = time.time() - start_time
         print(f"🚀 Total time: {elapsed:.2f}s")
-
-        # ──────────────────────────────────────────────────────────
-        # Step 6: Return merged PDF as FileResponse
-        return FileResponse(
-            open(final_pdf_path, "rb"),
-            as_attachment=True,
-            filename="updated_certificate.pdf",
-        )
+        return response
 
     except Exception as e:
         elapsed = time.time() - start_time
         print(f"❌ Error in update_certificate_with_cid after {elapsed:.2f}s: {e}")
         return JsonResponse({"error": str(e)}, status=500)
 
+@csrf_exempt
+def ipfs_content(request, cid):
+    # Read side of LocalBackend: plays the part of an IPFS gateway for locally pinned content
+    backend = get_pinning_backend()
+    if request.method not in ("GET", "HEAD"):
+        return JsonResponse({"error": "GET required"}, status=405)
+    if not isinstance(backend, LocalBackend):
+        return JsonResponse({"error": "Not found"}, status=404)
+    try:
+        path = backend.path(cid)
+    except ValueError:
+        return JsonResponse({"error": "Invalid CID"}, status=400)
+    if not os.path.exists(path):
+        return JsonResponse({"error": "Not found"}, status=404)
+
+    with open(path, "rb") as f:
+        is_pdf = f.read(4) == b"%PDF"
+    content_type = "application/pdf" if is_pdf else "application/json"
+    return serve_file(request, path, cid, content_type=content_type, as_attachment=False)
+
+def metrics(request):
+    # Prometheus scrape target: stage timings plus cache, HTTP client and gateway counters
+    if request.method != "GET":
+        return JsonResponse({"error": "GET required"}, status=405)
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 #### mass upload
 @csrf_exempt
 def batch_upload_certificates(request):
@@ -272,33 +360,142 @@ def batch_upload_certificates(request):
 
     csv_file = request.FILES["file"]
     institution_id = request.POST["institution_id"]
-    institution = PendingInstitution.objects.get(id=institution_id)
-
-    decoded_file = csv_file.read().decode("utf-8").splitlines()
-    reader = csv.DictReader(decoded_file)
-    student_data = list(reader)
+    institution = get_object_or_404(PendingInstitution, id=institution_id)
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        results = list(executor.map(lambda entry: process_single_entry(entry, institution), student_data))
+    # Parse the upload incrementally instead of reading and decoding it all at once
+    reader = csv.DictReader(io.TextIOWrapper(csv_file, encoding="utf-8", newline=""))
 
-    # ✅ Prepare downloadable CSV with IPFS CIDs
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="batch_upload_results.csv"'
+    if request.POST.get("stream"):
+        # Process right away and stream each result back as soon as it finishes
+        response = _streaming_response(request, _stream_batch_csv(screen_entries(reader), institution), "text/csv")
+        response['Content-Disposition'] = 'attachment; filename="batch_upload_results.csv"'
+        return response
 
-    writer = csv.writer(response)
-    writer.writerow(["student_name", "student_surname", "reg_number", "course", "degree_class", "ipfs_cid", "status"])
+    # Persist the job and hand it to the background workers; the client polls for progress
+    job = create_batch_job(institution, reader)
+    enqueue_batch_job(job)
 
-    for r in results:
-        entry = next((e for e in student_data if e["reg_number"] == r["reg_number"]), {})
-        writer.writerow([
+    return JsonResponse({
+        "message": "Batch queued",
+        "job_id": job.id,
+        "total_rows": job.total_rows,
+    }, status=202)
+
+async def _pull_async(chunks):
+    # One sync_to_async hop per chunk, thread-sensitive: the request's thread is the one
+    # holding the DB cursor the chunks may be read from
+    chunks = iter(chunks)
+    done = object()
+    try:
+        while True:
+            chunk = await sync_to_async(next)(chunks, done)
+            if chunk is done:
+                return
+            yield chunk
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            await sync_to_async(close)()
+
+def _streaming_response(request, chunks, content_type):
+    # Under ASGI Django buffers a sync iterator whole (sync_to_async(list)) before sending a
+    # byte; an async iterator is sent as it is produced
+    if isinstance(request, ASGIRequest):
+        chunks = _pull_async(chunks)
+    return StreamingHttpResponse(chunks, content_type=content_type)
+
+def _csv_line(values):
+    line = io.StringIO()
+    csv.writer(line).writerow(values)
+    return line.getvalue()
+
+def _stream_batch_csv(reader, institution):
+    # Rows come out in completion order; "row" is the 1-based position in the uploaded CSV
+    # pdf_cid/directory_cid come last so existing consumers keep their column positions
+    yield _csv_line(["row", "student_name", "student_surname", "reg_number", "course", "degree_class", "ipfs_cid", "status",
+                     "pdf_cid", "directory_cid"])
+    for index, entry, result in stream_batch(reader, institution):
+        yield _csv_line([
+            index + 1,
             entry.get("student_name", ""),
             entry.get("student_surname", ""),
             entry.get("reg_number", ""),
             entry.get("course", ""),
             entry.get("degree_class", ""),
-            r.get("cid", ""),
-            r.get("status", "")
+            result.get("cid", ""),
+            result.get("status", ""),
+            result.get("pdf_cid", ""),
+            result.get("directory_cid", ""),
         ])
 
+@csrf_exempt
+def batch_job_status(request, job_id):
+    if request.method != "GET":
+        return JsonResponse({"error": "GET required"}, status=400)
+
+    job = get_object_or_404(BatchJob, id=job_id)
+    return JsonResponse(job_progress(job))
+
+@csrf_exempt
+def batch_job_results(request, job_id):
+    if request.method != "GET":
+        return JsonResponse({"error": "GET required"}, status=400)
+
+    job = get_object_or_404(BatchJob, id=job_id)
+    if job.status not in (BatchJob.DONE, BatchJob.FAILED):
+        return JsonResponse({"error": "Batch job is still running", **job_progress(job)}, status=409)
+
+    # ✅ Stream the downloadable CSV with IPFS CIDs straight from the DB
+    response = _streaming_response(request, _job_results_csv(job), 'text/csv')
+    response['Content-Disposition'] = f'attachment; filename="batch_upload_results_{job.id}.csv"'
     return response
 
+def _job_results_csv(job):
+    yield _csv_line(["student_name", "student_surname", "reg_number", "course", "degree_class", "ipfs_cid", "status",
+                     "pdf_cid", "directory_cid"])
+
+    lines = []
+    for row in job.rows.all().iterator(chunk_size=1000):
+        if len(lines) == 500:
+            # A few hundred rows per chunk, not one: under ASGI each chunk is a thread hop
+            yield "".join(lines)
+            lines = []
+        status_text = row.status if row.status != BatchJobRow.ERROR else f"error: {row.error}"
+        lines.append(_csv_line([
+            row.student_name,
+            row.student_surname,
+            row.reg_number,
+            row.course,
+            row.degree_class,
+            row.cid,
+            status_text,
+            row.pdf_cid,
+            row.directory_cid,
+        ]))
+    if lines:
+        yield "".join(lines)
+
+EXPORT_FORMATS = {
+    "zip": ("application/zip", zip_chunks),
+    "pdf": ("application/pdf", lambda files: merged_pdf_chunks(content for _, content in files)),
+}
+
+def batch_job_export(request, job_id):
+    # Every certificate of a finished job as one download: ?format=zip (one PDF per row) or
+    # ?format=pdf (all pages merged), streamed one certificate at a time
+    if request.method != "GET":
+        return JsonResponse({"error": "GET required"}, status=400)
+
+    export_format = request.GET.get("format", "zip")
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({"error": f"format must be one of: {', '.join(EXPORT_FORMATS)}"}, status=400)
+
+    job = get_object_or_404(BatchJob, id=job_id)
+    if job.status not in (BatchJob.DONE, BatchJob.FAILED):
+        return JsonResponse({"error": "Batch job is still running", **job_progress(job)}, status=409)
+
+    content_type, chunks = EXPORT_FORMATS[export_format]
+    rows = job.rows.filter(status=BatchJobRow.SUCCESS).iterator(chunk_size=1000)
+    response = _streaming_response(request, chunks(batch_certificates(rows)), content_type)
+    response['Content-Disposition'] = f'attachment; filename="batch_certificates_{job.id}.{export_format}"'
+    return response
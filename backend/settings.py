@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 import os
+import tempfile
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -44,6 +45,8 @@ CORS_ALLOWED_ORIGIN_REGEXES = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+# Institution listings put the next page in Link and revalidate with ETag
+CORS_EXPOSE_HEADERS = ["Link", "ETag"]
 
 
 # Application definition
@@ -99,11 +102,28 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.getenv("SQLITE_PATH", BASE_DIR / 'db.sqlite3'),
     }
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+INSTITUTION_CACHE_TTL = int(os.getenv("INSTITUTION_CACHE_TTL", 300))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'institutions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'institutions',
+        'TIMEOUT': INSTITUTION_CACHE_TTL,
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -148,3 +168,52 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 PINATA_JWT = os.getenv("PINATA_JWT")
+PINATA_API_URL = os.getenv("PINATA_API_URL", "https://api.pinata.cloud")
+
+# Where certificates are pinned: "Base.pinning.PinataBackend" or "Base.pinning.LocalBackend"
+# (content-addressed files on disk, served back under /api/ipfs/<cid>)
+PINNING_BACKEND = os.getenv("PINNING_BACKEND", "Base.pinning.PinataBackend")
+LOCAL_PINNING_ROOT = os.getenv("LOCAL_PINNING_ROOT", os.path.join(BASE_DIR, "ipfs_store"))
+LOCAL_PINNING_URL = os.getenv("LOCAL_PINNING_URL", "/api/ipfs")
+
+# Certificate pipeline tuning
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", 10))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 50))
+BATCH_RENDER_WORKERS = int(os.getenv("BATCH_RENDER_WORKERS", os.cpu_count() or 2))
+# "process" renders on all cores; "thread" keeps rendering in-process (one core, but no worker startup)
+BATCH_RENDER_POOL = os.getenv("BATCH_RENDER_POOL", "process")
+# Rendered PDFs waiting for the upload stage; rendering pauses while this many are queued
+BATCH_RENDER_QUEUE_SIZE = int(os.getenv("BATCH_RENDER_QUEUE_SIZE", 100))
+# Rows pinned together as one wrapped directory (one Pinata call per chunk); 0 pins each file separately
+BATCH_PIN_DIRECTORY_SIZE = int(os.getenv("BATCH_PIN_DIRECTORY_SIZE", 0))
+BATCH_JOB_WORKERS = int(os.getenv("BATCH_JOB_WORKERS", 2))
+# A RUNNING job whose heartbeat is this old is treated as orphaned and requeued
+BATCH_JOB_STALE_SECONDS = int(os.getenv("BATCH_JOB_STALE_SECONDS", 900))
+# How often a running job bumps its heartbeat, whether or not rows are finishing; keep well under the above
+BATCH_JOB_HEARTBEAT_SECONDS = float(os.getenv("BATCH_JOB_HEARTBEAT_SECONDS", 60))
+# Requeue orphaned jobs and resume pending ones on the first request each process serves
+BATCH_JOB_RECOVER_ON_START = bool(int(os.getenv("BATCH_JOB_RECOVER_ON_START", 1)))
+BATCH_DB_CHUNK_SIZE = int(os.getenv("BATCH_DB_CHUNK_SIZE", 200))
+BATCH_DB_FLUSH_SECONDS = float(os.getenv("BATCH_DB_FLUSH_SECONDS", 1))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 60))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 3))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", 0.5))
+
+# On-disk cache of IPFS content by CID (metadata JSON and certificate PDFs)
+IPFS_CACHE_DIR = os.getenv("IPFS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "certificate-ipfs-cache"))
+IPFS_CACHE_MAX_BYTES = int(os.getenv("IPFS_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+FINALIZED_PDF_CACHE_DIR = os.getenv(
+    "FINALIZED_PDF_CACHE_DIR", os.path.join(tempfile.gettempdir(), "certificate-final-cache")
+)
+FINALIZED_PDF_CACHE_MAX_BYTES = int(os.getenv("FINALIZED_PDF_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Gateways raced for IPFS downloads; "{cid}" is replaced with the content id
+IPFS_GATEWAYS = os.getenv(
+    "IPFS_GATEWAYS",
+    "https://ipfs.io/ipfs/{cid},https://cloudflare-ipfs.com/ipfs/{cid},"
+    "https://gateway.pinata.cloud/ipfs/{cid},https://{cid}.ipfs.dweb.link",
+).split(",")
+IPFS_GATEWAY_HEDGE = int(os.getenv("IPFS_GATEWAY_HEDGE", 2))
+IPFS_GATEWAY_HEDGE_DELAY = float(os.getenv("IPFS_GATEWAY_HEDGE_DELAY", 1))
+IPFS_GATEWAY_TIMEOUT = float(os.getenv("IPFS_GATEWAY_TIMEOUT", 15))
@@ -16,8 +16,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from Base.views import metrics
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("Base.urls")),
+    path("metrics", metrics, name="metrics"),
 ]
\ No newline at end of file